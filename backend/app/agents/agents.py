@@ -1,4 +1,6 @@
+import httpx
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import BaseMessage
 from loguru import logger
 
 from app.agents.base import BaseAgent
@@ -10,8 +12,10 @@ from app.types import JsonDict
 class DLPFCAgent(BaseAgent):
     """Dorsolateral Prefrontal Cortex Agent - Central Controller"""
 
-    def __init__(self) -> None:
-        super().__init__(model=settings.DLPFC_MODEL)
+    stage = "task_delegation"
+
+    def __init__(self, http_async_client: httpx.AsyncClient | None = None) -> None:
+        super().__init__(model=settings.DLPFC_MODEL, http_async_client=http_async_client)
 
     def _create_prompt(self) -> ChatPromptTemplate:
         template = """You are the Dorsolateral Prefrontal Cortex (DLPFC) Agent, responsible for:
@@ -38,24 +42,18 @@ class DLPFCAgent(BaseAgent):
         return ChatPromptTemplate.from_template(template)
 
     async def process(self, state: AgentState) -> JsonDict:
-        response = await self.llm.ainvoke(
-            self.prompt.format_messages(
-                task=state.task,
-                state=state,
-                previous_response=state.previous_response or "No previous response",
-                feedback=state.feedback or "No feedback provided",
-                feedback_history=state.feedback_history,
-            )
-        )
+        response = await self._invoke_llm(self._format_prompt(state))
 
-        return _process_response(response.content)
+        return _process_response(response)
 
 
 class VMPFCAgent(BaseAgent):
     """Ventromedial Prefrontal Cortex Agent - Emotional Regulation"""
 
-    def __init__(self) -> None:
-        super().__init__(model=settings.VMPFC_MODEL)
+    stage = "emotional_regulation"
+
+    def __init__(self, http_async_client: httpx.AsyncClient | None = None) -> None:
+        super().__init__(model=settings.VMPFC_MODEL, http_async_client=http_async_client)
 
     def _create_prompt(self) -> ChatPromptTemplate:
         template = """You are the VMPFC Agent, responsible for emotional regulation and risk assessment.
@@ -81,8 +79,10 @@ class VMPFCAgent(BaseAgent):
 class OFCAgent(BaseAgent):
     """Orbitofrontal Cortex Agent - Reward Processing"""
 
-    def __init__(self) -> None:
-        super().__init__(model=settings.OFC_MODEL)
+    stage = "reward_processing"
+
+    def __init__(self, http_async_client: httpx.AsyncClient | None = None) -> None:
+        super().__init__(model=settings.OFC_MODEL, http_async_client=http_async_client)
 
     def _create_prompt(self) -> ChatPromptTemplate:
         template = """You are the OFC Agent, responsible for reward-based decision making.
@@ -104,8 +104,10 @@ class OFCAgent(BaseAgent):
 class ACCAgent(BaseAgent):
     """Anterior Cingulate Cortex Agent - Conflict Detection"""
 
-    def __init__(self) -> None:
-        super().__init__(model=settings.ACC_MODEL)
+    stage = "conflict_detection"
+
+    def __init__(self, http_async_client: httpx.AsyncClient | None = None) -> None:
+        super().__init__(model=settings.ACC_MODEL, http_async_client=http_async_client)
 
     def _create_prompt(self) -> ChatPromptTemplate:
         template = """You are the ACC Agent, responsible for detecting and resolving conflicts.
@@ -127,8 +129,10 @@ class ACCAgent(BaseAgent):
 class MPFCAgent(BaseAgent):
     """Medial Prefrontal Cortex Agent - Value-based Decision Making"""
 
-    def __init__(self) -> None:
-        super().__init__(model=settings.MPFC_MODEL)
+    stage = "value_assessment"
+
+    def __init__(self, http_async_client: httpx.AsyncClient | None = None) -> None:
+        super().__init__(model=settings.MPFC_MODEL, http_async_client=http_async_client)
 
     def _create_prompt(self) -> ChatPromptTemplate:
         template = """You are the MPFC Agent, responsible for value-based decision making.
@@ -138,6 +142,7 @@ class MPFCAgent(BaseAgent):
         Previous Response: {previous_response}
         Feedback: {feedback}
         Feedback History: {feedback_history}
+        Outputs From The Other Agents: {stage_outputs}
 
         Assess alignment with goals and values, and make final recommendations.
         """
@@ -147,6 +152,38 @@ class MPFCAgent(BaseAgent):
         return await super().process(state)
 
 
+class SummaryAgent(BaseAgent):
+    """Folds the older feedback of a conversation into a rolling summary"""
+
+    stage = "history_summary"
+
+    def __init__(self, http_async_client: httpx.AsyncClient | None = None) -> None:
+        super().__init__(model=settings.SUMMARY_MODEL, http_async_client=http_async_client)
+
+    def _create_prompt(self) -> ChatPromptTemplate:
+        template = """You summarize the feedback given to the SCANUE-V agents during a conversation.
+
+        Task: {task}
+        Summary So Far: {history_summary}
+        New Feedback:
+        {feedback_history}
+
+        Update the summary with the new feedback. Keep every preference and correction given,
+        drop repetition, and answer with the summary only.
+        """
+        return ChatPromptTemplate.from_template(template)
+
+    def _format_prompt(self, state: AgentState) -> list[BaseMessage]:
+        return self.prompt.format_messages(
+            task=state.task,
+            history_summary=state.history_summary or "No summary yet",
+            feedback_history="\n".join(f"- {entry}" for entry in state.feedback_history or []),
+        )
+
+    async def process(self, state: AgentState) -> JsonDict:
+        return await super().process(state)
+
+
 def _process_response(response: str | list[str | dict]) -> JsonDict:
     def format_line(text: str) -> str | None:
         if text[0].isdigit() or text[0] in ("-", "*", "•"):
@@ -1,27 +1,44 @@
 import asyncio
+import random
 from abc import ABC, abstractmethod
 
+import httpx
 from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, BaseMessage
 from loguru import logger
+from openai import APIConnectionError, InternalServerError, RateLimitError
 from pydantic import SecretStr
 
+from app.agents.deadline import time_remaining
+from app.agents.llm_backends import create_chat_model
+from app.agents.llm_cache import llm_cache
+from app.agents.prompt_state import get_token_estimator, render_prompt_state
+from app.agents.scheduler import llm_scheduler
 from app.core.config import settings
+from app.core.metrics import observe_stage_tokens
+from app.core.tracing import tracer
 from app.models.agents import AgentState
 from app.types import JsonDict
 
+# Errors that are worth another attempt, APITimeoutError is a subclass of APIConnectionError
+_RETRYABLE_ERRORS = (APIConnectionError, InternalServerError, RateLimitError)
+
 
 class BaseAgent(ABC):
     """Base class for all PFC agents in the SCANUE-V system."""
 
-    def __init__(self, model: SecretStr):
-        """Initialize agent with specific model from environment variable."""
-        self.llm = ChatOpenAI(
-            model=model.get_secret_value(),
-            timeout=30.0,
-            max_retries=3,
-            api_key=settings.OPENAI_API_KEY,
-        )
+    stage: str
+
+    def __init__(self, model: SecretStr, http_async_client: httpx.AsyncClient | None = None):
+        """Initialize agent with specific model from environment variable.
+
+        The chat model comes from the backend selected by `LLM_BACKEND`. When
+        `http_async_client` is passed an OpenAI model reuses its pooled connections instead of
+        creating a new HTTP client. Retries are handled by `_call_llm` so they stay inside the
+        request deadline.
+        """
+        self.model = model.get_secret_value()
+        self.llm = create_chat_model(self.model, http_async_client=http_async_client)
         self.prompt = self._create_prompt()
 
     @abstractmethod
@@ -31,7 +48,11 @@ class BaseAgent(ABC):
 
     @abstractmethod
     async def process(self, state: AgentState) -> JsonDict:
-        """Process the current state and return updated state."""
+        """Process the current state and return updated state.
+
+        Cancellation is never turned into an error response, so a cancelled request stops its
+        in-flight LLM call instead of carrying on with the next stage.
+        """
         try:
             result = await self._process_with_timeout(state)
             return result
@@ -39,10 +60,6 @@ class BaseAgent(ABC):
             error_msg = "Request timed out. Please try again."
             logger.debug(f"Error: {error_msg}")
             return {"response": error_msg, "error": True}
-        except asyncio.CancelledError:
-            error_msg = "Operation was cancelled."
-            logger.debug(f"Error: {error_msg}")
-            return {"response": error_msg, "error": True}
         except Exception as e:
             error_msg = f"Error processing request: {str(e)}"
             logger.debug(f"Error: {error_msg}")
@@ -51,20 +68,94 @@ class BaseAgent(ABC):
     async def _process_with_timeout(self, state: AgentState) -> JsonDict:
         """Process with timeout handling."""
         try:
-            response = await self.llm.ainvoke(
-                self.prompt.format_messages(
-                    task=state.task,
-                    state=state,
-                    previous_response=state.previous_response,
-                    feedback=state.feedback,
-                    feedback_history=state.feedback_history,
-                ),
-            )
-            return self._format_response(response.content)
+            response = await self._invoke_llm(self._format_prompt(state))
+            return self._format_response(response)
         except TimeoutError:
             logger.debug("API request timed out")
             raise
 
+    def _format_prompt(self, state: AgentState) -> list[BaseMessage]:
+        """Format the prompt with the state rendered in `PROMPT_STATE_TOKEN_BUDGET` tokens."""
+        return self.prompt.format_messages(**render_prompt_state(state))
+
+    async def _invoke_llm(self, messages: list[BaseMessage]) -> str | list[str | dict]:
+        """Call the LLM, using the response cache if this agent's stage has opted in."""
+        if self.stage not in settings.LLM_CACHE_STAGES:
+            response = await self._call_llm(messages)
+            return response.content
+
+        key = llm_cache.create_key(
+            model=self.model,
+            messages=messages,
+            temperature=getattr(self.llm, "temperature", None),
+            max_tokens=getattr(self.llm, "max_tokens", None),
+        )
+        cached = await llm_cache.get(key, stage=self.stage)
+        if cached is not None:
+            logger.debug(f"LLM cache hit for stage {self.stage}")
+            return cached
+
+        response = await self._call_llm(messages)
+        if isinstance(response.content, str):
+            await llm_cache.set(key, response.content)
+
+        return response.content
+
+    async def _call_llm(self, messages: list[BaseMessage]) -> BaseMessage:
+        """Call the LLM, retrying transient errors with jittered exponential backoff.
+
+        Every attempt waits for capacity in the scheduler. A retry is only attempted if its backoff
+        fits in the time left before the request deadline, otherwise the error is raised straight
+        away.
+        """
+        tokens = self._estimate_tokens(messages)
+        attempt = 0
+        while True:
+            try:
+                async with llm_scheduler.slot(
+                    self.model, tokens=tokens, stage=self.stage
+                ) as limiter:
+                    with tracer.span(
+                        "llm",
+                        attributes={
+                            "llm.model": self.model,
+                            "llm.attempt": attempt,
+                            "workflow.stage": self.stage,
+                        },
+                    ) as span:
+                        response = await self.llm.ainvoke(messages)
+                        if isinstance(response, AIMessage) and response.usage_metadata:
+                            usage = response.usage_metadata
+                            span.set_attribute("llm.input_tokens", usage["input_tokens"])
+                            span.set_attribute("llm.output_tokens", usage["output_tokens"])
+                            limiter.record_usage(estimated=tokens, actual=usage["total_tokens"])
+                            observe_stage_tokens(
+                                self.stage,
+                                input_tokens=usage["input_tokens"],
+                                output_tokens=usage["output_tokens"],
+                            )
+
+                    return response
+            except _RETRYABLE_ERRORS as e:
+                delay = random.uniform(
+                    0, min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2**attempt)
+                )
+                remaining = time_remaining()
+                if attempt >= settings.LLM_MAX_RETRIES or (
+                    remaining is not None and delay >= remaining
+                ):
+                    raise
+
+                logger.debug(f"Retrying {self.stage} LLM call in {delay:.2f}s after error: {e}")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def _estimate_tokens(self, messages: list[BaseMessage]) -> int:
+        """Token count of the prompt by `PROMPT_TOKEN_ESTIMATOR`, plus the completion."""
+        estimate = get_token_estimator()
+        prompt_tokens = sum(estimate(str(message.content)) for message in messages)
+        return prompt_tokens + settings.MAX_TOKENS
+
     def _format_response(self, response: str | list[str | dict]) -> JsonDict:
         """Format the response from the LLM."""
         return {"response": response, "error": False}
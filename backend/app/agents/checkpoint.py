@@ -0,0 +1,240 @@
+from collections.abc import AsyncIterator, Sequence
+from typing import Any, Final
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.types import TASKS
+from langgraph.graph.state import CompiledStateGraph
+from loguru import logger
+from valkey.asyncio import Valkey
+
+from app.agents.history import summarize_history
+from app.core.cache import cache
+from app.core.config import settings
+from app.models.agents import AgentState
+from app.types import JsonDict
+
+_KEY_PREFIX: Final = "workflow-checkpoint"
+
+
+class ValkeyCheckpointSaver(BaseCheckpointSaver[int]):
+    """Saves the workflow's checkpoints in Valkey so a failed run can resume where it stopped.
+
+    Only the latest checkpoint of each run is kept, with the writes of the stages that finished
+    since, which is all that resuming needs. Every key expires `WORKFLOW_CHECKPOINT_TTL` seconds
+    after the run last saved a checkpoint, and is deleted as soon as the run finishes. Errors
+    talking to Valkey are logged and the run carries on without the checkpoint, so a retry only
+    resumes from the checkpoints that were saved.
+    """
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        run_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        try:
+            key = _checkpoint_key(run_id)
+            saved = await self._client().hget(key, checkpoint_ns)  # type: ignore[misc]
+            saved_writes = await self._client().hgetall(_writes_key(run_id))  # type: ignore[misc]
+        except Exception as e:
+            logger.error(f"Error reading the checkpoint of workflow run {run_id}: {e}")
+            return None
+
+        if saved is None:
+            return None
+
+        checkpoint: Checkpoint
+        checkpoint_id, parent_id, checkpoint, metadata = self._load(saved)
+        if (requested_id := get_checkpoint_id(config)) and requested_id != checkpoint_id:
+            return None
+
+        writes = [
+            self._load(value)
+            for field, value in sorted(saved_writes.items())
+            if field.decode().startswith(f"{checkpoint_ns}:")
+        ]
+        pending_writes = [
+            (task_id, channel, value)
+            for write_checkpoint_id, task_id, channel, value in writes
+            if write_checkpoint_id == checkpoint_id
+        ]
+        pending_sends = [
+            value
+            for write_checkpoint_id, _, channel, value in writes
+            if write_checkpoint_id == parent_id and channel == TASKS
+        ]
+
+        checkpoint["pending_sends"] = pending_sends
+
+        return CheckpointTuple(
+            config=_config(run_id, checkpoint_ns, checkpoint_id),
+            checkpoint=checkpoint,
+            metadata=metadata,
+            parent_config=_config(run_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=pending_writes,
+        )
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None:
+            return
+
+        checkpoint = await self.aget_tuple(config)
+        if checkpoint is not None and (limit is None or limit > 0):
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        run_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = {key: value for key, value in checkpoint.items() if key != "pending_sends"}
+        value = self._dump(
+            (
+                checkpoint["id"],
+                config["configurable"].get("checkpoint_id"),
+                saved,
+                get_checkpoint_metadata(config, metadata),
+            )
+        )
+
+        try:
+            async with self._client().pipeline(transaction=True) as pipeline:
+                key = _checkpoint_key(run_id)
+                pipeline.hset(key, checkpoint_ns, value)  # type: ignore[arg-type]
+                pipeline.expire(key, settings.WORKFLOW_CHECKPOINT_TTL)
+                pipeline.expire(_writes_key(run_id), settings.WORKFLOW_CHECKPOINT_TTL)
+                await pipeline.execute()
+        except Exception as e:
+            logger.error(f"Error saving a checkpoint of workflow run {run_id}: {e}")
+
+        return _config(run_id, checkpoint_ns, checkpoint["id"])
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        run_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        try:
+            async with self._client().pipeline(transaction=True) as pipeline:
+                for index, (channel, value) in enumerate(writes):
+                    index = WRITES_IDX_MAP.get(channel, index)
+                    field = f"{checkpoint_ns}:{checkpoint_id}:{task_id}:{index:08}"
+                    write = self._dump((checkpoint_id, task_id, channel, value))
+                    # Special writes, like errors, replace the last one, others are written once
+                    if index < 0:
+                        pipeline.hset(_writes_key(run_id), field, write)  # type: ignore[arg-type]
+                    else:
+                        pipeline.hsetnx(_writes_key(run_id), field, write)  # type: ignore[arg-type]
+                pipeline.expire(_writes_key(run_id), settings.WORKFLOW_CHECKPOINT_TTL)
+                await pipeline.execute()
+        except Exception as e:
+            logger.error(f"Error saving the writes of workflow run {run_id}: {e}")
+
+    async def delete_run(self, run_id: str) -> None:
+        keys = (_checkpoint_key(run_id), _writes_key(run_id))
+        await self._client().delete(*keys)  # type: ignore[misc]
+
+    def _client(self) -> Valkey:
+        if cache.client is None:
+            raise RuntimeError("The cache client was not created")
+
+        return cache.client
+
+    def _dump(self, value: Any) -> bytes:
+        type_, data = self.serde.dumps_typed(value)
+        return type_.encode() + b":" + data
+
+    def _load(self, value: bytes) -> Any:
+        type_, _, data = value.partition(b":")
+        return self.serde.loads_typed((type_.decode(), data))
+
+
+checkpointer = ValkeyCheckpointSaver()
+
+
+def run_config(run_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": run_id}}
+
+
+async def resume_or_start(
+    workflow: CompiledStateGraph, *, state: AgentState, config: RunnableConfig
+) -> JsonDict | None:
+    """The input to run the workflow for `state`.
+
+    None if an earlier attempt at the run in `config` failed part way, so the run resumes from the
+    first stage that didn't finish and the stages that did aren't run again. A new run starts from
+    `state` with its feedback history summarized, so a retry reuses the summary saved with the
+    run's checkpoints rather than making another.
+    """
+    if workflow.checkpointer is not None:
+        snapshot = await workflow.aget_state(config)
+        if snapshot.next:
+            logger.debug(f"Resuming workflow run at {', '.join(snapshot.next)}")
+            return None
+
+    return (await summarize_history(state)).model_dump()
+
+
+async def finish_run(workflow: CompiledStateGraph, *, run_id: str) -> None:
+    if workflow.checkpointer is None:
+        return None
+
+    try:
+        await checkpointer.delete_run(run_id)
+    except Exception as e:
+        logger.error(f"An error occurred while deleting the checkpoints of run {run_id}: {e}")
+
+
+async def invoke_workflow(
+    workflow: CompiledStateGraph, *, state: AgentState, run_id: str
+) -> JsonDict:
+    """Run the workflow for `state` as run `run_id`, resuming the run if it failed before."""
+    config = run_config(run_id)
+    result = await workflow.ainvoke(
+        await resume_or_start(workflow, state=state, config=config), config
+    )
+    await finish_run(workflow, run_id=run_id)
+
+    return result
+
+
+def _checkpoint_key(run_id: str) -> str:
+    return f"{_KEY_PREFIX}:{run_id}"
+
+
+def _writes_key(run_id: str) -> str:
+    return f"{_KEY_PREFIX}:{run_id}:writes"
+
+
+def _config(run_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {
+        "configurable": {
+            "thread_id": run_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
@@ -0,0 +1,54 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.core.config import settings
+from app.exceptions import DeadlineExceededError
+
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def request_deadline(timeout: float) -> Iterator[float]:
+    """Set a deadline `timeout` seconds from now for everything run in this context.
+
+    Tasks created inside the block inherit the deadline. A nested deadline can only shorten the
+    one that is already set.
+    """
+    deadline = time.monotonic() + timeout
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def time_remaining() -> float | None:
+    """Seconds left before the current deadline, or None if no deadline is set."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+
+    return deadline - time.monotonic()
+
+
+def deadline_exceeded() -> bool:
+    remaining = time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def stage_timeout() -> float:
+    """The timeout for the next agent stage, capped by the time left before the deadline."""
+    remaining = time_remaining()
+    if remaining is None:
+        return settings.AGENT_TIMEOUT
+
+    if remaining <= 0:
+        raise DeadlineExceededError("The request deadline has passed")
+
+    return min(settings.AGENT_TIMEOUT, remaining)
@@ -0,0 +1,37 @@
+from loguru import logger
+
+from app.agents.agents import SummaryAgent
+from app.agents.prompt_state import get_token_estimator
+from app.agents.registry import agent_registry
+from app.core.config import settings
+from app.core.tracing import tracer
+from app.models.agents import AgentState
+
+
+async def summarize_history(state: AgentState) -> AgentState:
+    """Fold the older feedback history into the rolling `history_summary`.
+
+    Nothing is done until the history passes `HISTORY_SUMMARY_THRESHOLD` tokens. Every entry but
+    the newest `HISTORY_SUMMARY_KEEP_ENTRIES` is then merged into the summary, which is saved with
+    the agent state, so it is made at most once a turn and every stage's prompt reuses it. If the
+    summary can't be made the history is left as it is.
+    """
+    history = state.feedback_history or []
+    split = max(0, len(history) - settings.HISTORY_SUMMARY_KEEP_ENTRIES)
+    estimate = get_token_estimator()
+    if split == 0 or sum(map(estimate, history)) <= settings.HISTORY_SUMMARY_THRESHOLD:
+        return state
+
+    folded, kept = history[:split], history[split:]
+    agent = agent_registry.get_agent(SummaryAgent.stage)
+    with tracer.span("history_summary", attributes={"history.entries": len(folded)}):
+        result = await agent.process(state.model_copy(update={"feedback_history": folded}))
+
+    if result.get("error"):
+        logger.error(f"Error summarizing the feedback history: {result['response']}")
+        return state
+
+    logger.debug(f"Summarized {len(folded)} feedback history entries")
+    return state.model_copy(
+        update={"history_summary": str(result["response"]), "feedback_history": kept}
+    )
@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+from collections.abc import AsyncIterator, Iterator
+from functools import cache
+from pathlib import Path
+from typing import Any, Final, Literal
+
+import httpx
+import orjson
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+from pydantic import PrivateAttr
+
+from app.core.config import settings
+from app.exceptions import CassetteMissError
+
+# Follows the layout `_process_response` parses so every agent can use the fake backend
+FAKE_RESPONSE: Final = """Subtasks:
+1. Clarify the goal and the constraints of the task
+2. Identify the options that are available
+3. Weigh the risks and benefits of each option
+Agent Assignments:
+1. VMPFC assesses the emotional and risk factors
+2. OFC evaluates the expected rewards
+3. ACC checks for conflicts between the options
+Integration Plan:
+1. MPFC combines the assessments into a single recommendation"""
+
+_TOKEN: Final = re.compile(r"\S+\s*")
+
+
+def create_chat_model(
+    model: str, *, http_async_client: httpx.AsyncClient | None = None
+) -> BaseChatModel:
+    """Create the chat model for `model` from the backend selected by `LLM_BACKEND`."""
+    if settings.LLM_BACKEND == "fake":
+        return FakeChatModel(
+            model_name=model,
+            latency_distribution=settings.FAKE_LLM_LATENCY_DISTRIBUTION,
+            latency_mean=settings.FAKE_LLM_LATENCY_MEAN,
+            latency_spread=settings.FAKE_LLM_LATENCY_SPREAD,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            seed=settings.FAKE_LLM_SEED,
+        )
+
+    if settings.LLM_BACKEND == "replay":
+        return CassetteChatModel(model_name=model, cassette_path=settings.LLM_CASSETTE_PATH)
+
+    llm = ChatOpenAI(
+        model=model,
+        timeout=settings.AGENT_TIMEOUT,
+        max_retries=0,
+        api_key=settings.OPENAI_API_KEY,
+        http_async_client=http_async_client,
+    )
+    if settings.LLM_BACKEND == "record":
+        return CassetteChatModel(
+            model_name=model, cassette_path=settings.LLM_CASSETTE_PATH, recorder=llm
+        )
+
+    return llm
+
+
+class FakeChatModel(BaseChatModel):
+    """Offline chat model that answers with canned text after a simulated delay.
+
+    The time to the first token is drawn from `latency_distribution`, with `latency_spread` being
+    the half width of a uniform distribution or the sigma of a lognormal one. The response is then
+    produced one word per token at `tokens_per_second`.
+    """
+
+    model_name: str = "fake"
+    response: str = FAKE_RESPONSE
+    latency_distribution: Literal["constant", "uniform", "lognormal"] = "lognormal"
+    latency_mean: float = 0.5
+    latency_spread: float = 0.5
+    tokens_per_second: float = 50.0
+    seed: int | None = None
+
+    _random: random.Random = PrivateAttr(default_factory=random.Random)
+
+    def model_post_init(self, context: Any) -> None:
+        self._random.seed(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self._latency() + self._generation_time())
+        return self._create_result(messages)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self._latency() + self._generation_time())
+        return self._create_result(messages)
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._latency())
+        for token in _TOKEN.findall(self.response):
+            time.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._usage(messages))
+        )
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._latency())
+        for token in _TOKEN.findall(self.response):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(content="", usage_metadata=self._usage(messages))
+        )
+
+    def _latency(self) -> float:
+        if self.latency_distribution == "constant":
+            return self.latency_mean
+
+        if self.latency_distribution == "uniform":
+            return max(
+                0.0,
+                self._random.uniform(
+                    self.latency_mean - self.latency_spread, self.latency_mean + self.latency_spread
+                ),
+            )
+
+        if self.latency_mean <= 0:
+            return 0.0
+
+        # Pick mu so the distribution's mean is latency_mean
+        mu = math.log(self.latency_mean) - self.latency_spread**2 / 2
+        return self._random.lognormvariate(mu, self.latency_spread)
+
+    def _generation_time(self) -> float:
+        return len(_TOKEN.findall(self.response)) / self.tokens_per_second
+
+    def _create_result(self, messages: list[BaseMessage]) -> ChatResult:
+        message = AIMessage(content=self.response, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _usage(self, messages: list[BaseMessage]) -> UsageMetadata:
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(_TOKEN.findall(self.response))
+        return UsageMetadata(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens,
+        )
+
+
+class Cassette:
+    """LLM responses recorded to a JSON lines file, keyed by the model and prompt."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._responses: dict[str, str] | None = None
+
+    def get(self, key: str) -> str | None:
+        return self._load().get(key)
+
+    def add(self, key: str, *, model: str, response: str) -> None:
+        self._write(key, model=model, response=response)
+        self._load()[key] = response
+
+    async def aadd(self, key: str, *, model: str, response: str) -> None:
+        await asyncio.to_thread(self._write, key, model=model, response=response)
+        self._load()[key] = response
+
+    @staticmethod
+    def create_key(model: str, messages: list[BaseMessage]) -> str:
+        rendered = [(message.type, message.content) for message in messages]
+        return hashlib.sha256(orjson.dumps([model, rendered])).hexdigest()
+
+    def _write(self, key: str, *, model: str, response: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("ab") as f:
+            f.write(orjson.dumps({"key": key, "model": model, "response": response}) + b"\n")
+
+    def _load(self) -> dict[str, str]:
+        if self._responses is None:
+            self._responses = {}
+            if self.path.exists():
+                with self.path.open("rb") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = orjson.loads(line)
+                            self._responses[entry["key"]] = entry["response"]
+
+        return self._responses
+
+
+@cache
+def get_cassette(path: Path) -> Cassette:
+    return Cassette(path)
+
+
+class CassetteChatModel(BaseChatModel):
+    """Serves responses from a cassette.
+
+    Without a `recorder` a prompt that was never recorded raises `CassetteMissError`. With one,
+    the prompt is sent to the recorder and its response saved to the cassette.
+    """
+
+    model_name: str
+    cassette_path: Path
+    recorder: BaseChatModel | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-chat"
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cassette = get_cassette(self.cassette_path)
+        key = cassette.create_key(self.model_name, messages)
+        response = cassette.get(key)
+        if response is None:
+            response = self._record(cassette, key, self._recorder().invoke(messages))
+
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cassette = get_cassette(self.cassette_path)
+        key = cassette.create_key(self.model_name, messages)
+        response = cassette.get(key)
+        if response is None:
+            message = await self._recorder().ainvoke(messages)
+            response = self._text(message)
+            await cassette.aadd(key, model=self.model_name, response=response)
+
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+    def _recorder(self) -> BaseChatModel:
+        if self.recorder is None:
+            raise CassetteMissError(
+                f"No response recorded for {self.model_name} in {self.cassette_path}"
+            )
+
+        return self.recorder
+
+    def _record(self, cassette: Cassette, key: str, message: BaseMessage) -> str:
+        response = self._text(message)
+        cassette.add(key, model=self.model_name, response=response)
+        return response
+
+    @staticmethod
+    def _text(message: BaseMessage) -> str:
+        if not isinstance(message.content, str):
+            raise ValueError("Only text responses can be recorded")
+
+        return message.content
@@ -0,0 +1,86 @@
+import hashlib
+import time
+from collections import Counter
+from collections.abc import Sequence
+
+import orjson
+from langchain_core.messages import BaseMessage
+from loguru import logger
+
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.metrics import observe_llm_cache_lookup
+
+_KEY_PREFIX = "llm-cache"
+_INDEX_KEY = f"{_KEY_PREFIX}:index"
+
+
+class LLMCache:
+    """Exact-match cache of LLM responses, stored in Valkey.
+
+    Entries expire after `LLM_CACHE_TTL` seconds and the oldest entries are evicted once there
+    are more than `LLM_CACHE_MAX_ENTRIES`. Errors talking to Valkey are logged and treated as a
+    miss so the cache can never fail an agent call.
+    """
+
+    def __init__(self) -> None:
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+
+    def create_key(
+        self,
+        *,
+        model: str,
+        messages: Sequence[BaseMessage],
+        temperature: float | None,
+        max_tokens: int | None,
+    ) -> str:
+        rendered = [(message.type, message.content) for message in messages]
+        digest = hashlib.sha256(orjson.dumps([model, rendered, temperature, max_tokens]))
+        return f"{_KEY_PREFIX}:{digest.hexdigest()}"
+
+    async def get(self, key: str, *, stage: str) -> str | None:
+        response = None
+        if cache.client is not None:
+            try:
+                response = await cache.client.get(key)  # type: ignore[misc]
+            except Exception as e:
+                logger.error(f"Error reading from the LLM cache: {e}")
+
+        observe_llm_cache_lookup(stage, hit=response is not None)
+        if response is None:
+            self.misses[stage] += 1
+            return None
+
+        self.hits[stage] += 1
+        return response.decode() if isinstance(response, bytes) else response
+
+    async def set(self, key: str, response: str) -> None:
+        if cache.client is None:
+            return None
+
+        now = time.time()
+        try:
+            async with cache.client.pipeline(transaction=False) as pipe:
+                pipe.set(key, response, ex=settings.LLM_CACHE_TTL)
+                pipe.zadd(_INDEX_KEY, {key: now})
+                pipe.zremrangebyscore(_INDEX_KEY, "-inf", now - settings.LLM_CACHE_TTL)
+                pipe.zcard(_INDEX_KEY)
+                *_, size = await pipe.execute()
+
+            if size > settings.LLM_CACHE_MAX_ENTRIES:
+                evicted = await cache.client.zpopmin(  # type: ignore[misc]
+                    _INDEX_KEY, size - settings.LLM_CACHE_MAX_ENTRIES
+                )
+                await cache.client.delete(*(evicted_key for evicted_key, _ in evicted))
+        except Exception as e:
+            logger.error(f"Error writing to the LLM cache: {e}")
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {
+            stage: {"hits": self.hits[stage], "misses": self.misses[stage]}
+            for stage in self.hits.keys() | self.misses.keys()
+        }
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,140 @@
+from collections.abc import Callable
+from functools import cache
+from typing import Final
+
+from app.core.config import settings
+from app.models.agents import AgentState
+
+type TokenEstimator = Callable[[str], int]
+
+_TRUNCATED: Final = " [truncated]"
+
+
+def estimate_by_characters(text: str) -> int:
+    """About 4 characters a token, close enough for English text and free to compute."""
+    return (len(text) + 3) // 4
+
+
+@cache
+def _tiktoken_encoding():  # type: ignore[no-untyped-def]
+    import tiktoken
+
+    return tiktoken.get_encoding("o200k_base")
+
+
+def estimate_with_tiktoken(text: str) -> int:
+    """Exact count for the OpenAI models' tokenizer, at the cost of tokenizing the prompt."""
+    return len(_tiktoken_encoding().encode(text, disallowed_special=()))
+
+
+TOKEN_ESTIMATORS: Final[dict[str, TokenEstimator]] = {
+    "characters": estimate_by_characters,
+    "tiktoken": estimate_with_tiktoken,
+}
+
+
+def get_token_estimator() -> TokenEstimator:
+    return TOKEN_ESTIMATORS[settings.PROMPT_TOKEN_ESTIMATOR]
+
+
+def render_prompt_state(
+    state: AgentState, *, budget: int | None = None, estimate: TokenEstimator | None = None
+) -> dict[str, str]:
+    """Render the state as the variables of an agent prompt, in about `budget` tokens.
+
+    `state` only holds what isn't given as its own variable. The feedback history starts with the
+    summary of the older feedback and keeps as many of the newest entries as fit, and if the other
+    variables are still over budget each is truncated in proportion to its size. The task is never
+    truncated.
+    """
+    budget = budget if budget is not None else settings.PROMPT_STATE_TOKEN_BUDGET
+    estimate = estimate or get_token_estimator()
+
+    variables = {
+        "state": _render_state(state),
+        "previous_response": state.previous_response or "No previous response",
+        "feedback": state.feedback or "No feedback provided",
+        "stage_outputs": _render_stage_outputs(state.stage_outputs) or "No stage outputs",
+    }
+    sizes = {name: estimate(value) for name, value in variables.items()}
+    total = sum(sizes.values())
+
+    # The history gets what the other variables leave, but always at least a quarter
+    feedback_history, history_size = _fit_history(
+        state.feedback_history or [],
+        summary=state.history_summary,
+        budget=max(budget - total, budget // 4),
+        estimate=estimate,
+    )
+
+    available = budget - history_size
+    if total > available:
+        for name, size in sizes.items():
+            variables[name] = _truncate(
+                variables[name], size=size, allowed=available * size // total
+            )
+
+    return {"task": state.task, **variables, "feedback_history": feedback_history}
+
+
+def _render_state(state: AgentState) -> str:
+    lines = [f"Stage: {state.stage}"]
+    if state.subtasks:
+        lines.append(f"Subtasks: {'; '.join(state.subtasks)}")
+    # After a turn the response is kept as the previous response too
+    if state.response and state.response != state.previous_response:
+        lines.append(f"Latest Response: {state.response}")
+    if state.scanaq_results:
+        lines.append(f"SCANAQ Results: {state.scanaq_results}")
+    if state.failed_stages:
+        lines.append(f"Failed Stages: {', '.join(state.failed_stages)}")
+
+    return "\n".join(lines)
+
+
+def _render_stage_outputs(stage_outputs: dict[str, str] | None) -> str:
+    if not stage_outputs:
+        return ""
+
+    return "\n".join(f"{stage}: {output}" for stage, output in stage_outputs.items())
+
+
+def _fit_history(
+    entries: list[str], *, summary: str | None, budget: int, estimate: TokenEstimator
+) -> tuple[str, int]:
+    header: list[str] = []
+    used = 0
+    if summary:
+        # The summary gets at most half of the budget so there's room for the newest entries
+        summary = f"Summary of earlier feedback: {summary}"
+        size = estimate(summary)
+        header.append(_truncate(summary, size=size, allowed=budget // 2))
+        used = min(size, budget // 2)
+
+    kept: list[str] = []
+    for entry in reversed(entries):
+        size = estimate(entry) + 1
+        if used + size > budget:
+            if not kept:
+                # Keep some of the newest entry, however long it is
+                kept.append(_truncate(entry, size=size, allowed=budget - used))
+                used = budget
+            break
+
+        kept.append(entry)
+        used += size
+
+    if not kept and not header:
+        return "No feedback history", 0
+
+    if omitted := len(entries) - len(kept):
+        header.append(f"({omitted} earlier entries omitted)")
+
+    return "\n".join(header + [f"- {entry}" for entry in reversed(kept)]), used
+
+
+def _truncate(text: str, *, size: int, allowed: int) -> str:
+    if size <= allowed:
+        return text
+
+    return text[: max(0, len(text) * allowed // size - len(_TRUNCATED))].rstrip() + _TRUNCATED
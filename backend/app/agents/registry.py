@@ -0,0 +1,87 @@
+from typing import Final
+
+import httpx
+from loguru import logger
+
+from app.agents.agents import (
+    ACCAgent,
+    DLPFCAgent,
+    MPFCAgent,
+    OFCAgent,
+    SummaryAgent,
+    VMPFCAgent,
+)
+from app.agents.base import BaseAgent
+from app.core.config import settings
+from app.core.tracing import inject_traceparent
+
+type AgentClass = (
+    type[DLPFCAgent]
+    | type[VMPFCAgent]
+    | type[OFCAgent]
+    | type[ACCAgent]
+    | type[MPFCAgent]
+    | type[SummaryAgent]
+)
+
+# Maps each workflow stage, and the history summary run before them, to the agent that handles it
+# and the setting holding its model name.
+STAGE_AGENTS: Final[dict[str, tuple[AgentClass, str]]] = {
+    "task_delegation": (DLPFCAgent, "DLPFC_MODEL"),
+    "emotional_regulation": (VMPFCAgent, "VMPFC_MODEL"),
+    "reward_processing": (OFCAgent, "OFC_MODEL"),
+    "conflict_detection": (ACCAgent, "ACC_MODEL"),
+    "value_assessment": (MPFCAgent, "MPFC_MODEL"),
+    "history_summary": (SummaryAgent, "SUMMARY_MODEL"),
+}
+
+
+class AgentRegistry:
+    """Holds one long-lived agent per workflow stage and model.
+
+    All agents share a single pooled HTTP client so connections to the LLM provider are kept alive
+    and reused between requests instead of being set up for every call.
+    """
+
+    def __init__(self) -> None:
+        self._http_client: httpx.AsyncClient | None = None
+        self._agents: dict[tuple[str, str], BaseAgent] = {}
+
+    async def create_agents(self) -> None:
+        for stage in STAGE_AGENTS:
+            self.get_agent(stage)
+
+    async def close(self) -> None:
+        self._agents.clear()
+        if self._http_client:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def get_agent(self, stage: str) -> BaseAgent:
+        agent_class, model_setting = STAGE_AGENTS[stage]
+        model = getattr(settings, model_setting).get_secret_value()
+        key = (stage, model)
+
+        agent = self._agents.get(key)
+        if agent is None:
+            logger.debug(f"Creating {agent_class.__name__} for stage {stage}")
+            agent = agent_class(http_async_client=self._get_http_client())
+            self._agents[key] = agent
+
+        return agent
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+                ),
+                event_hooks={"request": [inject_traceparent]},
+            )
+
+        return self._http_client
+
+
+agent_registry = AgentRegistry()
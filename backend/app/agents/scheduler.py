@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Final, Literal
+
+from app.core.config import settings
+from app.core.metrics import LLM_CALLS, observe_llm_queue_wait
+from app.types import JsonDict
+
+type Priority = Literal["interactive", "batch"]
+
+# Lower values are served first
+PRIORITIES: Final[dict[Priority, int]] = {"interactive": 0, "batch": 1}
+
+_priority: ContextVar[Priority] = ContextVar("llm_priority", default="interactive")
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """Run the LLM calls made in this context at the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` units a minute, with bursts of up to a minute's worth."""
+
+    def __init__(self, rate_per_minute: int) -> None:
+        self.capacity = float(rate_per_minute)
+        self.available = float(rate_per_minute)
+        self._rate = rate_per_minute / 60
+        self._updated_at = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available, 0 if it already is."""
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+
+        return (amount - self.available) / self._rate
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future[None] = field(compare=False)
+    queued_at: float = field(compare=False, default_factory=time.monotonic)
+
+
+@dataclass
+class QueueStats:
+    running: int = 0
+    queued: int = 0
+    completed: int = 0
+    wait_count: dict[str, int] = field(default_factory=lambda: dict.fromkeys(PRIORITIES, 0))
+    wait_seconds: dict[str, float] = field(default_factory=lambda: dict.fromkeys(PRIORITIES, 0.0))
+    max_wait_seconds: float = 0.0
+
+
+class ModelLimiter:
+    """Limits the concurrent calls, requests per minute and tokens per minute for one model.
+
+    Callers wait in a priority queue and are let through strictly in order, so a batch call never
+    takes capacity that an interactive call is waiting for.
+    """
+
+    def __init__(
+        self, *, max_concurrency: int, requests_per_minute: int, tokens_per_minute: int
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.stats = QueueStats()
+        self._queue: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._wakeup: asyncio.TimerHandle | None = None
+
+    async def acquire(self, *, tokens: int, priority: Priority) -> float:
+        """Wait for a slot, returning how many seconds the call waited."""
+        waiter = _Waiter(
+            PRIORITIES[priority],
+            next(self._sequence),
+            tokens,
+            asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._queue, waiter)
+        self.stats.queued += 1
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted just as the caller was cancelled
+                self.release()
+            elif waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                self.stats.queued -= 1
+                self._dispatch()
+            raise
+
+        wait = time.monotonic() - waiter.queued_at
+        self.stats.wait_count[priority] += 1
+        self.stats.wait_seconds[priority] += wait
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, wait)
+
+        return wait
+
+    def release(self) -> None:
+        self.stats.running -= 1
+        self.stats.completed += 1
+        self._dispatch()
+
+    def record_usage(self, *, estimated: int, actual: int) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        self.tokens.refill()
+        self.tokens.available = min(
+            self.tokens.capacity, self.tokens.available + estimated - actual
+        )
+
+    def _dispatch(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        while self._queue and self.stats.running < self.max_concurrency:
+            waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                self.stats.queued -= 1
+                continue
+
+            self.requests.refill()
+            self.tokens.refill()
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(waiter.tokens))
+            if wait > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return None
+
+            heapq.heappop(self._queue)
+            self.requests.available -= 1
+            self.tokens.available -= min(waiter.tokens, self.tokens.capacity)
+            self.stats.queued -= 1
+            self.stats.running += 1
+            waiter.future.set_result(None)
+
+
+class LLMScheduler:
+    """Routes every LLM call through a `ModelLimiter` for its model.
+
+    Limits come from `LLM_MAX_CONCURRENCY`, `LLM_REQUESTS_PER_MINUTE` and `LLM_TOKENS_PER_MINUTE`,
+    and can be overridden per model with `LLM_MODEL_LIMITS`.
+    """
+
+    def __init__(self) -> None:
+        self._limiters: dict[str, ModelLimiter] = {}
+
+    @asynccontextmanager
+    async def slot(self, model: str, *, tokens: int, stage: str) -> AsyncIterator[ModelLimiter]:
+        """Wait for capacity to call `model` with a request of about `tokens` tokens.
+
+        The call is counted in the metrics under the workflow `stage` that made it.
+        """
+        limiter = self.get_limiter(model)
+        priority = _priority.get()
+        queued = LLM_CALLS.labels(stage, "queued")
+        queued.inc()
+        try:
+            wait = await limiter.acquire(tokens=tokens, priority=priority)
+        finally:
+            queued.dec()
+
+        observe_llm_queue_wait(stage, priority, wait)
+        running = LLM_CALLS.labels(stage, "running")
+        running.inc()
+        try:
+            yield limiter
+        finally:
+            running.dec()
+            limiter.release()
+
+    def get_limiter(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limits = {
+                "max_concurrency": settings.LLM_MAX_CONCURRENCY,
+                "requests_per_minute": settings.LLM_REQUESTS_PER_MINUTE,
+                "tokens_per_minute": settings.LLM_TOKENS_PER_MINUTE,
+                **settings.LLM_MODEL_LIMITS.get(model, {}),
+            }
+            limiter = ModelLimiter(**limits)
+            self._limiters[model] = limiter
+
+        return limiter
+
+    def clear(self) -> None:
+        self._limiters.clear()
+
+    def stats(self) -> dict[str, JsonDict]:
+        return {model: asdict(limiter.stats) for model, limiter in self._limiters.items()}
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Final
+
+import orjson
+from langgraph.graph.state import CompiledStateGraph
+from loguru import logger
+from valkey.asyncio import Valkey
+
+from app.agents.checkpoint import invoke_workflow
+from app.agents.deadline import time_remaining
+from app.core.config import settings
+from app.core.topic_index import normalize_topic
+from app.exceptions import DeadlineExceededError
+from app.models.agents import AgentState
+from app.services import idempotency_services
+from app.types import JsonDict
+
+# State that is reset for every run or identifies the caller, so doesn't change the answer
+_RUN_FIELDS: Final = {"task", "stage", "stage_outputs", "failed_stages", "conversation_id"}
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Task[JsonDict]
+    waiters: int = 0
+
+
+class SingleFlight:
+    """Runs identical concurrent workflows once and shares the result.
+
+    Within a worker the first caller starts the run and later callers with the same key wait for
+    it. Across workers the run is claimed with a Valkey lock, and workers that find it claimed
+    wait for the result published by the worker holding it. A run is only cancelled once every
+    caller waiting on it has been cancelled.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+
+    @staticmethod
+    def create_key(state: AgentState) -> str:
+        """Key of the normalized topic and the conversation state the answer depends on."""
+        conversation = state.model_dump(exclude=_RUN_FIELDS)
+        return hashlib.sha256(
+            orjson.dumps(
+                [
+                    normalize_topic(state.task),
+                    conversation,
+                    settings.WORKFLOW_MODE,
+                    settings.WORKFLOW_ERROR_POLICY,
+                ],
+                option=orjson.OPT_SORT_KEYS,
+            )
+        ).hexdigest()
+
+    async def run(
+        self, cache_client: Valkey, *, key: str, run: Callable[[], Awaitable[JsonDict]]
+    ) -> JsonDict:
+        flight = self._flights.get(key)
+        if flight is None or flight.task.done():
+            flight = _Flight(asyncio.create_task(self._lead(cache_client, key=key, run=run)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._remove(key, flight))
+        else:
+            logger.debug(f"Joining the workflow already running for {key}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1:
+                # Wait for the run to stop so its capacity is released before returning
+                flight.task.cancel()
+                await asyncio.wait((flight.task,))
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def _lead(
+        self, cache_client: Valkey, *, key: str, run: Callable[[], Awaitable[JsonDict]]
+    ) -> JsonDict:
+        record_key = f"single-flight:{key}"
+        while True:
+            try:
+                record = await idempotency_services.claim(
+                    cache_client,
+                    key=record_key,
+                    fingerprint=key,
+                    ttl=settings.single_flight_lock_ttl,
+                )
+            except Exception as e:
+                # Run without coordinating with other workers rather than failing
+                logger.error(f"An error occurred while claiming workflow {key}: {e}")
+                return await run()
+
+            if record is None:
+                return await self._run_and_publish(cache_client, key=record_key, run=run)
+
+            if record.status == "in_progress":
+                logger.debug(f"Waiting for the workflow running in another worker for {key}")
+                try:
+                    async with asyncio.timeout(time_remaining()):
+                        record = await idempotency_services.wait(cache_client, key=record_key)
+                except TimeoutError as e:
+                    raise DeadlineExceededError(
+                        "The request deadline passed waiting for another worker's workflow"
+                    ) from e
+
+            if record is not None and record.response is not None:
+                return record.response.model_dump()
+
+            # The other worker's run failed, so try to run it here
+
+    async def _run_and_publish(
+        self, cache_client: Valkey, *, key: str, run: Callable[[], Awaitable[JsonDict]]
+    ) -> JsonDict:
+        try:
+            result = await run()
+        except BaseException:
+            try:
+                await idempotency_services.release(cache_client, key=key)
+            except Exception as e:
+                logger.error(f"An error occurred while releasing workflow {key}: {e}")
+            raise
+
+        try:
+            await idempotency_services.complete(
+                cache_client,
+                key=key,
+                fingerprint=key,
+                response=AgentState(**result),
+                ttl=settings.SINGLE_FLIGHT_RESULT_TTL,
+            )
+        except Exception as e:
+            logger.error(f"An error occurred while publishing workflow {key}: {e}")
+
+        return result
+
+    def _remove(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+single_flight = SingleFlight()
+
+
+def create_run_id(state: AgentState) -> str:
+    """Id of the workflow run for `state`, the same when the conversation retries a question."""
+    return f"{state.conversation_id}:{SingleFlight.create_key(state)}"
+
+
+async def run_workflow(
+    cache_client: Valkey, *, workflow: CompiledStateGraph, state: AgentState
+) -> JsonDict:
+    """Run the workflow for `state`, sharing the run with identical concurrent requests.
+
+    The feedback history is summarized first if it has grown too long, and a run that failed part
+    way before is resumed. Sharing is turned off with `SINGLE_FLIGHT_ENABLED`.
+    """
+    run_id = create_run_id(state)
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await invoke_workflow(workflow, state=state, run_id=run_id)
+
+    result = await single_flight.run(
+        cache_client,
+        key=single_flight.create_key(state),
+        run=lambda: invoke_workflow(workflow, state=state, run_id=run_id),
+    )
+    # The run may have been started by another conversation, for a topic that only matches this
+    # one once normalized
+    return {**result, "task": state.task, "conversation_id": state.conversation_id}
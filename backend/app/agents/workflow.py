@@ -1,91 +1,269 @@
 import asyncio
+import time
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Final
 
 from langgraph.graph import END, StateGraph
 from langgraph.graph.state import CompiledStateGraph
+from loguru import logger
 
-from app.agents.agents import ACCAgent, DLPFCAgent, MPFCAgent, OFCAgent, VMPFCAgent
+from app.agents.checkpoint import checkpointer
+from app.agents.deadline import deadline_exceeded, stage_timeout
+from app.agents.registry import agent_registry
+from app.core.config import settings
+from app.core.metrics import observe_stage
+from app.core.tracing import tracer
+from app.exceptions import DeadlineExceededError
 from app.models.agents import AgentState
 from app.types import JsonDict
 
+STAGES: Final = (
+    "task_delegation",
+    "emotional_regulation",
+    "reward_processing",
+    "conflict_detection",
+    "value_assessment",
+)
+
+# Stages that only depend on the task and the DLPFC output, and can run concurrently
+PARALLEL_STAGES: Final = ("emotional_regulation", "reward_processing", "conflict_detection")
+
 
 def create_workflow() -> CompiledStateGraph:
-    """Create the workflow graph."""
+    """Create the workflow graph.
+
+    In sequential mode the five stages run one after the other. In parallel mode the DLPFC stage
+    fans out to the VMPFC, OFC and ACC stages, which run concurrently, and the MPFC stage then
+    integrates their outputs.
+
+    What runs after a stage fails is decided by `WORKFLOW_ERROR_POLICY`. `continue` runs the
+    remaining stages anyway, `fail_fast` ends the workflow, `skip_to_mpfc` goes straight to the
+    MPFC stage to integrate what has been produced so far, and `retry` runs the failed stage again
+    before continuing.
+    """
     workflow = StateGraph(AgentState)
 
     workflow.add_node("task_delegation", process_task_delegation)
-    workflow.add_node("emotional_regulation", process_emotional_regulation)
-    workflow.add_node("reward_processing", process_reward_processing)
-    workflow.add_node("conflict_detection", process_conflict_detection)
     workflow.add_node("value_assessment", process_value_assessment)
 
-    def get_next_stage(state: AgentState) -> str:
-        current_stage = state.stage
-        if current_stage is None or current_stage == END:
-            return END
-
-        stage_map = {
-            "task_delegation": "emotional_regulation",
-            "emotional_regulation": "reward_processing",
-            "reward_processing": "conflict_detection",
-            "conflict_detection": "value_assessment",
-            "value_assessment": END,
-        }
-        return stage_map.get(current_stage, END)
-
-    for stage in [
-        "task_delegation",
-        "emotional_regulation",
-        "reward_processing",
-        "conflict_detection",
-        "value_assessment",
-    ]:
+    if settings.WORKFLOW_MODE == "parallel":
+        workflow.add_node("emotional_regulation", _parallel_stage(process_emotional_regulation))
+        workflow.add_node("reward_processing", _parallel_stage(process_reward_processing))
+        workflow.add_node("conflict_detection", _parallel_stage(process_conflict_detection))
+
+        def get_parallel_stages(state: AgentState) -> Hashable | list[Hashable]:
+            if state.failed_stages and "task_delegation" in state.failed_stages:
+                next_stage = _route_after_failure(PARALLEL_STAGES[0])
+                if next_stage != PARALLEL_STAGES[0]:
+                    return next_stage
+
+            # Otherwise all of the concurrent stages run, as value_assessment waits for each
+            return list(PARALLEL_STAGES)
+
         workflow.add_conditional_edges(
-            stage,
-            get_next_stage,
-            {
-                "emotional_regulation": "emotional_regulation",
-                "reward_processing": "reward_processing",
-                "conflict_detection": "conflict_detection",
-                "value_assessment": "value_assessment",
-                END: END,
-            },
+            "task_delegation", get_parallel_stages, [*PARALLEL_STAGES, "value_assessment", END]
         )
+        workflow.add_edge(list(PARALLEL_STAGES), "value_assessment")
+        workflow.add_edge("value_assessment", END)
+    else:
+        workflow.add_node("emotional_regulation", process_emotional_regulation)
+        workflow.add_node("reward_processing", process_reward_processing)
+        workflow.add_node("conflict_detection", process_conflict_detection)
+
+        def get_next_stage(state: AgentState) -> str:
+            # Each node sets the stage that should run next
+            current_stage = state.stage
+            if current_stage is None or current_stage not in STAGES:
+                return END
+
+            finished_stage = STAGES[STAGES.index(current_stage) - 1]
+            if state.failed_stages and finished_stage in state.failed_stages:
+                return _route_after_failure(current_stage)
+
+            return current_stage
+
+        for stage in STAGES:
+            workflow.add_conditional_edges(
+                stage,
+                get_next_stage,
+                {
+                    "emotional_regulation": "emotional_regulation",
+                    "reward_processing": "reward_processing",
+                    "conflict_detection": "conflict_detection",
+                    "value_assessment": "value_assessment",
+                    END: END,
+                },
+            )
 
     workflow.set_entry_point("task_delegation")
 
-    return workflow.compile()
+    return workflow.compile(
+        checkpointer=checkpointer if settings.WORKFLOW_CHECKPOINTS_ENABLED else None
+    )
+
+
+class WorkflowCache:
+    """Holds the compiled workflow graph for this worker.
+
+    Compiling the graph is only done at startup, or again if the settings have changed since the
+    graph was built. Requests that already hold the previous graph keep using it.
+    """
+
+    def __init__(self) -> None:
+        self._graph: CompiledStateGraph | None = None
+        self._settings_key: str | None = None
+
+    def compile(self) -> CompiledStateGraph:
+        logger.debug("Compiling workflow")
+        self._settings_key = settings.model_dump_json()
+        self._graph = create_workflow()
+
+        return self._graph
+
+    def get(self) -> CompiledStateGraph:
+        if self._graph is None or self._settings_key != settings.model_dump_json():
+            return self.compile()
+
+        return self._graph
+
+
+workflow_cache = WorkflowCache()
 
 
 async def process_task_delegation(state: AgentState) -> JsonDict:
     """Process task delegation through DLPFC agent."""
-    dlpfc = DLPFCAgent()
-    result = await asyncio.wait_for(dlpfc.process(state), timeout=30.0)
-    return {**state.model_dump(), **result, "stage": "emotional_regulation"}
+    result = await _process_stage("task_delegation", state)
+    return {
+        **state.model_dump(),
+        **result,
+        "stage": "emotional_regulation",
+        "stage_outputs": {"task_delegation": _stage_output(result)},
+        "failed_stages": _failed_stages("task_delegation", result),
+    }
 
 
 async def process_emotional_regulation(state: AgentState) -> JsonDict:
     """Process emotional regulation through VMPFC agent."""
-    vmpfc = VMPFCAgent()
-    result = await asyncio.wait_for(vmpfc.process(state), timeout=30.0)
-    return {**state.model_dump(), **result, "stage": "reward_processing"}
+    result = await _process_stage("emotional_regulation", state)
+    return {
+        **state.model_dump(),
+        **result,
+        "stage": "reward_processing",
+        "stage_outputs": {"emotional_regulation": _stage_output(result)},
+        "failed_stages": _failed_stages("emotional_regulation", result),
+    }
 
 
 async def process_reward_processing(state: AgentState) -> JsonDict:
     """Process reward processing through OFC agent."""
-    ofc = OFCAgent()
-    result = await asyncio.wait_for(ofc.process(state), timeout=30.0)
-    return {**state.model_dump(), **result, "stage": "conflict_detection"}
+    result = await _process_stage("reward_processing", state)
+    return {
+        **state.model_dump(),
+        **result,
+        "stage": "conflict_detection",
+        "stage_outputs": {"reward_processing": _stage_output(result)},
+        "failed_stages": _failed_stages("reward_processing", result),
+    }
 
 
 async def process_conflict_detection(state: AgentState) -> JsonDict:
     """Process conflict detection through ACC agent."""
-    acc = ACCAgent()
-    result = await asyncio.wait_for(acc.process(state), timeout=30.0)
-    return {**state.model_dump(), **result, "stage": "value_assessment"}
+    result = await _process_stage("conflict_detection", state)
+    return {
+        **state.model_dump(),
+        **result,
+        "stage": "value_assessment",
+        "stage_outputs": {"conflict_detection": _stage_output(result)},
+        "failed_stages": _failed_stages("conflict_detection", result),
+    }
 
 
 async def process_value_assessment(state: AgentState) -> JsonDict:
     """Process value assessment through MPFC agent."""
-    mpfc = MPFCAgent()
-    result = await asyncio.wait_for(mpfc.process(state), timeout=30.0)
-    return {**state.model_dump(), **result, "stage": END}
+    if settings.WORKFLOW_ERROR_POLICY == "fail_fast" and state.failed_stages:
+        # Only reached in parallel mode, where the concurrent stages all lead here
+        return {**state.model_dump(), "stage": END}
+
+    result = await _process_stage("value_assessment", state)
+    return {
+        **state.model_dump(),
+        **result,
+        "stage": END,
+        "stage_outputs": {"value_assessment": _stage_output(result)},
+        "failed_stages": _failed_stages("value_assessment", result),
+    }
+
+
+async def _process_stage(stage: str, state: AgentState) -> JsonDict:
+    """Run the stage's agent with whatever is left of the request deadline.
+
+    An error raised by the agent is returned as a failed result, like the errors agents catch
+    themselves, so the error policy decides what runs next. With the `retry` policy a failed stage
+    is run up to `WORKFLOW_STAGE_RETRIES` more times.
+    """
+    agent = agent_registry.get_agent(stage)
+    retries = settings.WORKFLOW_STAGE_RETRIES if settings.WORKFLOW_ERROR_POLICY == "retry" else 0
+    with tracer.span(f"stage {stage}", attributes={"workflow.stage": stage}) as span:
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(agent.process(state), timeout=stage_timeout())
+            except (TimeoutError, DeadlineExceededError):
+                observe_stage(stage, time.perf_counter() - start, error=True, timeout=True)
+                raise
+            except Exception as e:
+                logger.error(f"Error in the {stage} stage: {e}")
+                result = {"response": f"Error processing request: {e}", "error": True}
+
+            if deadline_exceeded():
+                observe_stage(stage, time.perf_counter() - start, error=True, timeout=True)
+                raise DeadlineExceededError(f"The request deadline passed during the {stage} stage")
+
+            error = result.get("error", False)
+            observe_stage(stage, time.perf_counter() - start, error=error)
+            if not error:
+                return result
+
+            if attempt < retries:
+                logger.debug(f"Retrying the {stage} stage after an error")
+
+        span.status = "error"
+        return result
+
+
+def _route_after_failure(next_stage: str) -> str:
+    """The stage to run after a failed stage, instead of `next_stage`."""
+    if settings.WORKFLOW_ERROR_POLICY == "fail_fast":
+        return END
+
+    if settings.WORKFLOW_ERROR_POLICY == "skip_to_mpfc":
+        return "value_assessment"
+
+    return next_stage
+
+
+def _parallel_stage(
+    process: Callable[[AgentState], Awaitable[JsonDict]],
+) -> Callable[[AgentState], Awaitable[JsonDict]]:
+    """Only keep the stage output so concurrent stages don't write the same state keys."""
+
+    async def process_parallel(state: AgentState) -> JsonDict:
+        result = await process(state)
+        return {"stage_outputs": result["stage_outputs"], "failed_stages": result["failed_stages"]}
+
+    return process_parallel
+
+
+def _failed_stages(stage: str, result: JsonDict) -> list[str] | None:
+    return [stage] if result.get("error", False) else None
+
+
+def _stage_output(result: JsonDict) -> str:
+    if result.get("error", False):
+        # Kept out of the later prompts, which only need to know the stage has nothing to add
+        return "This stage failed and has no output"
+
+    if "response" in result:
+        return str(result["response"])
+
+    return "\n".join(result.get("subtasks", []))
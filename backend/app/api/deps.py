@@ -1,10 +1,11 @@
+import secrets
 from collections.abc import AsyncGenerator
 from typing import Annotated, Any, cast
 
 import asyncpg
 import jwt
 import valkey.asyncio as valkey
-from fastapi import Depends, HTTPException, Request
+from fastapi import Depends, Header, HTTPException, Request
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 from fastapi.security import OAuth2
 from fastapi.security.utils import get_authorization_scheme_param
@@ -23,8 +24,9 @@ from app.core.cache import cache
 from app.core.config import settings
 from app.core.db import db
 from app.core.security import ALGORITHM
+from app.core.user_cache import user_cache
 from app.models.token import TokenPayload
-from app.models.users import UserInDb
+from app.models.users import AuthenticatedUser
 from app.services.user_services import get_user_by_id
 
 
@@ -71,14 +73,15 @@ reusable_oauth2 = OAuth2PasswordBearerWithCookie(
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-async def get_db_conn() -> AsyncGenerator[asyncpg.Connection]:
-    if db.pool is None:
-        logger.error("No database pool created")
-        raise HTTPException(
-            status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="The database is currently unavailable"
-        )
-    async with db.pool.acquire() as connection:
-        yield connection
+async def get_db_conn(request: Request) -> AsyncGenerator[asyncpg.Connection]:
+    pool = _get_db_pool()
+    async with pool.acquire() as connection:
+        # Lets dependencies resolved later in the request share this connection
+        request.state.db_conn = connection
+        try:
+            yield connection
+        finally:
+            request.state.db_conn = None
 
 
 DbConn = Annotated[asyncpg.Connection, Depends(get_db_conn)]
@@ -97,7 +100,14 @@ async def get_cache_client() -> AsyncGenerator[valkey.Valkey]:
 CacheClient = Annotated[valkey.Valkey, Depends(get_cache_client)]
 
 
-async def get_current_user(conn: DbConn, token: TokenDep) -> UserInDb:
+async def get_current_user(request: Request, token: TokenDep) -> AuthenticatedUser:
+    """Load the user for the token.
+
+    Users are served from the user cache when possible. Otherwise, unless the request already
+    holds a connection, one is only borrowed from the pool for the lookup so long running
+    requests, such as chats, don't keep a connection checked out.
+    """
+
     try:
         logger.debug("Decoding JWT token")
         payload = jwt.decode(
@@ -116,7 +126,17 @@ async def get_current_user(conn: DbConn, token: TokenDep) -> UserInDb:
             status_code=HTTP_403_FORBIDDEN, detail="Count not validate credientials"
         )
     user_id = token_data.sub
-    user = await get_user_by_id(conn, user_id=user_id)
+    user: AuthenticatedUser | None = await user_cache.get(user_id)
+    if user is None:
+        generation = await user_cache.generation(user_id)
+        conn = getattr(request.state, "db_conn", None)
+        if conn is not None:
+            user = await get_user_by_id(conn, user_id=user_id)
+        else:
+            async with _get_db_pool().acquire() as conn:
+                user = await get_user_by_id(conn, user_id=user_id)
+        if user:
+            await user_cache.set(user, generation=generation)
     if not user:
         logger.debug("User not found")
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="User not found")
@@ -126,11 +146,37 @@ async def get_current_user(conn: DbConn, token: TokenDep) -> UserInDb:
     return user
 
 
-CurrentUser = Annotated[UserInDb, Depends(get_current_user)]
+CurrentUser = Annotated[AuthenticatedUser, Depends(get_current_user)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> UserInDb:
+def get_current_active_superuser(current_user: CurrentUser) -> AuthenticatedUser:
     if not current_user.is_superuser:
         logger.debug("The current user is not a super user")
         raise HTTPException(status_code=403, detail="The user doesn't have enough privileges")
     return current_user
+
+
+def verify_metrics_token(authorization: Annotated[str | None, Header()] = None) -> None:
+    if settings.METRICS_TOKEN is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Not Found")
+
+    scheme, token = get_authorization_scheme_param(authorization)
+    if scheme.lower() != "bearer" or not secrets.compare_digest(
+        token.encode(), settings.METRICS_TOKEN.get_secret_value().encode()
+    ):
+        logger.debug("Invalid metrics token")
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def _get_db_pool() -> asyncpg.Pool:
+    if db.pool is None:
+        logger.error("No database pool created")
+        raise HTTPException(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="The database is currently unavailable"
+        )
+
+    return db.pool
@@ -1,8 +1,9 @@
-from app.api.routes import chat, health, login, users
+from app.api.routes import chat, health, login, metrics, users
 from app.core.utils import APIRouter
 
 api_router = APIRouter()
 api_router.include_router(chat.router)
 api_router.include_router(health.router)
 api_router.include_router(login.router)
+api_router.include_router(metrics.router)
 api_router.include_router(users.router)
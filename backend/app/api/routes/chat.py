@@ -1,35 +1,107 @@
-from copy import deepcopy
+import asyncio
+from collections.abc import AsyncGenerator
+from typing import Annotated, Any, Final
 
 import orjson
-from fastapi import HTTPException
+from fastapi import Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from langgraph.graph.state import CompiledStateGraph
 from loguru import logger
-from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
+from starlette.status import (
+    HTTP_202_ACCEPTED,
+    HTTP_404_NOT_FOUND,
+    HTTP_409_CONFLICT,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+    HTTP_500_INTERNAL_SERVER_ERROR,
+    HTTP_504_GATEWAY_TIMEOUT,
+)
+from valkey.asyncio import Valkey
 
-from app.agents.workflow import create_workflow
+from app.agents.checkpoint import finish_run, resume_or_start, run_config
+from app.agents.deadline import request_deadline
+from app.agents.registry import STAGE_AGENTS
+from app.agents.single_flight import create_run_id, run_workflow
+from app.agents.workflow import workflow_cache
 from app.api.deps import CacheClient, CurrentUser
 from app.core.config import settings
-from app.core.utils import APIRouter
+from app.core.tracing import tracer
+from app.core.utils import APIRouter, cancel_on_disconnect
+from app.exceptions import ClientDisconnectedError, DeadlineExceededError
 from app.models.agents import AgentState, Topic
+from app.models.jobs import ChatJob
+from app.services import chat_services, idempotency_services, job_services
 
 router = APIRouter(tags=["Chat"], prefix=f"{settings.API_V1_PREFIX}/chat")
 
+_STREAM_HEADERS: Final = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# How often a job stream re-reads the job in case it expired while being waited on
+_JOB_POLL_INTERVAL: Final = 15.0
+# Not in the HTTP spec, nginx's status for a request the client gave up on
+_HTTP_499_CLIENT_CLOSED_REQUEST: Final = 499
+
 
 @router.post("/")
-async def ask_question(*, topic: Topic, cache_client: CacheClient, user: CurrentUser) -> AgentState:
-    """Ask for help with a questions."""
-
-    cache = await cache_client.get(name=f"{user.id}-agent-state")  # type: ignore[misc]
-    initial_state = (
-        AgentState(**orjson.loads(cache))
-        if cache
-        else AgentState(task=topic.topic, stage="task_delegation")
+async def ask_question(
+    *,
+    request: Request,
+    response: Response,
+    topic: Topic,
+    cache_client: CacheClient,
+    user: CurrentUser,
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
+) -> AgentState:
+    """Ask for help with a questions.
+
+    The workflow is cancelled if the client disconnects before it finishes.
+
+    Retries sent with the same `Idempotency-Key` header don't run the workflow again. A retry
+    sent while the first request is running waits for its answer, and one sent after it finished
+    gets the stored answer with an `Idempotent-Replayed` header.
+    """
+
+    if idempotency_key is None:
+        return await _answer_question(
+            request, topic=topic, cache_client=cache_client, user_id=user.id
+        )
+
+    return await _answer_idempotently(
+        request,
+        response,
+        topic=topic,
+        cache_client=cache_client,
+        user_id=user.id,
+        key=idempotency_key,
     )
-    initial_state.stage = "task_delegation"
 
-    workflow = create_workflow()
+
+async def _answer_question(
+    request: Request, *, topic: Topic, cache_client: Valkey, user_id: str
+) -> AgentState:
+    initial_state = await chat_services.get_agent_state(cache_client, user_id=user_id, topic=topic)
+    similar_state = await chat_services.answer_from_topic_cache(
+        cache_client, user_id=user_id, state=initial_state
+    )
+    if similar_state:
+        return similar_state
+
+    workflow = workflow_cache.get()
 
     try:
-        state = await workflow.ainvoke(initial_state.model_dump())
+        with request_deadline(settings.REQUEST_TIMEOUT), tracer.span("workflow"):
+            state = await cancel_on_disconnect(
+                request, run_workflow(cache_client, workflow=workflow, state=initial_state)
+            )
+    except ClientDisconnectedError as e:
+        logger.info(f"Stopped answering question: {e}")
+        raise HTTPException(
+            status_code=_HTTP_499_CLIENT_CLOSED_REQUEST, detail="The client closed the request"
+        ) from e
+    except (DeadlineExceededError, TimeoutError) as e:
+        logger.error(f"Timed out answering question: {e}")
+        raise HTTPException(
+            status_code=HTTP_504_GATEWAY_TIMEOUT,
+            detail="Timed out getting an answer, please try again",
+        ) from e
     except Exception as e:
         logger.error(f"An error occurred while answering question: {e}")
         raise HTTPException(
@@ -38,15 +110,293 @@ async def ask_question(*, topic: Topic, cache_client: CacheClient, user: Current
         ) from e
 
     current_state = AgentState(**state)
+    await chat_services.save_answered_state(
+        cache_client, user_id=user_id, state=current_state, previous=initial_state
+    )
+
+    return current_state
+
+
+async def _answer_idempotently(
+    request: Request,
+    response: Response,
+    *,
+    topic: Topic,
+    cache_client: Valkey,
+    user_id: str,
+    key: str,
+) -> AgentState:
+    record_key = idempotency_services.create_key(user_id, key)
+    fingerprint = idempotency_services.create_fingerprint(topic.topic)
+    while True:
+        try:
+            record = await idempotency_services.claim(
+                cache_client, key=record_key, fingerprint=fingerprint
+            )
+        except Exception as e:
+            # Answer without replay protection rather than failing the request
+            logger.error(f"An error occurred while claiming idempotency key {key}: {e}")
+            return await _answer_question(
+                request, topic=topic, cache_client=cache_client, user_id=user_id
+            )
+
+        if record is None:
+            return await _answer_and_store(
+                request,
+                topic=topic,
+                cache_client=cache_client,
+                user_id=user_id,
+                key=record_key,
+                fingerprint=fingerprint,
+            )
+
+        if record.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="The Idempotency-Key was already used for a different request",
+            )
+
+        if record.status == "in_progress":
+            try:
+                async with asyncio.timeout(settings.REQUEST_TIMEOUT):
+                    completed = await idempotency_services.wait(cache_client, key=record_key)
+            except TimeoutError as e:
+                raise HTTPException(
+                    status_code=HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still in progress",
+                ) from e
+            except Exception as e:
+                logger.error(f"An error occurred while waiting on idempotency key {key}: {e}")
+                raise HTTPException(
+                    status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="An error occurred when getting an answer",
+                ) from e
+
+            if completed is None:
+                # The first request failed, so this one answers instead
+                continue
 
+            record = completed
+
+        if record.response is None:
+            logger.error(f"The record for idempotency key {key} has no response")
+            raise HTTPException(
+                status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="An error occurred when getting an answer",
+            )
+
+        response.headers["Idempotent-Replayed"] = "true"
+        return record.response
+
+
+async def _answer_and_store(
+    request: Request,
+    *,
+    topic: Topic,
+    cache_client: Valkey,
+    user_id: str,
+    key: str,
+    fingerprint: str,
+) -> AgentState:
     try:
-        cache_state = deepcopy(current_state)
-        cache_state.previous_response = current_state.response
-        # 5 minute TTL cache
-        await cache_client.set(  # type: ignore[misc]
-            name=f"{user.id}-agent-state", value=cache_state.model_dump_json(), ex=300
+        state = await _answer_question(
+            request, topic=topic, cache_client=cache_client, user_id=user_id
+        )
+    except BaseException:
+        try:
+            await idempotency_services.release(cache_client, key=key)
+        except Exception as e:
+            logger.error(f"An error occurred while releasing idempotency key {key}: {e}")
+        raise
+
+    try:
+        await idempotency_services.complete(
+            cache_client, key=key, fingerprint=fingerprint, response=state
         )
     except Exception as e:
-        logger.error(f"An error occurred while caching the agent state for user {user.id}: {e}")
+        logger.error(f"An error occurred while storing the answer for idempotency key {key}: {e}")
 
-    return current_state
+    return state
+
+
+@router.post("/stream", response_class=StreamingResponse)
+async def ask_question_stream(
+    *, topic: Topic, cache_client: CacheClient, user: CurrentUser
+) -> StreamingResponse:
+    """Ask for help with a question, streaming the progress of each stage as Server-Sent Events.
+
+    Emits `stage-start`, `token-delta` and `stage-complete` events while the workflow runs, then
+    a `workflow-complete` event with the final state, or an `error` event if the workflow fails
+    or runs past `REQUEST_TIMEOUT`. The response stops listening, and the workflow is cancelled,
+    when the client disconnects.
+    """
+
+    initial_state = await chat_services.get_agent_state(cache_client, user_id=user.id, topic=topic)
+    similar_state = await chat_services.answer_from_topic_cache(
+        cache_client, user_id=user.id, state=initial_state
+    )
+    if similar_state:
+        return StreamingResponse(
+            iter((_format_event("workflow-complete", similar_state.model_dump(by_alias=True)),)),
+            media_type="text/event-stream",
+            headers=_STREAM_HEADERS,
+        )
+
+    workflow = workflow_cache.get()
+
+    return StreamingResponse(
+        _stream_workflow(workflow, initial_state, cache_client=cache_client, user_id=user.id),
+        media_type="text/event-stream",
+        headers=_STREAM_HEADERS,
+    )
+
+
+@router.post("/jobs", status_code=HTTP_202_ACCEPTED)
+async def create_chat_job(*, topic: Topic, cache_client: CacheClient, user: CurrentUser) -> ChatJob:
+    """Queue a question to be answered by a background worker.
+
+    Poll `GET /chat/jobs/{job_id}`, or subscribe to `GET /chat/jobs/{job_id}/stream`, for the
+    result.
+    """
+
+    initial_state = await chat_services.get_agent_state(cache_client, user_id=user.id, topic=topic)
+
+    try:
+        return await job_services.create_job(cache_client, user_id=user.id, state=initial_state)
+    except Exception as e:
+        logger.error(f"An error occurred while queueing a chat job: {e}")
+        raise HTTPException(
+            status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred while queueing the question",
+        ) from e
+
+
+@router.get("/jobs/{job_id}")
+async def get_chat_job(*, job_id: str, cache_client: CacheClient, user: CurrentUser) -> ChatJob:
+    """Get the status of a chat job, and its result once it is complete."""
+
+    return await _get_job(cache_client, job_id=job_id, user_id=user.id)
+
+
+@router.get("/jobs/{job_id}/stream", response_class=StreamingResponse)
+async def stream_chat_job(
+    *, job_id: str, cache_client: CacheClient, user: CurrentUser
+) -> StreamingResponse:
+    """Wait for a chat job as Server-Sent Events.
+
+    Emits a `job-update` event each time the job's status changes, then a `job-complete` event
+    once it has finished, or an `error` event if the job is no longer available.
+    """
+
+    job = await _get_job(cache_client, job_id=job_id, user_id=user.id)
+
+    return StreamingResponse(
+        _stream_job(cache_client, job=job),
+        media_type="text/event-stream",
+        headers=_STREAM_HEADERS,
+    )
+
+
+async def _stream_workflow(
+    workflow: CompiledStateGraph,
+    initial_state: AgentState,
+    *,
+    cache_client: Valkey,
+    user_id: str,
+) -> AsyncGenerator[bytes]:
+    state: dict[str, Any] | None = None
+    try:
+        with request_deadline(settings.REQUEST_TIMEOUT):
+            run_id = create_run_id(initial_state)
+            config = run_config(run_id)
+            workflow_input = await resume_or_start(workflow, state=initial_state, config=config)
+            with tracer.span("workflow"):
+                async for event in workflow.astream_events(workflow_input, config, version="v2"):
+                    kind = event["event"]
+                    stage = event["metadata"].get("langgraph_node")
+                    if kind == "on_chat_model_stream":
+                        yield _format_event(
+                            "token-delta", {"stage": stage, "delta": event["data"]["chunk"].content}
+                        )
+                    elif event["name"] in STAGE_AGENTS and event["name"] == stage:
+                        if kind == "on_chain_start":
+                            yield _format_event("stage-start", {"stage": stage})
+                        elif kind == "on_chain_end":
+                            # Parallel stages only return their output and failed_stages
+                            failed_stages = event["data"]["output"].get("failed_stages") or ()
+                            error = stage in failed_stages
+                            yield _format_event("stage-complete", {"stage": stage, "error": error})
+                    elif kind == "on_chain_end" and not event["parent_ids"]:
+                        state = event["data"]["output"]
+
+            await finish_run(workflow, run_id=run_id)
+    except (DeadlineExceededError, TimeoutError) as e:
+        logger.error(f"Timed out streaming an answer: {e}")
+        yield _format_event("error", {"detail": "Timed out getting an answer, please try again"})
+        return
+    except Exception as e:
+        logger.error(f"An error occurred while streaming an answer: {e}")
+        yield _format_event("error", {"detail": "An error occurred when getting an answer"})
+        return
+
+    if state is None:
+        logger.error("The workflow finished without returning a state")
+        yield _format_event("error", {"detail": "An error occurred when getting an answer"})
+        return
+
+    current_state = AgentState(**state)
+    await chat_services.save_answered_state(
+        cache_client, user_id=user_id, state=current_state, previous=initial_state
+    )
+
+    yield _format_event("workflow-complete", current_state.model_dump(by_alias=True))
+
+
+async def _stream_job(cache_client: Valkey, *, job: ChatJob) -> AsyncGenerator[bytes]:
+    pubsub = cache_client.pubsub()
+    try:
+        # Subscribe before re-reading the job so no update can be missed in between
+        await pubsub.subscribe(job_services.job_channel(job.id))
+        current_job = await job_services.get_job(cache_client, job_id=job.id)
+        while current_job is not None and not current_job.finished:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=_JOB_POLL_INTERVAL
+            )
+            if message is None:
+                current_job = await job_services.get_job(cache_client, job_id=job.id)
+                continue
+
+            current_job = ChatJob.model_validate_json(message["data"])
+            yield _format_event("job-update", {"id": job.id, "status": current_job.status})
+    except Exception as e:
+        logger.error(f"An error occurred while waiting for chat job {job.id}: {e}")
+        yield _format_event("error", {"detail": "An error occurred while waiting for the job"})
+        return
+    finally:
+        await pubsub.aclose()
+
+    if current_job is None:
+        yield _format_event("error", {"detail": "The job is no longer available"})
+        return
+
+    yield _format_event("job-complete", current_job.model_dump(by_alias=True))
+
+
+def _format_event(event: str, data: dict[str, Any]) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+async def _get_job(cache_client: Valkey, *, job_id: str, user_id: str) -> ChatJob:
+    try:
+        job = await job_services.get_job(cache_client, job_id=job_id)
+    except Exception as e:
+        logger.error(f"An error occurred while getting chat job {job_id}: {e}")
+        raise HTTPException(
+            status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred while getting the job",
+        ) from e
+
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Job not found")
+
+    return job
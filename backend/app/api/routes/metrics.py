@@ -0,0 +1,20 @@
+from fastapi import Depends, Response
+
+from app.api.deps import verify_metrics_token
+from app.core.metrics import render_metrics
+from app.core.utils import APIRouter
+
+router = APIRouter(
+    tags=["Metrics"], include_in_schema=False, dependencies=[Depends(verify_metrics_token)]
+)
+
+
+@router.get("/metrics")
+async def metrics() -> Response:
+    """Metrics in the Prometheus text format, aggregated across every worker.
+
+    Only served when `METRICS_TOKEN` is set, to requests that send it as a bearer token.
+    """
+
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
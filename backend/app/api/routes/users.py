@@ -10,10 +10,11 @@ from starlette.status import (
 
 from app.api.deps import CurrentUser, DbConn, get_current_active_superuser
 from app.core.config import settings
-from app.core.security import verify_password
+from app.core.security import verify_password_async
 from app.core.utils import APIRouter
 from app.models.message import Message
 from app.models.users import (
+    AuthenticatedUser,
     UpdatePassword,
     UserCreate,
     UserInDb,
@@ -136,7 +137,19 @@ async def update_password_me(
 ) -> Message:
     """Update own password."""
 
-    if not verify_password(user_in.current_password, current_user.hashed_password):
+    try:
+        db_user = await user_services.get_user_by_id(db_conn, user_id=current_user.id)
+    except Exception as e:
+        logger.error(f"An error occurred while retrieving the user to update the password: {e}")
+        raise HTTPException(
+            status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred while updating the password",
+        ) from e
+
+    if db_user is None:
+        logger.debug("User not found")
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="User not found")
+    if not await verify_password_async(user_in.current_password, db_user.hashed_password):
         logger.debug("Passwords do not match")
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Incorrect password")
     if user_in.current_password == user_in.new_password:
@@ -160,7 +173,7 @@ async def update_password_me(
 
 
 @router.get("/me", response_model=UserPublic)
-async def read_user_me(*, current_user: CurrentUser) -> UserInDb:
+async def read_user_me(*, current_user: CurrentUser) -> AuthenticatedUser:
     """Get current user."""
 
     return current_user
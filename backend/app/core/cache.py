@@ -1,16 +1,71 @@
+import time
+from typing import Any
+
 import valkey.asyncio as valkey
 
 from app.core.config import settings
+from app.core.tracing import current_span, tracer
+
+
+class TracedValkey(valkey.Valkey):
+    """Valkey client that records each command as a span when it runs inside a trace."""
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        span = current_span()
+        if span is None or not span.sampled:
+            return await super().execute_command(*args, **options)
+
+        start = time.perf_counter()
+        error: Exception | None = None
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            tracer.record_span(
+                f"valkey {args[0]}",
+                duration=time.perf_counter() - start,
+                error=error,
+                attributes={"db.system": "valkey", "db.operation": str(args[0])},
+            )
+
+
+class TrackedConnectionPool(valkey.ConnectionPool):
+    """Connection pool that counts its open and checked out connections for the metrics."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.opened = 0
+        self.in_use = 0
+
+    def reset(self) -> None:
+        super().reset()
+        self.opened = 0
+        self.in_use = 0
+
+    def make_connection(self) -> valkey.Connection:
+        self.opened += 1
+        return super().make_connection()
+
+    def get_available_connection(self) -> valkey.Connection:
+        connection = super().get_available_connection()
+        self.in_use += 1
+        return connection
+
+    async def release(self, connection: Any) -> None:
+        await super().release(connection)
+        self.in_use -= 1
 
 
 class Cache:
     def __init__(self) -> None:
-        self._pool: valkey.ConnectionPool | None = None
-        self.client: valkey.Valkey | None = None
+        self._pool: TrackedConnectionPool | None = None
+        self.client: TracedValkey | None = None
 
     async def create_client(self) -> None:
         self._pool = await self._create_pool()
-        self.client = valkey.Valkey.from_pool(self._pool)
+        self.client = TracedValkey.from_pool(self._pool)  # type: ignore[assignment]
 
     async def close_client(self) -> None:
         if self.client:
@@ -19,8 +74,17 @@ class Cache:
         if self._pool:
             await self._pool.aclose()
 
-    async def _create_pool(self) -> valkey.ConnectionPool:
-        return valkey.ConnectionPool(
+    def stats(self) -> dict[str, int]:
+        if self._pool is None:
+            return {}
+
+        return {
+            "in_use": self._pool.in_use,
+            "available": self._pool.opened - self._pool.in_use,
+        }
+
+    async def _create_pool(self) -> TrackedConnectionPool:
+        return TrackedConnectionPool(
             host=settings.VALKEY_HOST,
             port=settings.VALKEY_PORT,
             password=settings.VALKEY_PASSWORD.get_secret_value(),
@@ -1,3 +1,4 @@
+import math
 import warnings
 from pathlib import Path
 from typing import Annotated, Any, Final, Literal, Self
@@ -43,6 +44,7 @@ class Settings(BaseSettings):
     LOG_PATH: str | Path | None = None
     LOG_TO_SCREEN_AND_FILE: bool = False
     PRODUCTION_MODE: bool = True
+    PASSWORD_HASH_WORKERS: int = 4
     POSTGRES_HOST: str
     POSTGRES_PORT: int = 5432
     POSTGRES_USER: str
@@ -51,6 +53,9 @@ class Settings(BaseSettings):
     VALKEY_HOST: str
     VALKEY_PASSWORD: SecretStr
     VALKEY_PORT: int = 6379
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_LOCAL_TTL: int = 30
+    USER_CACHE_TTL: int = 5 * 60
     FRONTEND_HOST: str = "http:/localhost:3000"  # next makes you use localhost instead of 127.0.0.1
     OPENAI_API_KEY: SecretStr
     DLPFC_MODEL: SecretStr = SecretStr("gpt-3.5-turbo")
@@ -58,8 +63,80 @@ class Settings(BaseSettings):
     OFC_MODEL: SecretStr = SecretStr("gpt-3.5-turbo")
     ACC_MODEL: SecretStr = SecretStr("gpt-3.5-turbo")
     MPFC_MODEL: SecretStr = SecretStr("gpt-3.5-turbo")
+    SUMMARY_MODEL: SecretStr = SecretStr("gpt-3.5-turbo")
+    METRICS_SAMPLE_INTERVAL: float = 5.0
+    # Bearer token Prometheus scrapes /metrics with, the endpoint is disabled without one
+    METRICS_TOKEN: SecretStr | None = None
+    TRACING_EXPORTER: Literal["none", "file", "collector"] = "none"
+    TRACING_SAMPLE_RATE: float = 0.1
+    TRACING_FILE_PATH: Path = Path("traces/spans.jsonl")
+    TRACING_COLLECTOR_URL: str | None = None
+    TRACING_EXPORT_INTERVAL: float = 5.0
+    TRACING_MAX_QUEUE_SIZE: int = 10_000
+    LLM_BACKEND: Literal["openai", "fake", "replay", "record"] = "openai"
+    LLM_CASSETTE_PATH: Path = Path("cassettes/llm.jsonl")
+    FAKE_LLM_LATENCY_DISTRIBUTION: Literal["constant", "uniform", "lognormal"] = "lognormal"
+    FAKE_LLM_LATENCY_MEAN: float = 0.5
+    FAKE_LLM_LATENCY_SPREAD: float = 0.5
+    FAKE_LLM_TOKENS_PER_SECOND: float = 50.0
+    FAKE_LLM_SEED: int | None = None
     MAX_TOKENS: int = 500
     TEMPERATURE: float = 0.7
+    PROMPT_TOKEN_ESTIMATOR: Literal["characters", "tiktoken"] = "characters"
+    # Tokens for the state, previous response, feedback and stage outputs in each agent prompt
+    PROMPT_STATE_TOKEN_BUDGET: int = 2_000
+    # The feedback history is folded into a summary once it passes this many tokens
+    HISTORY_SUMMARY_THRESHOLD: int = 1_000
+    # The newest feedback entries kept as they are when the rest are summarized
+    HISTORY_SUMMARY_KEEP_ENTRIES: int = 3
+    LLM_CACHE_STAGES: list[str] = []
+    LLM_CACHE_TTL: int = 60 * 60
+    LLM_CACHE_MAX_ENTRIES: int = 10_000
+    TOPIC_CACHE_ENABLED: bool = False
+    TOPIC_CACHE_THRESHOLD: float = 0.85
+    TOPIC_CACHE_TTL: int = 60 * 60 * 24
+    # Agent state fields larger than this many bytes are saved zstd compressed
+    AGENT_STATE_COMPRESSION_THRESHOLD: int = 1_024
+    WORKFLOW_MODE: Literal["sequential", "parallel"] = "sequential"
+    WORKFLOW_ERROR_POLICY: Literal["continue", "fail_fast", "skip_to_mpfc", "retry"] = (
+        "skip_to_mpfc"
+    )
+    WORKFLOW_STAGE_RETRIES: int = 1
+    WORKFLOW_CHECKPOINTS_ENABLED: bool = True
+    # How long a failed run's checkpoints are kept for a retry to resume from
+    WORKFLOW_CHECKPOINT_TTL: int = 10 * 60
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    REQUEST_TIMEOUT: float = 90.0
+    AGENT_TIMEOUT: float = 30.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 8.0
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_REQUESTS_PER_MINUTE: int = 500
+    LLM_TOKENS_PER_MINUTE: int = 200_000
+    # Per model overrides of the limits above, e.g. {"gpt-4o": {"max_concurrency": 4}}
+    LLM_MODEL_LIMITS: dict[str, dict[str, int]] = {}
+    CHAT_JOB_TTL: int = 60 * 60
+    CHAT_JOB_TIMEOUT: float = 5 * 60
+    CHAT_JOB_STREAM_MAXLEN: int = 10_000
+    CHAT_JOB_WORKER_CONCURRENCY: int = 8
+    # Jobs left pending this long by a worker are assumed lost and claimed by another worker
+    CHAT_JOB_CLAIM_IDLE: int = 10 * 60
+    IDEMPOTENCY_TTL: int = 60 * 60 * 24
+    # How long an in progress marker is held, longer than REQUEST_TIMEOUT so it outlives the run
+    IDEMPOTENCY_LOCK_TTL: int = 2 * 60
+    SINGLE_FLIGHT_ENABLED: bool = True
+    # How much longer than the longest run a single-flight lock is held, see single_flight_lock_ttl
+    SINGLE_FLIGHT_LOCK_MARGIN: int = 30
+    # Long enough for requests waiting in other workers to read the result once notified
+    SINGLE_FLIGHT_RESULT_TTL: int = 10
+    CONVERSATION_WRITE_INTERVAL: float = 1.0
+    CONVERSATION_WRITE_BATCH_SIZE: int = 500
+    CONVERSATION_WRITE_MAX_QUEUE_SIZE: int = 10_000
+    # A conversation idle for longer than this isn't resumed from Postgres once it leaves Valkey
+    CONVERSATION_RESUME_WINDOW: int = 60 * 60 * 24
 
     @computed_field  # type: ignore[prop-decorator]
     @property
@@ -68,6 +145,13 @@ class Settings(BaseSettings):
             self.FRONTEND_HOST
         ]
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def single_flight_lock_ttl(self) -> int:
+        # Outlives any run, so no second leader is elected while the first is still running
+        longest_run = max(self.REQUEST_TIMEOUT, self.CHAT_JOB_TIMEOUT)
+        return math.ceil(longest_run) + self.SINGLE_FLIGHT_LOCK_MARGIN
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def server_host(self) -> str:
@@ -95,6 +179,29 @@ class Settings(BaseSettings):
 
         return temperature
 
+    @field_validator("TOPIC_CACHE_THRESHOLD")
+    @classmethod
+    def validate_topic_cache_threshold(cls, threshold: float) -> float:
+        if not (0 <= threshold <= 1.0):
+            raise ValueError("Topic cache threshold must be between 0.0 and 1.0")
+
+        return threshold
+
+    @field_validator("TRACING_SAMPLE_RATE")
+    @classmethod
+    def validate_tracing_sample_rate(cls, rate: float) -> float:
+        if not (0 <= rate <= 1.0):
+            raise ValueError("Tracing sample rate must be between 0.0 and 1.0")
+
+        return rate
+
+    @model_validator(mode="after")
+    def _check_tracing_collector(self) -> Self:
+        if self.TRACING_EXPORTER == "collector" and not self.TRACING_COLLECTOR_URL:
+            raise ValueError("TRACING_COLLECTOR_URL is required to export traces to a collector")
+
+        return self
+
     @model_validator(mode="after")
     def _enforce_non_default_secrets(self) -> Self:
         self._check_default_secret("SECRET_KEY", self.SECRET_KEY.get_secret_value())
@@ -0,0 +1,139 @@
+import asyncio
+from collections import deque
+from datetime import UTC, datetime, timedelta
+
+import asyncpg
+from loguru import logger
+
+from app.core.config import settings
+from app.core.db import db
+from app.models.conversations import ConversationTurn
+from app.services import conversation_services
+
+
+class ConversationWriter:
+    """Writes conversation turns to Postgres in the background, in batches.
+
+    Chat requests only add turns to an in-memory queue, so answering never waits on a Postgres
+    write. The queue is written every `CONVERSATION_WRITE_INTERVAL` seconds, or as soon as it holds
+    `CONVERSATION_WRITE_BATCH_SIZE` turns, and once more when the writer stops. Turns of users that
+    no longer exist, or that Postgres rejects, are dropped without the rest of their batch. A batch
+    that can't be written otherwise is kept to be retried. When the queue is full the oldest turns
+    are dropped.
+    """
+
+    def __init__(self) -> None:
+        self.dropped = 0
+        self._queue: deque[ConversationTurn] = deque()
+        self._writing: list[ConversationTurn] = []
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return None
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._task = None
+        await self.flush()
+
+    def add(self, turn: ConversationTurn) -> None:
+        if len(self._queue) >= settings.CONVERSATION_WRITE_MAX_QUEUE_SIZE:
+            self._queue.popleft()
+            self.dropped += 1
+
+        self._queue.append(turn)
+        if len(self._queue) >= settings.CONVERSATION_WRITE_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def get_latest(
+        self, user_id: str, *, conversation_id: str | None = None
+    ) -> ConversationTurn | None:
+        """The user's newest turn within `CONVERSATION_RESUME_WINDOW`, written or not.
+
+        Only turns of `conversation_id` are considered when it's given.
+        """
+        since = datetime.now(UTC) - timedelta(seconds=settings.CONVERSATION_RESUME_WINDOW)
+        for turn in reversed((*self._writing, *self._queue)):
+            if turn.user_id == user_id and conversation_id in (None, turn.conversation_id):
+                return turn if turn.created_at > since else None
+
+        if db.pool is None:
+            return None
+
+        async with db.pool.acquire() as connection:
+            return await conversation_services.get_latest_turn(
+                connection, user_id=user_id, since=since, conversation_id=conversation_id
+            )
+
+    async def flush(self) -> None:
+        async with self._lock:
+            while self._queue and db.pool is not None:
+                batch_size = min(len(self._queue), settings.CONVERSATION_WRITE_BATCH_SIZE)
+                self._writing = [self._queue.popleft() for _ in range(batch_size)]
+                try:
+                    try:
+                        async with db.pool.acquire() as connection:
+                            written = await conversation_services.insert_turns(
+                                connection, turns=self._writing
+                            )
+                    except (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError) as e:
+                        logger.error(f"Writing conversation turns one by one: {e}")
+                        written = await self._write_each(db.pool, turns=self._writing)
+
+                    self._drop(len(self._writing) - written)
+                except BaseException as e:
+                    # Kept to be retried, including when the flush is cancelled by `stop`. Turns
+                    # that were written are skipped on the retry.
+                    self._queue.extendleft(reversed(self._writing))
+                    if not isinstance(e, Exception):
+                        raise
+
+                    logger.error(f"Error writing {len(self._writing)} conversation turns: {e}")
+                    return None
+                finally:
+                    self._writing = []
+
+    def clear(self) -> None:
+        self._queue.clear()
+
+    async def _write_each(self, pool: asyncpg.Pool, *, turns: list[ConversationTurn]) -> int:
+        """Write the turns one at a time, so Postgres only rejects the turns with bad data."""
+        written = 0
+        for turn in turns:
+            try:
+                async with pool.acquire() as connection:
+                    written += await conversation_services.insert_turns(connection, turns=[turn])
+            except (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError) as e:
+                logger.error(f"Rejected conversation turn {turn.id}: {e}")
+
+        return written
+
+    def _drop(self, count: int) -> None:
+        if count > 0:
+            self.dropped += count
+            logger.error(f"Dropped {count} conversation turns")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with asyncio.timeout(settings.CONVERSATION_WRITE_INTERVAL):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            await self.flush()
+
+
+conversation_writer = ConversationWriter()
@@ -1,10 +1,13 @@
 from pathlib import Path
 
 import asyncpg
+from asyncpg.connection import LoggedQuery
 from loguru import logger
 
 from app.core.config import settings
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash_async
+from app.core.tracing import tracer
+from app.core.user_cache import user_cache
 from app.core.utils import create_db_primary_key
 from app.exceptions import NoDbPoolError
 from app.services.user_services import get_user_by_email
@@ -22,6 +25,7 @@ class Database:
             host=settings.POSTGRES_HOST,
             port=settings.POSTGRES_PORT,
             max_size=10,
+            init=_init_connection,
         )
 
     async def close_pool(self) -> None:
@@ -127,6 +131,7 @@ class Database:
                     """
 
                     await connection.execute(update_query, settings.FIRST_SUPERUSER_EMAIL)
+                    await user_cache.invalidate(db_user.id)
 
                     return None
 
@@ -138,7 +143,7 @@ class Database:
                 VALUES ($1, $2, $3, $4, $5, $6)
             """
 
-            hashed_password = get_password_hash(
+            hashed_password = await get_password_hash_async(
                 settings.FIRST_SUPERUSER_PASSWORD.get_secret_value()
             )
             await connection.execute(
@@ -152,4 +157,18 @@ class Database:
             )
 
 
+async def _init_connection(connection: asyncpg.Connection) -> None:
+    connection.add_query_logger(_trace_query)
+
+
+def _trace_query(record: LoggedQuery) -> None:
+    # Called soon after the query with a copy of its context, so the query's span is current
+    tracer.record_span(
+        "db.query",
+        duration=record.elapsed,
+        error=record.exception,
+        attributes={"db.system": "postgresql", "db.statement": " ".join(record.query.split())},
+    )
+
+
 db = Database()
@@ -0,0 +1,13 @@
+import sys
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+def configure_logging() -> None:
+    logger.remove()  # Remove the default logger so log level can be set
+    if settings.LOG_TO_SCREEN_AND_FILE or settings.LOG_PATH is None:
+        logger.add(sys.stderr, level=settings.LOG_LEVEL)
+    if settings.LOG_PATH:
+        logger.add(settings.LOG_PATH, level=settings.LOG_LEVEL)
@@ -0,0 +1,170 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Final
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Set by `scripts/entrypoint.sh` so the metrics of every uvicorn worker are aggregated
+MULTIPROCESS: Final = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+HTTP_REQUEST_DURATION: Final = Histogram(
+    "scan_http_request_duration_seconds",
+    "Time taken to respond to HTTP requests",
+    ["method", "route", "status"],
+)
+STAGE_DURATION: Final = Histogram(
+    "scan_workflow_stage_duration_seconds",
+    "Time taken by each workflow stage",
+    ["stage"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+STAGE_TOKENS: Final = Histogram(
+    "scan_workflow_stage_tokens",
+    "LLM tokens used by each workflow stage",
+    ["stage", "direction"],
+    buckets=(50, 100, 250, 500, 1_000, 2_000, 4_000, 8_000, 16_000),
+)
+STAGE_ERRORS: Final = Counter(
+    "scan_workflow_stage_errors_total", "Workflow stages that returned an error", ["stage"]
+)
+STAGE_TIMEOUTS: Final = Counter(
+    "scan_workflow_stage_timeouts_total", "Workflow stages that timed out", ["stage"]
+)
+DB_POOL_CONNECTIONS: Final = Gauge(
+    "scan_db_pool_connections",
+    "Connections in the database pool",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+VALKEY_POOL_CONNECTIONS: Final = Gauge(
+    "scan_valkey_pool_connections",
+    "Connections in the Valkey pool",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+LLM_CACHE_LOOKUPS: Final = Counter(
+    "scan_llm_cache_lookups_total", "LLM cache lookups by stage and result", ["stage", "result"]
+)
+# Labelled by stage rather than model, the model names are kept out of the published metrics
+LLM_CALLS: Final = Gauge(
+    "scan_llm_calls",
+    "LLM calls running or waiting in the scheduler",
+    ["stage", "state"],
+    multiprocess_mode="livesum",
+)
+LLM_QUEUE_WAIT: Final = Histogram(
+    "scan_llm_queue_wait_seconds",
+    "Time LLM calls waited in the scheduler",
+    ["stage", "priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+PASSWORD_HASHES: Final = Gauge(
+    "scan_password_hashes",
+    "Password hashes running or waiting for a thread",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+
+_stage_timings: ContextVar[list[tuple[str, float]] | None] = ContextVar(
+    "stage_timings", default=None
+)
+
+
+def observe_stage(
+    stage: str, seconds: float, *, error: bool = False, timeout: bool = False
+) -> None:
+    STAGE_DURATION.labels(stage).observe(seconds)
+    if error:
+        STAGE_ERRORS.labels(stage).inc()
+    if timeout:
+        STAGE_TIMEOUTS.labels(stage).inc()
+
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def observe_stage_tokens(stage: str, *, input_tokens: int, output_tokens: int) -> None:
+    STAGE_TOKENS.labels(stage, "input").observe(input_tokens)
+    STAGE_TOKENS.labels(stage, "output").observe(output_tokens)
+
+
+def observe_llm_cache_lookup(stage: str, *, hit: bool) -> None:
+    LLM_CACHE_LOOKUPS.labels(stage, "hit" if hit else "miss").inc()
+
+
+def observe_llm_queue_wait(stage: str, priority: str, seconds: float) -> None:
+    LLM_QUEUE_WAIT.labels(stage, priority).observe(seconds)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """The metrics in the Prometheus text format, and the content type to serve them with."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """Records the latency of each request by route and adds a `Server-Timing` header.
+
+    The header lists the duration of every workflow stage run for the request, followed by the
+    total time taken to start the response.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return None
+
+        start = time.perf_counter()
+        status = 500
+        timings: list[tuple[str, float]] = []
+        token = _stage_timings.set(timings)
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing", _server_timing(timings, time.perf_counter() - start)
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stage_timings.reset(token)
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - start)
+
+
+def _server_timing(timings: list[tuple[str, float]], total: float) -> str:
+    entries = [f"{stage};dur={seconds * 1_000:.1f}" for stage, seconds in timings]
+    entries.append(f"total;dur={total * 1_000:.1f}")
+    return ", ".join(entries)
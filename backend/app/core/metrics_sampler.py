@@ -0,0 +1,61 @@
+import asyncio
+
+from loguru import logger
+
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.db import db
+from app.core.metrics import (
+    DB_POOL_CONNECTIONS,
+    PASSWORD_HASHES,
+    VALKEY_POOL_CONNECTIONS,
+)
+from app.core.security import password_hash_executor
+
+
+class MetricsSampler:
+    """Copies the state of the pools and queues of this worker into gauges."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return None
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._task = None
+
+    def sample(self) -> None:
+        if db.pool is not None:
+            DB_POOL_CONNECTIONS.labels("max").set(db.pool.get_max_size())
+            DB_POOL_CONNECTIONS.labels("open").set(db.pool.get_size())
+            DB_POOL_CONNECTIONS.labels("idle").set(db.pool.get_idle_size())
+
+        for state, count in cache.stats().items():
+            VALKEY_POOL_CONNECTIONS.labels(state).set(count)
+
+        password_stats = password_hash_executor.stats()
+        PASSWORD_HASHES.labels("running").set(password_stats["running"])
+        PASSWORD_HASHES.labels("queued").set(password_stats["queued"])
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Error sampling metrics: {e}")
+
+            await asyncio.sleep(settings.METRICS_SAMPLE_INTERVAL)
+
+
+metrics_sampler = MetricsSampler()
@@ -0,0 +1,134 @@
+import hashlib
+import re
+from typing import Final
+
+import valkey.asyncio as valkey
+
+from app.core.config import settings
+
+SIGNATURE_BITS: Final = 64
+# 4 bands of 16 bits, so each band bucket only holds about 1/65536 of the topics. Signatures
+# within 3 bits of each other always share a band, more distant ones are found with decreasing
+# probability.
+BANDS: Final = 4
+_BAND_BITS: Final = SIGNATURE_BITS // BANDS
+_BAND_MASK: Final = (1 << _BAND_BITS) - 1
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_topic(topic: str) -> str:
+    """Lowercase the topic and strip punctuation and repeated whitespace."""
+    topic = _PUNCTUATION.sub(" ", topic.casefold())
+    return _WHITESPACE.sub(" ", topic).strip()
+
+
+def simhash(text: str) -> int:
+    """64 bit SimHash of the words and character trigrams in the text."""
+    words = text.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:], strict=False)]
+    joined = " ".join(words)
+    features += [joined[i : i + 3] for i in range(len(joined) - 2)]
+
+    weights = [0] * SIGNATURE_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest())
+        for bit in range(SIGNATURE_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def similarity(left: int, right: int) -> float:
+    return 1 - (left ^ right).bit_count() / SIGNATURE_BITS
+
+
+class TopicIndex:
+    """Locality sensitive hashing index of answered topics, stored in Valkey.
+
+    Topics are normalized and reduced to a SimHash signature, which is split into bands. Each band
+    is a set of the topics, with their signatures, having that band. Topics that share a band are
+    candidates, and the closest candidate is returned when its similarity passes
+    `TOPIC_CACHE_THRESHOLD`. The bands expire along with the results, `TOPIC_CACHE_TTL` seconds
+    after a topic was last added to them.
+    """
+
+    def __init__(self, prefix: str = "topic-cache") -> None:
+        self.prefix = prefix
+
+    async def add(self, client: valkey.Valkey, *, topic: str, result: str) -> None:
+        normalized = normalize_topic(topic)
+        topic_id = self._topic_id(normalized)
+        signature = simhash(normalized)
+
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.set(self._result_key(topic_id), result, ex=settings.TOPIC_CACHE_TTL)
+            for band_key in self._band_keys(signature):
+                pipe.sadd(band_key, _member(topic_id, signature))
+                pipe.expire(band_key, settings.TOPIC_CACHE_TTL)
+            await pipe.execute()
+
+    async def find(self, client: valkey.Valkey, *, topic: str) -> tuple[str, float] | None:
+        """Find the stored result for the most similar topic, and its similarity."""
+        signature = simhash(normalize_topic(topic))
+
+        members = await client.sunion(self._band_keys(signature))  # type: ignore[misc]
+        signatures: dict[str, int] = {}
+        for member in members:
+            candidate_id, _, value = member.decode().partition(":")
+            # Members added before the bands held signatures have none and are skipped
+            if value:
+                signatures[candidate_id] = int(value)
+
+        ranked = sorted(
+            (
+                (similarity(signature, value), candidate_id)
+                for candidate_id, value in signatures.items()
+            ),
+            reverse=True,
+        )
+
+        for score, topic_id in ranked:
+            if score < settings.TOPIC_CACHE_THRESHOLD:
+                return None
+
+            result = await client.get(self._result_key(topic_id))
+            if result is not None:
+                return result.decode(), score
+
+            # The result has expired so the topic can be dropped from the index
+            await self._remove(client, topic_id=topic_id, signature=signatures[topic_id])
+
+        return None
+
+    async def clear(self, client: valkey.Valkey) -> None:
+        keys = [key async for key in client.scan_iter(match=f"{self.prefix}:*")]
+        if keys:
+            await client.delete(*keys)
+
+    async def _remove(self, client: valkey.Valkey, *, topic_id: str, signature: int) -> None:
+        async with client.pipeline(transaction=False) as pipe:
+            for band_key in self._band_keys(signature):
+                pipe.srem(band_key, _member(topic_id, signature))
+            await pipe.execute()
+
+    def _band_keys(self, signature: int) -> list[str]:
+        return [
+            f"{self.prefix}:band:{band}:{signature >> (band * _BAND_BITS) & _BAND_MASK}"
+            for band in range(BANDS)
+        ]
+
+    def _result_key(self, topic_id: str) -> str:
+        return f"{self.prefix}:result:{topic_id}"
+
+    @staticmethod
+    def _topic_id(normalized_topic: str) -> str:
+        return hashlib.sha256(normalized_topic.encode()).hexdigest()
+
+
+def _member(topic_id: str, signature: int) -> str:
+    return f"{topic_id}:{signature}"
+
+
+topic_index = TopicIndex()
@@ -0,0 +1,338 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Final, Literal, Protocol
+
+import httpx
+import orjson
+from loguru import logger
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.types import JsonDict
+
+# version-trace_id-parent_id-flags, see https://www.w3.org/TR/trace-context/
+_TRACEPARENT: Final = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID: Final = "0" * 32
+_INVALID_SPAN_ID: Final = "0" * 16
+_SAMPLED_FLAG: Final = 0x01
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    """The identity of a span, as passed between services in a `traceparent` header."""
+
+    trace_id: str
+    span_id: str
+    sampled: bool
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: str | None = None
+    attributes: JsonDict = field(default_factory=dict)
+    status: Literal["ok", "error"] = "ok"
+    start_time: float = field(default_factory=time.time)
+    duration: float | None = None
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.attributes["error.type"] = type(error).__name__
+        self.attributes["error.message"] = str(error)
+
+    def end(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> JsonDict:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": round((self.duration or 0.0) * 1_000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: ContextVar[SpanContext | None] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: str | bytes | None) -> SpanContext | None:
+    """The span context in a `traceparent` header, or None if it is missing or invalid."""
+    if value is None:
+        return None
+
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+
+    trace_id, span_id, flags = match.groups()
+    if trace_id == _INVALID_TRACE_ID or span_id == _INVALID_SPAN_ID:
+        return None
+
+    return SpanContext(trace_id, span_id, sampled=bool(int(flags, 16) & _SAMPLED_FLAG))
+
+
+def current_span() -> SpanContext | None:
+    return _current_span.get()
+
+
+def current_traceparent() -> str | None:
+    span = _current_span.get()
+    return span.traceparent() if span is not None else None
+
+
+class SpanExporter(Protocol):
+    async def export(self, spans: list[JsonDict]) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class FileSpanExporter:
+    """Appends spans to a JSON lines file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    async def export(self, spans: list[JsonDict]) -> None:
+        await asyncio.to_thread(self._write, spans)
+
+    async def close(self) -> None:
+        return None
+
+    def _write(self, spans: list[JsonDict]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("ab") as f:
+            f.write(b"".join(orjson.dumps(span) + b"\n" for span in spans))
+
+
+class CollectorSpanExporter:
+    """Posts batches of spans as `{"spans": [...]}` to a collector."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self._client = httpx.AsyncClient(timeout=10.0)
+
+    async def export(self, spans: list[JsonDict]) -> None:
+        response = await self._client.post(
+            self.url,
+            content=orjson.dumps({"spans": spans}),
+            headers={"Content-Type": "application/json"},
+        )
+        response.raise_for_status()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class Tracer:
+    """Records spans for a sample of traces and exports them in the background.
+
+    Whether a trace is recorded is decided once, when it starts, and passed on to every span in it
+    and to other services through the `traceparent` header. New traces are recorded at
+    `TRACING_SAMPLE_RATE`, and traces started elsewhere follow the caller's decision. Nothing is
+    recorded when `TRACING_EXPORTER` is `none`.
+    """
+
+    def __init__(self) -> None:
+        self.dropped = 0
+        self._exporter: SpanExporter | None = None
+        self._queue: deque[JsonDict] = deque()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.TRACING_EXPORTER != "none"
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return None
+
+        if settings.TRACING_EXPORTER == "file":
+            self._exporter = FileSpanExporter(settings.TRACING_FILE_PATH)
+        else:
+            self._exporter = CollectorSpanExporter(str(settings.TRACING_COLLECTOR_URL))
+
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return None
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self._task = None
+        await self.flush()
+        if self._exporter is not None:
+            await self._exporter.close()
+            self._exporter = None
+
+    @contextmanager
+    def span(
+        self, name: str, *, parent: SpanContext | None = None, attributes: JsonDict | None = None
+    ) -> Iterator[Span]:
+        """Run the body as a span, a child of `parent` or the current span.
+
+        Without either a new trace is started. Errors raised in the body mark the span as failed.
+        """
+        parent = parent or _current_span.get()
+        if parent is None:
+            context = SpanContext(
+                _new_id(128), _new_id(64), sampled=random.random() < settings.TRACING_SAMPLE_RATE
+            )
+        else:
+            context = SpanContext(parent.trace_id, _new_id(64), sampled=parent.sampled)
+
+        span = Span(
+            name,
+            context,
+            parent_id=parent.span_id if parent is not None else None,
+            attributes=attributes or {},
+        )
+        token = _current_span.set(context)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            self._record(span)
+
+    def record_span(
+        self,
+        name: str,
+        *,
+        duration: float,
+        error: BaseException | None = None,
+        attributes: JsonDict | None = None,
+    ) -> None:
+        """Record an operation that already finished as a child of the current span.
+
+        Used for operations timed by a library callback. Nothing is recorded outside of a trace.
+        """
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return None
+
+        span = Span(
+            name,
+            SpanContext(parent.trace_id, _new_id(64), sampled=True),
+            parent_id=parent.span_id,
+            attributes=attributes or {},
+            start_time=time.time() - duration,
+            duration=duration,
+        )
+        if error is not None:
+            span.record_error(error)
+
+        self._record(span)
+
+    async def flush(self) -> None:
+        if self._exporter is None:
+            return None
+
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), 512))]
+            try:
+                await self._exporter.export(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.error(f"Error exporting {len(batch)} spans: {e}")
+
+    def _record(self, span: Span) -> None:
+        if not span.context.sampled or not self.enabled:
+            return None
+
+        if len(self._queue) >= settings.TRACING_MAX_QUEUE_SIZE:
+            self.dropped += 1
+            return None
+
+        self._queue.append(span.to_dict())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TRACING_EXPORT_INTERVAL)
+            await self.flush()
+
+
+class TracingMiddleware:
+    """Runs each request in a span, continuing the trace in its `traceparent` header.
+
+    The response gets a `traceresponse` header with the request's span, so a slow response can be
+    matched with its trace.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return None
+
+        parent = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        with tracer.span(
+            f"{scope['method']} {scope['path']}",
+            parent=parent,
+            attributes={"http.method": scope["method"], "http.path": scope["path"]},
+        ) as span:
+
+            async def send_with_trace(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "error"
+                    headers = MutableHeaders(scope=message)
+                    headers.append("traceresponse", span.context.traceparent())
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.name = f"{scope['method']} {route.path}"
+                    span.set_attribute("http.route", route.path)
+
+
+async def inject_traceparent(request: httpx.Request) -> None:
+    """httpx request hook that passes the current trace on to the server being called."""
+    traceparent = current_traceparent()
+    if traceparent is not None:
+        request.headers["traceparent"] = traceparent
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+tracer = Tracer()
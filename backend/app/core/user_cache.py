@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Final
+
+from loguru import logger
+from valkey.asyncio.client import PubSub
+from valkey.exceptions import WatchError
+
+from app.core.cache import cache
+from app.core.config import settings
+from app.models.users import AuthenticatedUser
+
+INVALIDATION_CHANNEL: Final = "user-cache-invalidations"
+
+
+class UserCache:
+    """Two tier cache of authenticated users.
+
+    Each worker keeps a small LRU of users, without their hashed secrets, in front of a shared copy
+    in Valkey. Invalidations are published over Valkey pub/sub so every worker drops its local copy
+    as soon as a user changes. Each invalidation also bumps the user's generation, and a user is
+    only cached if the generation read before loading it is still current, so a load racing an
+    invalidation can't cache the old user. Errors talking to Valkey are logged and treated as a
+    miss.
+    """
+
+    def __init__(self) -> None:
+        self._local: OrderedDict[str, tuple[float, AuthenticatedUser]] = OrderedDict()
+        self._listener: asyncio.Task | None = None
+
+    async def get(self, user_id: str) -> AuthenticatedUser | None:
+        local = self._local.get(user_id)
+        if local is not None:
+            expires_at, user = local
+            if expires_at > time.monotonic():
+                self._local.move_to_end(user_id)
+                return user.model_copy()
+
+            del self._local[user_id]
+
+        if cache.client is None:
+            return None
+
+        try:
+            cached = await cache.client.get(self._key(user_id))  # type: ignore[misc]
+        except Exception as e:
+            logger.error(f"Error reading user {user_id} from the cache: {e}")
+            return None
+
+        if cached is None:
+            return None
+
+        user = AuthenticatedUser.model_validate_json(cached)
+        self._set_local(user)
+
+        return user.model_copy()
+
+    async def generation(self, user_id: str) -> bytes | None:
+        """The user's generation, read before loading the user to pass to `set`."""
+        if cache.client is None:
+            return None
+
+        try:
+            return await cache.client.get(self._generation_key(user_id))  # type: ignore[misc]
+        except Exception as e:
+            logger.error(f"Error reading the cache generation of user {user_id}: {e}")
+            return None
+
+    async def set(self, user: AuthenticatedUser, *, generation: bytes | None) -> None:
+        """Cache the user unless it was invalidated since `generation` was read."""
+        cached_user = AuthenticatedUser(**user.model_dump())
+        if cache.client is None:
+            self._set_local(cached_user)
+            return None
+
+        generation_key = self._generation_key(user.id)
+        try:
+            async with cache.client.pipeline(transaction=True) as pipeline:
+                await pipeline.watch(generation_key)
+                if await pipeline.get(generation_key) != generation:  # type: ignore[misc]
+                    logger.debug(f"User {user.id} was invalidated while loading, not caching")
+                    return None
+
+                pipeline.multi()
+                pipeline.set(
+                    self._key(user.id), cached_user.model_dump_json(), ex=settings.USER_CACHE_TTL
+                )
+                await pipeline.execute()
+        except WatchError:
+            logger.debug(f"User {user.id} was invalidated while caching, not caching")
+            return None
+        except Exception as e:
+            logger.error(f"Error caching user {user.id}: {e}")
+            return None
+
+        self._set_local(cached_user)
+
+    async def invalidate(self, user_id: str) -> None:
+        self._local.pop(user_id, None)
+        if cache.client is None:
+            return None
+
+        try:
+            async with cache.client.pipeline(transaction=True) as pipeline:
+                pipeline.incr(self._generation_key(user_id))
+                # Outlives any load that read the generation before this invalidation
+                pipeline.expire(self._generation_key(user_id), settings.USER_CACHE_TTL)
+                pipeline.delete(self._key(user_id))
+                await pipeline.execute()
+            await cache.client.publish(INVALIDATION_CHANNEL, user_id)
+        except Exception as e:
+            logger.error(f"Error invalidating cached user {user_id}: {e}")
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    async def start_listener(self) -> None:
+        if cache.client is None or self._listener is not None:
+            return None
+
+        pubsub = cache.client.pubsub()
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def stop_listener(self) -> None:
+        if self._listener is None:
+            return None
+
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+
+        self._listener = None
+
+    async def _listen(self, pubsub: PubSub) -> None:
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._local.pop(message["data"].decode(), None)
+        except Exception as e:
+            logger.error(f"Stopped listening for user cache invalidations: {e}")
+        finally:
+            await pubsub.aclose()
+
+    def _set_local(self, user: AuthenticatedUser) -> None:
+        self._local[user.id] = (time.monotonic() + settings.USER_CACHE_LOCAL_TTL, user)
+        self._local.move_to_end(user.id)
+        while len(self._local) > settings.USER_CACHE_SIZE:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"user:{user_id}"
+
+    @staticmethod
+    def _generation_key(user_id: str) -> str:
+        return f"user-generation:{user_id}"
+
+
+user_cache = UserCache()
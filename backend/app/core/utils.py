@@ -1,10 +1,14 @@
-from collections.abc import Callable
+import asyncio
+from collections.abc import Callable, Coroutine
 from typing import Any
 from uuid import uuid4
 
 from fastapi import APIRouter as FastAPIRouter
+from fastapi import Request
 from fastapi.types import DecoratedCallable
 
+from app.exceptions import ClientDisconnectedError
+
 
 class APIRouter(FastAPIRouter):
     """This resolves both paths that end in a / slash and those that don't.
@@ -36,3 +40,37 @@ class APIRouter(FastAPIRouter):
 
 def create_db_primary_key() -> str:
     return str(uuid4())
+
+
+async def cancel_on_disconnect[T](request: Request, coro: Coroutine[Any, Any, T]) -> T:
+    """Run `coro`, cancelling it as soon as the client disconnects.
+
+    The request body must already have been read. Raises `ClientDisconnectedError` once `coro`
+    has been cancelled, so the capacity it held is released before the route returns.
+    """
+    work = asyncio.create_task(coro)
+    watcher = asyncio.create_task(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait((work, watcher), return_when=asyncio.FIRST_COMPLETED)
+        if work.done():
+            return work.result()
+
+        work.cancel()
+        try:
+            await work
+        except asyncio.CancelledError:
+            pass
+
+        raise ClientDisconnectedError("The client disconnected before the response was ready")
+    finally:
+        watcher.cancel()
+        if not work.done():
+            # The route itself was cancelled
+            work.cancel()
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return None
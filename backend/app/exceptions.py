@@ -8,3 +8,15 @@ class DbUpdateError(Exception):
 
 class NoDbPoolError(Exception):
     pass
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+class CassetteMissError(Exception):
+    pass
+
+
+class ClientDisconnectedError(Exception):
+    pass
@@ -1,4 +1,3 @@
-import sys
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
@@ -7,16 +6,21 @@ from fastapi.responses import ORJSONResponse
 from loguru import logger
 from starlette.middleware.cors import CORSMiddleware
 
+from app.agents.registry import agent_registry
+from app.agents.workflow import workflow_cache
 from app.api.router import api_router
 from app.core.cache import cache
 from app.core.config import settings
+from app.core.conversation_writer import conversation_writer
 from app.core.db import db
+from app.core.logging import configure_logging
+from app.core.metrics import MetricsMiddleware, mark_process_dead
+from app.core.metrics_sampler import metrics_sampler
+from app.core.security import password_hash_executor
+from app.core.tracing import TracingMiddleware, tracer
+from app.core.user_cache import user_cache
 
-logger.remove()  # Remove the default logger so log level can be set
-if settings.LOG_TO_SCREEN_AND_FILE or settings.LOG_PATH is None:
-    logger.add(sys.stderr, level=settings.LOG_LEVEL)
-if settings.LOG_PATH:
-    logger.add(settings.LOG_PATH, level=settings.LOG_LEVEL)
+configure_logging()
 
 
 @asynccontextmanager
@@ -35,6 +39,13 @@ async def lifespan(_: FastAPI) -> AsyncGenerator:
         logger.error(f"Error applying migrations: {e}")
         raise
 
+    logger.info("Initializing cache client")
+    try:
+        await cache.create_client()
+    except Exception as e:
+        logger.error(f"Error creating cache client: {e}")
+        raise
+
     logger.info("Saving first superuser")
     try:
         await db.create_first_superuser()
@@ -42,14 +53,60 @@ async def lifespan(_: FastAPI) -> AsyncGenerator:
         logger.error(f"Error creating first superuser: {e}")
         raise e
 
-    logger.info("Initializing cache client")
+    logger.info("Listening for user cache invalidations")
     try:
-        await cache.create_client()
+        await user_cache.start_listener()
     except Exception as e:
-        logger.error(f"Error creating cache client: {e}")
+        logger.error(f"Error listening for user cache invalidations: {e}")
+        raise
+
+    logger.info("Initializing agents")
+    try:
+        await agent_registry.create_agents()
+    except Exception as e:
+        logger.error(f"Error creating agents: {e}")
         raise
 
+    logger.info("Compiling workflow")
+    try:
+        workflow_cache.compile()
+    except Exception as e:
+        logger.error(f"Error compiling workflow: {e}")
+        raise
+
+    logger.info("Starting metrics sampler")
+    metrics_sampler.start()
+
+    logger.info("Starting tracer")
+    tracer.start()
+
+    logger.info("Starting conversation writer")
+    conversation_writer.start()
+
     yield
+    logger.info("Stopping conversation writer")
+    await conversation_writer.stop()
+
+    logger.info("Stopping tracer")
+    await tracer.stop()
+
+    logger.info("Stopping metrics sampler")
+    await metrics_sampler.stop()
+    mark_process_dead()
+
+    logger.info("Stopping user cache invalidation listener")
+    await user_cache.stop_listener()
+
+    logger.info("Closing agents")
+    try:
+        await agent_registry.close()
+    except Exception as e:
+        logger.error(f"Error closing agents: {e}")
+        raise
+
+    logger.info("Closing password hash executor")
+    password_hash_executor.shutdown()
+
     logger.info("Closing database connection pool")
     try:
         await db.close_pool()
@@ -74,4 +131,7 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
 app.include_router(api_router)
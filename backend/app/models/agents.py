@@ -1,4 +1,29 @@
+from typing import Annotated
+
 from camel_converter.pydantic_base import CamelBase
+from pydantic import PrivateAttr
+
+
+def merge_stage_outputs(
+    left: dict[str, str] | None, right: dict[str, str] | None
+) -> dict[str, str] | None:
+    """Combine stage outputs so stages running concurrently don't overwrite each other."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+
+    return {**left, **right}
+
+
+def merge_failed_stages(left: list[str] | None, right: list[str] | None) -> list[str] | None:
+    """Combine failed stages so stages running concurrently can all record a failure."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+
+    return left + [stage for stage in right if stage not in left]
 
 
 class SubTask(CamelBase):
@@ -10,13 +35,21 @@ class SubTask(CamelBase):
 class AgentState(CamelBase):
     task: str
     stage: str
+    conversation_id: str | None = None
     response: str | None = None
     subtasks: list[str] | None = None
     feedback: str | None = None
     previous_response: str | None = None
     feedback_history: list[str] | None = None
+    history_summary: str | None = None
     scanaq_results: str | None = None
+    stage_outputs: Annotated[dict[str, str] | None, merge_stage_outputs] = None
+    failed_stages: Annotated[list[str] | None, merge_failed_stages] = None
+    # The encoded fields as they were read from Valkey, so saving only writes what changed
+    _saved_fields: dict[str, bytes] | None = PrivateAttr(default=None)
 
 
 class Topic(CamelBase):
     topic: str
+    # Continues this conversation rather than the one saved for the user
+    conversation_id: str | None = None
@@ -0,0 +1,13 @@
+from datetime import datetime
+
+from camel_converter.pydantic_base import CamelBase
+
+from app.models.agents import AgentState
+
+
+class ConversationTurn(CamelBase):
+    id: str
+    conversation_id: str
+    user_id: str
+    state: AgentState
+    created_at: datetime
@@ -0,0 +1,13 @@
+from typing import Literal
+
+from camel_converter.pydantic_base import CamelBase
+
+from app.models.agents import AgentState
+
+type IdempotencyStatus = Literal["in_progress", "complete"]
+
+
+class IdempotencyRecord(CamelBase):
+    status: IdempotencyStatus = "in_progress"
+    fingerprint: str
+    response: AgentState | None = None
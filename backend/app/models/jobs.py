@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Literal
+
+from camel_converter.pydantic_base import CamelBase
+
+from app.models.agents import AgentState
+
+type JobStatus = Literal["queued", "running", "complete", "failed"]
+
+
+class ChatJob(CamelBase):
+    id: str
+    user_id: str
+    status: JobStatus = "queued"
+    created_at: datetime
+    result: AgentState | None = None
+    error: str | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("complete", "failed")
@@ -58,8 +58,13 @@ class UsersPublic(CamelBase):
     count: int
 
 
-class UserInDb(UserBase):
+class AuthenticatedUser(UserBase):
+    """A user as cached for authentication, without the hashed secrets."""
+
     id: str
+    last_login: datetime
+
+
+class UserInDb(AuthenticatedUser):
     hashed_password: str
     hashed_openai_api_key: str | None
-    last_login: datetime
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Any, Final
+from uuid import uuid4
+
+import orjson
+import zstandard
+from loguru import logger
+from valkey.exceptions import WatchError
+
+from app.core.config import settings
+from app.core.conversation_writer import conversation_writer
+from app.core.topic_index import topic_index
+from app.core.utils import create_db_primary_key
+from app.models.agents import AgentState, Topic
+from app.models.conversations import ConversationTurn
+
+if TYPE_CHECKING:
+    from valkey.asyncio import Valkey
+
+AGENT_STATE_TTL = 300
+# Part of the key, so a state saved in a layout this code can't read expires instead of being read
+_AGENT_STATE_LAYOUT: Final = 1
+# Changed on every write, so a turn only writes its changes over the state it started from
+_VERSION_FIELD: Final = "_version"
+# Reset when the state is read, so they aren't saved
+_UNSAVED_FIELDS: Final = frozenset({"stage", "stage_outputs", "failed_stages"})
+_PLAIN: Final = b"j"
+_COMPRESSED: Final = b"z"
+
+
+async def get_agent_state(cache_client: Valkey, *, user_id: str, topic: Topic) -> AgentState:
+    """The user's conversation state.
+
+    The state saved in Valkey is used unless the topic names another conversation. Otherwise the
+    conversation the topic names, or the user's newest one if it had the same topic, is resumed
+    from Postgres, and failing that a new conversation is started.
+    """
+    saved_fields = await cache_client.hgetall(_agent_state_key(user_id))  # type: ignore[misc]
+    saved_state = _decode_state(saved_fields, user_id=user_id)
+    if saved_state is not None and topic.conversation_id not in (
+        None,
+        saved_state.conversation_id,
+    ):
+        saved_state = None
+
+    initial_state = (
+        saved_state
+        or await _resume_conversation(user_id, topic=topic)
+        or AgentState(task=topic.topic, stage="task_delegation")
+    )
+
+    initial_state.conversation_id = initial_state.conversation_id or create_db_primary_key()
+    initial_state.stage = "task_delegation"
+    initial_state.stage_outputs = None
+    initial_state.failed_stages = None
+
+    return initial_state
+
+
+async def save_agent_state(
+    cache_client: Valkey, *, user_id: str, state: AgentState, previous: AgentState | None = None
+) -> None:
+    """Cache the state for the user's next turn and queue the turn to be written to Postgres.
+
+    The state is saved as a hash with a field for each value, large values zstd compressed, and a
+    version that changes on every write. When `previous`, the state the turn started from, was
+    read from Valkey, and the saved version is still the one it was read at, only the fields that
+    changed since are written. So a turn writes about as much as it changed rather than the whole
+    conversation. Otherwise, such as when another turn of the user saved first, the whole state
+    is written, so the saved state is always that of a single turn.
+    """
+    saved_state = state.model_copy(update={"previous_response": state.response})
+    fields = _encode_state(saved_state)
+    saved_fields = previous._saved_fields if previous is not None else None
+    key = _agent_state_key(user_id)
+
+    if saved_fields is None or not await _write_changes(
+        cache_client, key=key, fields=fields, saved_fields=saved_fields
+    ):
+        await _write_state(cache_client, key=key, fields=fields)
+
+    if saved_state.conversation_id is not None:
+        conversation_writer.add(
+            ConversationTurn(
+                id=create_db_primary_key(),
+                conversation_id=saved_state.conversation_id,
+                user_id=user_id,
+                state=saved_state,
+                created_at=datetime.now(UTC),
+            )
+        )
+
+
+async def find_similar_answer(
+    cache_client: Valkey, *, topic: Topic, conversation_id: str | None
+) -> AgentState | None:
+    match = await topic_index.find(cache_client, topic=topic.topic)
+    if match is None:
+        return None
+
+    result, _ = match
+    state = AgentState(**orjson.loads(result))
+    state.task = topic.topic
+    state.conversation_id = conversation_id
+
+    return state
+
+
+async def save_answer(cache_client: Valkey, *, state: AgentState) -> None:
+    await topic_index.add(cache_client, topic=state.task, result=state.model_dump_json())
+
+
+async def answer_from_topic_cache(
+    cache_client: Valkey, *, user_id: str, state: AgentState
+) -> AgentState | None:
+    """A stored answer to a near duplicate topic, saved as the user's state.
+
+    Only a new conversation is answered from the topic cache, and if the lookup fails the question
+    is answered as usual.
+    """
+    if not settings.TOPIC_CACHE_ENABLED or not _is_new_conversation(state):
+        return None
+
+    try:
+        similar_state = await find_similar_answer(
+            cache_client, topic=Topic(topic=state.task), conversation_id=state.conversation_id
+        )
+    except Exception as e:
+        logger.error(f"An error occurred while looking for a similar topic: {e}")
+        return None
+
+    if similar_state is not None:
+        await _save_turn(cache_client, user_id=user_id, state=similar_state, previous=state)
+
+    return similar_state
+
+
+async def save_answered_state(
+    cache_client: Valkey, *, user_id: str, state: AgentState, previous: AgentState
+) -> None:
+    """Save the state the workflow answered from `previous`.
+
+    The answer to a new conversation is also added to the topic cache. Errors are logged rather
+    than raised, so the answer is still returned.
+    """
+    await _save_turn(cache_client, user_id=user_id, state=state, previous=previous)
+
+    # An answer missing the output of a failed stage shouldn't be served to other users
+    if (
+        not settings.TOPIC_CACHE_ENABLED
+        or not _is_new_conversation(previous)
+        or state.failed_stages
+    ):
+        return None
+
+    try:
+        await save_answer(cache_client, state=state)
+    except Exception as e:
+        logger.error(f"An error occurred while saving the answer to the topic cache: {e}")
+
+
+async def _save_turn(
+    cache_client: Valkey, *, user_id: str, state: AgentState, previous: AgentState
+) -> None:
+    try:
+        await save_agent_state(cache_client, user_id=user_id, state=state, previous=previous)
+    except Exception as e:
+        logger.error(f"An error occurred while caching the agent state for user {user_id}: {e}")
+
+
+async def _resume_conversation(user_id: str, *, topic: Topic) -> AgentState | None:
+    try:
+        turn = await conversation_writer.get_latest(user_id, conversation_id=topic.conversation_id)
+    except Exception as e:
+        logger.error(f"An error occurred while resuming the conversation of user {user_id}: {e}")
+        return None
+
+    # Without a conversation id only a repeated topic continues the conversation
+    if turn is None or (topic.conversation_id is None and turn.state.task != topic.topic):
+        return None
+
+    return turn.state
+
+
+async def _write_state(cache_client: Valkey, *, key: str, fields: dict[str, bytes]) -> None:
+    """Replace the whole saved state, dropping any field the new state doesn't have."""
+    async with cache_client.pipeline(transaction=True) as pipeline:
+        pipeline.delete(key)
+        fields = {**fields, _VERSION_FIELD: _new_version()}
+        pipeline.hset(key, mapping=fields)  # type: ignore[arg-type]
+        pipeline.expire(key, AGENT_STATE_TTL)
+        await pipeline.execute()
+
+
+async def _write_changes(
+    cache_client: Valkey, *, key: str, fields: dict[str, bytes], saved_fields: dict[str, bytes]
+) -> bool:
+    """Write the fields that differ from `saved_fields` and refresh the TTL.
+
+    Returns False without writing if the saved state is no longer the one `saved_fields` were
+    read from, because another turn saved since or it expired.
+    """
+    read_version = saved_fields.get(_VERSION_FIELD)
+    changed = {name: value for name, value in fields.items() if saved_fields.get(name) != value}
+    removed = [name for name in saved_fields if name not in fields and name != _VERSION_FIELD]
+
+    async with cache_client.pipeline(transaction=True) as pipeline:
+        try:
+            await pipeline.watch(key)
+            version = await pipeline.hget(key, _VERSION_FIELD)  # type: ignore[misc]
+            if read_version is None or version != read_version:
+                return False
+
+            pipeline.multi()
+            if removed:
+                pipeline.hdel(key, *removed)
+            changed[_VERSION_FIELD] = _new_version()
+            pipeline.hset(key, mapping=changed)  # type: ignore[arg-type]
+            pipeline.expire(key, AGENT_STATE_TTL)
+            await pipeline.execute()
+        except WatchError:
+            return False
+
+    return True
+
+
+def _new_version() -> bytes:
+    return uuid4().hex.encode()
+
+
+def _encode_state(state: AgentState) -> dict[str, bytes]:
+    values = state.model_dump(exclude=set(_UNSAVED_FIELDS), exclude_none=True)
+    return {name: _encode_field(value) for name, value in values.items()}
+
+
+def _encode_field(value: Any) -> bytes:
+    data = orjson.dumps(value)
+    if len(data) > settings.AGENT_STATE_COMPRESSION_THRESHOLD:
+        return _COMPRESSED + zstandard.compress(data)
+
+    return _PLAIN + data
+
+
+def _decode_state(saved_fields: dict[bytes, bytes], *, user_id: str) -> AgentState | None:
+    if not saved_fields:
+        return None
+
+    fields = {name.decode(): value for name, value in saved_fields.items()}
+    try:
+        values = {
+            name: _decode_field(value) for name, value in fields.items() if name != _VERSION_FIELD
+        }
+        state = AgentState(**values, stage="task_delegation")
+    except Exception as e:
+        logger.error(f"An error occurred while reading the agent state of user {user_id}: {e}")
+        return None
+
+    state._saved_fields = fields
+    return state
+
+
+def _decode_field(value: bytes) -> Any:
+    tag, data = value[:1], value[1:]
+    if tag == _COMPRESSED:
+        data = zstandard.decompress(data)
+    elif tag != _PLAIN:
+        raise ValueError(f"Unknown agent state field encoding {tag!r}")
+
+    return orjson.loads(data)
+
+
+def _is_new_conversation(state: AgentState) -> bool:
+    return state.previous_response is None
+
+
+def _agent_state_key(user_id: str) -> str:
+    return f"{user_id}-agent-state:{_AGENT_STATE_LAYOUT}"
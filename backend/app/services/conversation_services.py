@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from app.models.agents import AgentState
+from app.models.conversations import ConversationTurn
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+    from asyncpg import Connection as DbConnection
+
+
+async def insert_turns(conn: DbConnection, *, turns: list[ConversationTurn]) -> int:
+    """Insert a batch of turns, and create or touch their conversations, in two statements.
+
+    Turns of users that no longer exist are skipped. Returns the number of turns inserted.
+    """
+    conversations: dict[str, tuple[str, datetime, datetime]] = {}
+    for turn in turns:
+        _, created_at, updated_at = conversations.get(
+            turn.conversation_id, (turn.user_id, turn.created_at, turn.created_at)
+        )
+        conversations[turn.conversation_id] = (
+            turn.user_id,
+            min(created_at, turn.created_at),
+            max(updated_at, turn.created_at),
+        )
+
+    conversations_query = """
+    INSERT INTO conversations (id, user_id, created_at, updated_at)
+    SELECT c.id, c.user_id, c.created_at, c.updated_at
+    FROM unnest($1::text[], $2::text[], $3::timestamptz[], $4::timestamptz[])
+        AS c (id, user_id, created_at, updated_at)
+    JOIN users u ON u.id = c.user_id
+    ON CONFLICT (id) DO UPDATE
+    SET updated_at = GREATEST(conversations.updated_at, EXCLUDED.updated_at)
+    """
+
+    turns_query = """
+    INSERT INTO conversation_turns (id, conversation_id, task, response, state, created_at)
+    SELECT t.id, t.conversation_id, t.task, t.response, t.state, t.created_at
+    FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::jsonb[], $6::timestamptz[])
+        AS t (id, conversation_id, task, response, state, created_at)
+    JOIN conversations c ON c.id = t.conversation_id
+    ON CONFLICT (id) DO NOTHING
+    """
+
+    async with conn.transaction():
+        await conn.execute(
+            conversations_query,
+            list(conversations),
+            [user_id for user_id, _, _ in conversations.values()],
+            [created_at for _, created_at, _ in conversations.values()],
+            [updated_at for _, _, updated_at in conversations.values()],
+        )
+        status = await conn.execute(
+            turns_query,
+            [turn.id for turn in turns],
+            [turn.conversation_id for turn in turns],
+            [turn.state.task for turn in turns],
+            [turn.state.response for turn in turns],
+            [turn.state.model_dump_json() for turn in turns],
+            [turn.created_at for turn in turns],
+        )
+
+    # The status is "INSERT 0 <rows>"
+    return int(status.split()[-1])
+
+
+async def get_latest_turn(
+    conn: DbConnection, *, user_id: str, since: datetime, conversation_id: str | None = None
+) -> ConversationTurn | None:
+    query = """
+    SELECT t.id,
+        t.conversation_id,
+        c.user_id,
+        t.state,
+        t.created_at
+    FROM conversations c
+    JOIN conversation_turns t ON t.conversation_id = c.id
+    WHERE c.user_id = $1 AND c.updated_at > $2 AND ($3::text IS NULL OR c.id = $3)
+    ORDER BY t.created_at DESC
+    LIMIT 1
+    """
+    db_turn = await conn.fetchrow(query, user_id, since, conversation_id)
+
+    if not db_turn:
+        return None
+
+    return ConversationTurn(
+        id=db_turn["id"],
+        conversation_id=db_turn["conversation_id"],
+        user_id=db_turn["user_id"],
+        state=AgentState.model_validate_json(db_turn["state"]),
+        created_at=db_turn["created_at"],
+    )
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING, Final
+
+from app.core.config import settings
+from app.models.idempotency import IdempotencyRecord
+
+if TYPE_CHECKING:
+    from valkey.asyncio import Valkey
+
+    from app.models.agents import AgentState
+
+# How often a waiting request re-reads the record in case it missed the notification
+_POLL_INTERVAL: Final = 1.0
+
+
+def create_key(user_id: str, idempotency_key: str) -> str:
+    """The record key for an `Idempotency-Key` header, which is scoped to the user."""
+    return f"idempotency:{user_id}:{idempotency_key}"
+
+
+def create_fingerprint(*parts: str) -> str:
+    """Hash of the request, so a key reused for a different request can be rejected."""
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+async def claim(
+    cache_client: Valkey, *, key: str, fingerprint: str, ttl: int | None = None
+) -> IdempotencyRecord | None:
+    """Mark the key as in progress for `ttl` seconds, `IDEMPOTENCY_LOCK_TTL` by default.
+
+    Returns None if this request now owns the key and should run, otherwise the record of the
+    request that already used it.
+    """
+    record = IdempotencyRecord(fingerprint=fingerprint).model_dump_json()
+    while True:
+        claimed = await cache_client.set(  # type: ignore[misc]
+            key, record, nx=True, ex=ttl or settings.IDEMPOTENCY_LOCK_TTL
+        )
+        if claimed:
+            return None
+
+        existing = await get_record(cache_client, key=key)
+        # Otherwise the record expired between the two commands
+        if existing is not None:
+            return existing
+
+
+async def get_record(cache_client: Valkey, *, key: str) -> IdempotencyRecord | None:
+    record = await cache_client.get(key)  # type: ignore[misc]
+    if record is None:
+        return None
+
+    return IdempotencyRecord.model_validate_json(record)
+
+
+async def complete(
+    cache_client: Valkey,
+    *,
+    key: str,
+    fingerprint: str,
+    response: AgentState,
+    ttl: int | None = None,
+) -> None:
+    """Store the response for `ttl` seconds, `IDEMPOTENCY_TTL` by default, and wake any requests
+    waiting on it.
+    """
+    record = IdempotencyRecord(status="complete", fingerprint=fingerprint, response=response)
+    await cache_client.set(  # type: ignore[misc]
+        key, record.model_dump_json(), ex=ttl or settings.IDEMPOTENCY_TTL
+    )
+    await cache_client.publish(_record_channel(key), record.status)
+
+
+async def release(cache_client: Valkey, *, key: str) -> None:
+    """Give up the key after a failure, so a retry runs the request again."""
+    await cache_client.delete(key)
+    await cache_client.publish(_record_channel(key), "released")
+
+
+async def wait(cache_client: Valkey, *, key: str) -> IdempotencyRecord | None:
+    """Wait for the request holding the key to finish.
+
+    Returns the completed record, or None if the request failed or its marker expired.
+    """
+    pubsub = cache_client.pubsub()
+    try:
+        # Subscribe before reading the record so the notification can't be missed in between
+        await pubsub.subscribe(_record_channel(key))
+        while True:
+            record = await get_record(cache_client, key=key)
+            if record is None or record.status == "complete":
+                return record
+
+            await pubsub.get_message(ignore_subscribe_messages=True, timeout=_POLL_INTERVAL)
+    finally:
+        await pubsub.aclose()
+
+
+def _record_channel(key: str) -> str:
+    return f"{key}:updates"
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Final
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.tracing import current_traceparent
+from app.models.jobs import ChatJob
+
+if TYPE_CHECKING:
+    from valkey.asyncio import Valkey
+
+    from app.models.agents import AgentState
+
+JOB_STREAM: Final = "chat-jobs"
+JOB_GROUP: Final = "chat-workers"
+
+
+async def create_job(cache_client: Valkey, *, user_id: str, state: AgentState) -> ChatJob:
+    """Save a queued job and add it to the stream for the workers to pick up.
+
+    The current trace is passed on to the worker so the job shows up in the request's trace.
+    """
+    job = ChatJob(id=str(uuid4()), user_id=user_id, created_at=datetime.now(UTC))
+    await save_job(cache_client, job=job)
+    fields = {"job_id": job.id, "state": state.model_dump_json()}
+    traceparent = current_traceparent()
+    if traceparent is not None:
+        fields["traceparent"] = traceparent
+
+    await cache_client.xadd(
+        JOB_STREAM,
+        fields,
+        maxlen=settings.CHAT_JOB_STREAM_MAXLEN,
+        approximate=True,
+    )
+
+    return job
+
+
+async def get_job(cache_client: Valkey, *, job_id: str) -> ChatJob | None:
+    job = await cache_client.get(_job_key(job_id))  # type: ignore[misc]
+    if job is None:
+        return None
+
+    return ChatJob.model_validate_json(job)
+
+
+async def save_job(cache_client: Valkey, *, job: ChatJob) -> None:
+    """Save the job and notify anyone waiting on it."""
+    data = job.model_dump_json()
+    await cache_client.set(_job_key(job.id), data, ex=settings.CHAT_JOB_TTL)  # type: ignore[misc]
+    await cache_client.publish(job_channel(job.id), data)
+
+
+def job_channel(job_id: str) -> str:
+    return f"chat-job:{job_id}:updates"
+
+
+def _job_key(job_id: str) -> str:
+    return f"chat-job:{job_id}"
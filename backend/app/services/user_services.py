@@ -2,10 +2,12 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash_async, verify_password_async
+from app.core.user_cache import user_cache
 from app.core.utils import create_db_primary_key
 from app.exceptions import DbInsertError, DbUpdateError
 from app.models.users import (
+    AuthenticatedUser,
     UpdatePassword,
     UserCreate,
     UserInDb,
@@ -23,7 +25,7 @@ async def authenticate(conn: DbConnection, *, email: str, password: str) -> User
 
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    if not await verify_password_async(password, db_user.hashed_password):
         return None
 
     return db_user
@@ -48,7 +50,7 @@ async def create_user(conn: DbConnection, *, user: UserCreate) -> UserInDb:
         create_db_primary_key(),
         user.email,
         user.full_name,
-        get_password_hash(user.password),
+        await get_password_hash_async(user.password),
         user.is_active,
         user.is_superuser,
     )
@@ -64,6 +66,7 @@ async def create_user(conn: DbConnection, *, user: UserCreate) -> UserInDb:
 async def delete_user(conn: DbConnection, *, user_id: str) -> None:
     query = "DELETE FROM users WHERE id = $1"
     await conn.execute(query, user_id)
+    await user_cache.invalidate(user_id)
 
 
 async def get_users(conn: DbConnection, *, offset: int, limit: int) -> list[UserInDb] | None:
@@ -167,7 +170,7 @@ async def get_user_public_by_id(conn: DbConnection, *, user_id: str) -> UserPubl
 async def update_user(
     conn: DbConnection,
     *,
-    db_user: UserInDb,
+    db_user: AuthenticatedUser,
     user_in: UserUpdate | UserUpdateMe | UpdatePassword,
 ) -> UserInDb:
     if isinstance(user_in, UpdatePassword):
@@ -177,13 +180,16 @@ async def update_user(
         WHERE id = $2
         """
 
-        await conn.execute(query, get_password_hash(user_in.new_password), db_user.id)
+        hashed_password = await get_password_hash_async(user_in.new_password)
+        await conn.execute(query, hashed_password, db_user.id)
     else:
         user_data = user_in.model_dump(exclude_unset=True)
         if "password" in user_data:
-            user_data["hashed_password"] = get_password_hash(user_data.pop("password"))
+            user_data["hashed_password"] = await get_password_hash_async(user_data.pop("password"))
         if "openai_api_key" in user_data:
-            user_data["hashed_openai_api_key"] = get_password_hash(user_data.pop("openai_api_key"))
+            user_data["hashed_openai_api_key"] = await get_password_hash_async(
+                user_data.pop("openai_api_key")
+            )
         set_clause = ", ".join([f"{key} = ${i + 2}" for i, key in enumerate(user_data.keys())])
         query = f"""
         UPDATE users
@@ -193,6 +199,7 @@ async def update_user(
 
         await conn.execute(query, db_user.id, *user_data.values())
 
+    await user_cache.invalidate(db_user.id)
     updated_user = await get_user_by_id(conn, user_id=db_user.id)
 
     if not updated_user:
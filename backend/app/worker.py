@@ -0,0 +1,239 @@
+import asyncio
+import os
+import signal
+import socket
+from typing import Final
+
+from loguru import logger
+from valkey.asyncio import Valkey
+from valkey.exceptions import ResponseError
+
+from app.agents.deadline import request_deadline
+from app.agents.registry import agent_registry
+from app.agents.scheduler import llm_priority
+from app.agents.single_flight import run_workflow
+from app.agents.workflow import workflow_cache
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.conversation_writer import conversation_writer
+from app.core.db import db
+from app.core.logging import configure_logging
+from app.core.tracing import parse_traceparent, tracer
+from app.exceptions import DeadlineExceededError
+from app.models.agents import AgentState
+from app.models.jobs import ChatJob
+from app.services import chat_services, job_services
+
+# How long a read waits for new jobs before checking for stale jobs and shutdown again
+READ_BLOCK_MS: Final = 5_000
+
+
+class ChatJobWorker:
+    """Answers the chat jobs queued by `POST /chat/jobs`.
+
+    Workers read from the job stream as members of one consumer group, so each job goes to a
+    single worker. A job is only acknowledged once its result is saved, and jobs left pending by a
+    worker that died are claimed by another after `CHAT_JOB_CLAIM_IDLE` seconds.
+    """
+
+    def __init__(self, name: str | None = None) -> None:
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    async def run(self, client: Valkey) -> None:
+        await self._create_group(client)
+        logger.info(f"Worker {self.name} waiting for chat jobs")
+
+        while not self._stopping.is_set():
+            free = settings.CHAT_JOB_WORKER_CONCURRENCY - len(self._tasks)
+            if free <= 0:
+                await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            try:
+                messages = await self._claim_stale(client, count=free)
+                if not messages:
+                    messages = await self._read(client, count=free)
+            except Exception as e:
+                logger.error(f"Error reading chat jobs: {e}")
+                await asyncio.sleep(READ_BLOCK_MS / 1000)
+                continue
+
+            for message_id, fields in messages:
+                task = asyncio.create_task(self.handle(client, message_id, fields))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+        if self._tasks:
+            logger.info(f"Waiting for {len(self._tasks)} chat jobs to finish")
+            await asyncio.gather(*self._tasks)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def handle(self, client: Valkey, message_id: bytes, fields: dict[bytes, bytes]) -> None:
+        job_id = fields[b"job_id"].decode()
+        with tracer.span(
+            "chat_job",
+            parent=parse_traceparent(fields.get(b"traceparent")),
+            attributes={"job.id": job_id},
+        ):
+            await self._handle(client, message_id, job_id=job_id, fields=fields)
+
+    async def _handle(
+        self, client: Valkey, message_id: bytes, *, job_id: str, fields: dict[bytes, bytes]
+    ) -> None:
+        try:
+            job = await job_services.get_job(client, job_id=job_id)
+            if job is None or job.finished:
+                # The job expired, or a previous worker saved the result but died before the ack
+                await client.xack(job_services.JOB_STREAM, job_services.JOB_GROUP, message_id)
+                return None
+
+            job.status = "running"
+            await job_services.save_job(client, job=job)
+
+            try:
+                job.result = await self._answer(
+                    client, job=job, state=AgentState.model_validate_json(fields[b"state"])
+                )
+                job.status = "complete"
+            except (DeadlineExceededError, TimeoutError) as e:
+                logger.error(f"Timed out answering chat job {job_id}: {e}")
+                job.status = "failed"
+                job.error = "Timed out getting an answer, please try again"
+            except Exception as e:
+                logger.error(f"An error occurred while answering chat job {job_id}: {e}")
+                job.status = "failed"
+                job.error = "An error occurred when getting an answer"
+
+            await job_services.save_job(client, job=job)
+            await client.xack(job_services.JOB_STREAM, job_services.JOB_GROUP, message_id)
+        except Exception as e:
+            # Left pending so another worker picks it up once it has been idle long enough
+            logger.error(f"Error handling chat job {job_id}: {e}")
+
+    async def _answer(self, client: Valkey, *, job: ChatJob, state: AgentState) -> AgentState:
+        similar_state = await chat_services.answer_from_topic_cache(
+            client, user_id=job.user_id, state=state
+        )
+        if similar_state:
+            return similar_state
+
+        with (
+            llm_priority("batch"),
+            request_deadline(settings.CHAT_JOB_TIMEOUT),
+            tracer.span("workflow"),
+        ):
+            result = await run_workflow(client, workflow=workflow_cache.get(), state=state)
+
+        current_state = AgentState(**result)
+        await chat_services.save_answered_state(
+            client, user_id=job.user_id, state=current_state, previous=state
+        )
+
+        return current_state
+
+    async def _create_group(self, client: Valkey) -> None:
+        try:
+            await client.xgroup_create(
+                job_services.JOB_STREAM, job_services.JOB_GROUP, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _read(self, client: Valkey, *, count: int) -> list[tuple[bytes, dict[bytes, bytes]]]:
+        response = await client.xreadgroup(
+            job_services.JOB_GROUP,
+            self.name,
+            {job_services.JOB_STREAM: ">"},
+            count=count,
+            block=READ_BLOCK_MS,
+        )
+        if not response:
+            return []
+
+        _, messages = response[0]
+        return messages
+
+    async def _claim_stale(
+        self, client: Valkey, *, count: int
+    ) -> list[tuple[bytes, dict[bytes, bytes]]]:
+        _, messages, *_ = await client.xautoclaim(
+            job_services.JOB_STREAM,
+            job_services.JOB_GROUP,
+            self.name,
+            min_idle_time=settings.CHAT_JOB_CLAIM_IDLE * 1000,
+            count=count,
+        )
+        return [(message_id, fields) for message_id, fields in messages if fields]
+
+
+async def main() -> None:
+    configure_logging()
+
+    logger.info("Initializing database connection pool")
+    try:
+        await db.create_pool()
+    except Exception as e:
+        logger.error(f"Error creating db connection pool: {e}")
+        raise
+
+    logger.info("Initializing cache client")
+    try:
+        await cache.create_client()
+    except Exception as e:
+        logger.error(f"Error creating cache client: {e}")
+        raise
+
+    logger.info("Initializing agents")
+    try:
+        await agent_registry.create_agents()
+    except Exception as e:
+        logger.error(f"Error creating agents: {e}")
+        raise
+
+    logger.info("Compiling workflow")
+    try:
+        workflow_cache.compile()
+    except Exception as e:
+        logger.error(f"Error compiling workflow: {e}")
+        raise
+
+    if cache.client is None:
+        raise RuntimeError("The cache client was not created")
+
+    logger.info("Starting tracer")
+    tracer.start()
+
+    logger.info("Starting conversation writer")
+    conversation_writer.start()
+
+    worker = ChatJobWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run(cache.client)
+    finally:
+        logger.info("Stopping conversation writer")
+        await conversation_writer.stop()
+
+        logger.info("Stopping tracer")
+        await tracer.stop()
+
+        logger.info("Closing agents")
+        await agent_registry.close()
+
+        logger.info("Closing database connection pool")
+        await db.close_pool()
+
+        logger.info("Closing cache client")
+        await cache.close_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
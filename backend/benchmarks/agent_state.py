@@ -0,0 +1,132 @@
+"""Compares saving the agent state as one JSON blob against saving only its changed fields.
+
+Reports the bytes sent to Valkey, and the latency, of saving a turn against the length of the
+conversation. Needs a running Valkey server configured through the usual settings. Run from the
+backend directory with `uv run python -m benchmarks.agent_state`.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import string
+import time
+from collections.abc import Iterable
+from typing import Any
+
+import valkey.asyncio as valkey
+
+from app.core.config import settings
+from app.core.conversation_writer import conversation_writer
+from app.models.agents import AgentState, Topic
+from app.services import chat_services
+
+_WORDS = [
+    "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(2_000)
+]
+_USER_ID = "agent-state-benchmark"
+_BLOB_KEY = f"{_USER_ID}-blob"
+_STATE_KEY = chat_services._agent_state_key(_USER_ID)
+
+
+class _CountingConnection(valkey.Connection):
+    bytes_sent = 0
+
+    async def send_packed_command(
+        self, command: bytes | str | Iterable[bytes], check_health: bool = True
+    ) -> None:
+        if not isinstance(command, bytes | str):
+            # Counted and then sent, so it can't be a one-shot iterator
+            command = list(command)
+
+        chunks = [command] if isinstance(command, bytes | str) else command
+        _CountingConnection.bytes_sent += sum(
+            len(chunk.encode() if isinstance(chunk, str) else chunk) for chunk in chunks
+        )
+        await super().send_packed_command(command, check_health)
+
+
+def _text(words: int) -> str:
+    return " ".join(random.choices(_WORDS, k=words))
+
+
+async def _measure(save: Any) -> tuple[int, float]:
+    _CountingConnection.bytes_sent = 0
+    start = time.perf_counter()
+    await save
+    return _CountingConnection.bytes_sent, (time.perf_counter() - start) * 1_000
+
+
+async def _save_blob(client: valkey.Valkey, state: AgentState) -> None:
+    # How the state was saved before it was split into fields
+    cache_state = state.model_copy(update={"previous_response": state.response}, deep=True)
+    await client.set(_BLOB_KEY, cache_state.model_dump_json(), ex=chat_services.AGENT_STATE_TTL)
+
+
+async def _run(lengths: list[int], turns: int) -> None:
+    pool = valkey.ConnectionPool(
+        host=settings.VALKEY_HOST,
+        port=settings.VALKEY_PORT,
+        password=settings.VALKEY_PASSWORD.get_secret_value(),
+        connection_class=_CountingConnection,
+    )
+    client = valkey.Valkey.from_pool(pool)
+    topic = Topic(topic="Should I learn Rust?")
+
+    print(f"{'history':>8} {'blob bytes':>11} {'field bytes':>12} {'blob ms':>9} {'field ms':>9}")
+    try:
+        for length in lengths:
+            await client.delete(_BLOB_KEY, _STATE_KEY)
+            state = AgentState(
+                task=topic.topic,
+                stage="task_delegation",
+                response=_text(250),
+                feedback_history=[_text(40) for _ in range(length)],
+                history_summary=_text(150),
+            )
+            await _save_blob(client, state)
+            await chat_services.save_agent_state(client, user_id=_USER_ID, state=state)
+
+            blob_bytes, blob_ms, field_bytes, field_ms = [], [], [], []
+            for _ in range(turns):
+                previous = await chat_services.get_agent_state(
+                    client, user_id=_USER_ID, topic=topic
+                )
+                state = previous.model_copy(
+                    update={"response": _text(250), "subtasks": [_text(8) for _ in range(3)]}
+                )
+
+                sent, elapsed = await _measure(_save_blob(client, state))
+                blob_bytes.append(sent)
+                blob_ms.append(elapsed)
+                sent, elapsed = await _measure(
+                    chat_services.save_agent_state(
+                        client, user_id=_USER_ID, state=state, previous=previous
+                    )
+                )
+                field_bytes.append(sent)
+                field_ms.append(elapsed)
+                conversation_writer.clear()
+
+            print(
+                f"{length:>8} {statistics.mean(blob_bytes):>11.0f} "
+                f"{statistics.mean(field_bytes):>12.0f} {statistics.mean(blob_ms):>9.3f} "
+                f"{statistics.mean(field_ms):>9.3f}"
+            )
+    finally:
+        await client.delete(_BLOB_KEY, _STATE_KEY)
+        await client.aclose()
+        await pool.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[0, 10, 100, 1_000])
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    asyncio.run(_run(args.lengths, args.turns))
+
+
+if __name__ == "__main__":
+    main()
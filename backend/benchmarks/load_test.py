@@ -0,0 +1,302 @@
+"""Load tests the chat, user and health endpoints at increasing concurrency.
+
+By default the app runs in process through `httpx.ASGITransport` with the fake LLM backend, and
+its LLM rate limits lifted so only the app itself is measured. It needs the Postgres and Valkey
+servers configured through the usual settings. Pass `--url` to load test a running server
+instead, started with `LLM_BACKEND=fake`; DB pool wait and event loop lag are then only
+reported for the in process app.
+
+In the default `workflow` mode every virtual user signs in as its own user and asks a topic no
+other request has asked, and the in process app runs with single-flight, the topic cache and the
+LLM cache off, so each chat request runs the whole workflow. A running server should be started
+with those settings off too. The `cached` mode has every virtual user share one user and a few
+topics, to measure requests served by single-flight and the caches as configured.
+
+Run from the backend directory with `uv run python -m benchmarks.load_test`.
+"""
+
+import argparse
+import asyncio
+import random
+import string
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Final, Literal
+
+import asyncpg
+import httpx
+
+from app.core.config import settings
+from app.core.db import db
+from app.main import app
+
+_TOPICS = [
+    "Should I learn Rust or Go next?",
+    "How do I prepare for a job interview?",
+    "Should I move to a new city for work?",
+    "How can I get better at managing my time?",
+    "Is it worth going back to school?",
+]
+
+_WORDS = [
+    "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(2_000)
+]
+_USER_PASSWORD: Final = "load-test-password"
+
+type Mode = Literal["workflow", "cached"]
+
+MODES: Final[dict[Mode, str]] = {
+    "workflow": "a user per virtual user, unique topics, single-flight and caches off",
+    "cached": "one shared user and topics, single-flight and caches as configured",
+}
+
+
+def _topic(mode: Mode) -> str:
+    if mode == "cached":
+        return random.choice(_TOPICS)
+
+    # Random words, so no two topics are close enough to be served from the topic cache
+    return f"{random.choice(_TOPICS)} {' '.join(random.choices(_WORDS, k=12))}"
+
+
+# Name: (method, path, body factory)
+ENDPOINTS: dict[str, tuple[str, str, Callable[[Mode], dict[str, Any] | None]]] = {
+    "chat": ("POST", "/chat", lambda mode: {"topic": _topic(mode)}),
+    "users-me": ("GET", "/users/me", lambda mode: None),
+    "health": ("GET", "/health", lambda mode: None),
+}
+
+
+@dataclass
+class StepResult:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    pool_waits: list[float] = field(default_factory=list)
+    loop_lags: list[float] = field(default_factory=list)
+
+
+class _TimedPool:
+    """Wraps the app's connection pool to record how long each acquire waits."""
+
+    def __init__(self, pool: asyncpg.Pool) -> None:
+        self.pool = pool
+        self.waits: list[float] = []
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        start = time.perf_counter()
+        async with self.pool.acquire() as connection:
+            self.waits.append(time.perf_counter() - start)
+            yield connection
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.pool, name)
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+async def _measure_loop_lag(lags: list[float], interval: float = 0.01) -> None:
+    while True:
+        start = time.perf_counter()
+        try:
+            await asyncio.sleep(interval)
+        finally:
+            # Also recorded when cancelled, in case the requests never let this task run
+            lags.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def _login(client: httpx.AsyncClient, *, email: str, password: str) -> None:
+    response = await client.post(
+        "/login/access-token", data={"username": email, "password": password}
+    )
+    response.raise_for_status()
+    # Set directly as the login cookie is marked secure outside of local development
+    client.cookies.set("access_token", f"Bearer {response.json()['access_token']}")
+
+
+async def _create_users(
+    admin: httpx.AsyncClient, *, count: int, **client_options: Any
+) -> list[httpx.AsyncClient]:
+    """A client signed in as a separate load test user for each virtual user."""
+    clients = []
+    for i in range(count):
+        email = f"load-test-{i}@example.com"
+        response = await admin.post(
+            "/users/",
+            json={"email": email, "password": _USER_PASSWORD, "fullName": f"Load Test {i}"},
+        )
+        # Already created by an earlier run
+        if response.status_code != 400:
+            response.raise_for_status()
+
+        client = httpx.AsyncClient(**client_options)
+        await _login(client, email=email, password=_USER_PASSWORD)
+        clients.append(client)
+
+    return clients
+
+
+async def _run_step(
+    clients: list[httpx.AsyncClient],
+    endpoint: str,
+    *,
+    mode: Mode,
+    concurrency: int,
+    duration: float,
+) -> StepResult:
+    method, path, body = ENDPOINTS[endpoint]
+    result = StepResult()
+    timed_pool = db.pool if isinstance(db.pool, _TimedPool) else None
+    if timed_pool is not None:
+        timed_pool.waits = result.pool_waits
+
+    async def user(client: httpx.AsyncClient) -> None:
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body(mode))
+                if response.is_error:
+                    result.errors += 1
+            except httpx.HTTPError:
+                result.errors += 1
+            result.latencies.append(time.perf_counter() - start)
+
+    lag_task = asyncio.create_task(_measure_loop_lag(result.loop_lags)) if timed_pool else None
+    end = time.perf_counter() + duration
+    await asyncio.gather(*(user(clients[i % len(clients)]) for i in range(concurrency)))
+    if lag_task is not None:
+        lag_task.cancel()
+
+    return result
+
+
+def _print_header() -> None:
+    print(
+        f"{'endpoint':<10} {'users':>5} {'requests':>8} {'errors':>6} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'pool p95':>8} {'lag p99':>8} {'lag max':>8}"
+    )
+
+
+def _print_step(
+    endpoint: str, concurrency: int, duration: float, result: StepResult, in_process: bool
+) -> None:
+    def ms(value: float) -> str:
+        return f"{value * 1_000:>8.1f}"
+
+    pool = ms(_percentile(result.pool_waits, 95)) if in_process else f"{'n/a':>8}"
+    lag_p99 = ms(_percentile(result.loop_lags, 99)) if in_process else f"{'n/a':>8}"
+    lag_max = ms(max(result.loop_lags, default=0.0)) if in_process else f"{'n/a':>8}"
+    print(
+        f"{endpoint:<10} {concurrency:>5} {len(result.latencies):>8} {result.errors:>6} "
+        f"{len(result.latencies) / duration:>8.1f} {ms(_percentile(result.latencies, 50))} "
+        f"{ms(_percentile(result.latencies, 95))} {ms(_percentile(result.latencies, 99))} "
+        f"{pool} {lag_p99} {lag_max}"
+    )
+
+
+@asynccontextmanager
+async def _in_process_app(args: argparse.Namespace) -> AsyncIterator[httpx.AsyncBaseTransport]:
+    # Agents are created in the lifespan so these have to be set before it runs
+    settings.LLM_BACKEND = "fake"
+    settings.FAKE_LLM_LATENCY_MEAN = args.llm_latency
+    settings.FAKE_LLM_TOKENS_PER_SECOND = args.llm_tokens_per_second
+    settings.LLM_REQUESTS_PER_MINUTE = 1_000_000_000
+    settings.LLM_TOKENS_PER_MINUTE = 1_000_000_000
+    settings.LLM_MAX_CONCURRENCY = 1_000_000
+    if args.mode == "workflow":
+        settings.SINGLE_FLIGHT_ENABLED = False
+        settings.TOPIC_CACHE_ENABLED = False
+        settings.LLM_CACHE_STAGES = []
+
+    async with app.router.lifespan_context(app):
+        if db.pool is not None:
+            db.pool = _TimedPool(db.pool)  # type: ignore[assignment]
+        try:
+            yield httpx.ASGITransport(app=app)
+        finally:
+            if isinstance(db.pool, _TimedPool):
+                db.pool = db.pool.pool
+
+
+async def _run(args: argparse.Namespace) -> None:
+    in_process = args.url is None
+    app_context: AbstractAsyncContextManager[httpx.AsyncBaseTransport | None] = (
+        _in_process_app(args) if in_process else nullcontext()
+    )
+
+    async with app_context as transport:
+        client_options: dict[str, Any] = {
+            "transport": transport,
+            "base_url": args.url or f"http://127.0.0.1{settings.API_V1_PREFIX}",
+            "limits": httpx.Limits(max_connections=max(args.concurrency)),
+            "timeout": args.timeout,
+        }
+        async with httpx.AsyncClient(**client_options) as admin:
+            await _login(
+                admin,
+                email=settings.FIRST_SUPERUSER_EMAIL,
+                password=settings.FIRST_SUPERUSER_PASSWORD.get_secret_value(),
+            )
+            clients = (
+                await _create_users(admin, count=max(args.concurrency), **client_options)
+                if args.mode == "workflow"
+                else [admin]
+            )
+            try:
+                print(f"Mode: {args.mode}, {MODES[args.mode]}")
+                _print_header()
+                for endpoint in args.endpoints:
+                    for concurrency in args.concurrency:
+                        result = await _run_step(
+                            clients,
+                            endpoint,
+                            mode=args.mode,
+                            concurrency=concurrency,
+                            duration=args.duration,
+                        )
+                        _print_step(endpoint, concurrency, args.duration, result, in_process)
+            finally:
+                for client in clients:
+                    if client is not admin:
+                        await client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--url", help="Base URL of a running server, e.g. http://127.0.0.1:8000/api/v1"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=list(MODES),
+        default="workflow",
+        help="What the chat requests measure, see above",
+    )
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 10, 25, 50])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per step")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument(
+        "--llm-latency",
+        type=float,
+        default=0.5,
+        help="Mean in process fake LLM time to first token",
+    )
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    args = parser.parse_args()
+
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Measures near-duplicate topic lookups against the size of the topic index.
+
+Needs a running Valkey server configured through the usual settings. Run from the backend
+directory with `uv run python -m benchmarks.topic_index`.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import string
+import time
+
+from app.core.cache import cache
+from app.core.topic_index import TopicIndex
+
+_WORDS = [
+    "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(2_000)
+]
+
+
+def _random_topic() -> str:
+    return " ".join(random.choices(_WORDS, k=random.randint(6, 14)))
+
+
+async def _run(sizes: list[int], lookups: int) -> None:
+    await cache.create_client()
+    if cache.client is None:
+        raise RuntimeError("No cache client created")
+
+    index = TopicIndex(prefix="topic-cache-benchmark")
+    await index.clear(cache.client)
+    topics: list[str] = []
+
+    print(f"{'index size':>10} {'mean ms':>9} {'p95 ms':>9} {'hit rate':>9}")
+    try:
+        for size in sizes:
+            while len(topics) < size:
+                topic = _random_topic()
+                topics.append(topic)
+                await index.add(cache.client, topic=topic, result=topic)
+
+            timings = []
+            hits = 0
+            for topic in random.choices(topics, k=lookups):
+                # Near duplicate of an indexed topic
+                query = f"{topic.upper()}?"
+                start = time.perf_counter()
+                match = await index.find(cache.client, topic=query)
+                timings.append((time.perf_counter() - start) * 1_000)
+                hits += match is not None and match[0] == topic
+
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            print(f"{size:>10} {statistics.mean(timings):>9.3f} {p95:>9.3f} {hits / lookups:>9.2%}")
+    finally:
+        await index.clear(cache.client)
+        await cache.close_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(_run(args.sizes, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
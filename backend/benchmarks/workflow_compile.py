@@ -0,0 +1,37 @@
+"""Compares building the workflow graph per request against reusing the cached graph.
+
+Run from the backend directory with `uv run python -m benchmarks.workflow_compile`.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+
+from app.agents.workflow import create_workflow, workflow_cache
+
+
+def _time_per_call(func: Callable[[], object], iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    workflow_cache.compile()
+    per_request = _time_per_call(create_workflow, args.iterations)
+    cached = _time_per_call(workflow_cache.get, args.iterations)
+
+    print(f"iterations:             {args.iterations}")
+    print(f"compile per request:    {per_request * 1_000:.3f} ms")
+    print(f"cached graph:           {cached * 1_000:.3f} ms")
+    print(f"saved per request:      {(per_request - cached) * 1_000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.agents.checkpoint import invoke_workflow
+from app.agents.registry import agent_registry
+from app.agents.single_flight import run_workflow
+from app.agents.workflow import STAGES, create_workflow
+from app.core.config import settings
+from app.models.agents import AgentState
+
+
+def count_calls(monkeypatch, *, failing_stage):
+    """Count the calls to each stage's agent, timing out the first call to `failing_stage`."""
+    calls = dict.fromkeys(STAGES, 0)
+    for stage in STAGES:
+        agent = agent_registry.get_agent(stage)
+
+        async def process(state, stage=stage, process=agent.process):
+            calls[stage] += 1
+            if stage == failing_stage and calls[stage] == 1:
+                # After the stages running alongside it have finished
+                await asyncio.sleep(0.1)
+                raise TimeoutError
+            return await process(state)
+
+        monkeypatch.setattr(agent, "process", process)
+
+    return calls
+
+
+@pytest.mark.parametrize(
+    "mode, failing_stage", (("sequential", "conflict_detection"), ("parallel", "reward_processing"))
+)
+async def test_failed_run_resumes(mode, failing_stage, fake_llm, test_cache, monkeypatch):
+    monkeypatch.setattr(settings, "WORKFLOW_MODE", mode)
+    calls = count_calls(monkeypatch, failing_stage=failing_stage)
+    workflow = create_workflow()
+    state = AgentState(task="test", stage="task_delegation")
+
+    with pytest.raises(TimeoutError):
+        await invoke_workflow(workflow, state=state, run_id="run")
+    result = await invoke_workflow(workflow, state=state, run_id="run")
+
+    assert set(result["stage_outputs"]) == set(STAGES)
+    assert calls == {stage: 2 if stage == failing_stage else 1 for stage in STAGES}
+    assert await test_cache.client.keys("workflow-checkpoint:*") == []
+
+
+async def test_finished_run_starts_again(fake_llm, monkeypatch):
+    calls = count_calls(monkeypatch, failing_stage=None)
+    workflow = create_workflow()
+    state = AgentState(task="test", stage="task_delegation")
+
+    await invoke_workflow(workflow, state=state, run_id="run")
+    await invoke_workflow(workflow, state=state, run_id="run")
+
+    assert calls == dict.fromkeys(STAGES, 2)
+
+
+async def test_checkpoints_disabled(fake_llm, test_cache, monkeypatch):
+    monkeypatch.setattr(settings, "WORKFLOW_CHECKPOINTS_ENABLED", False)
+    calls = count_calls(monkeypatch, failing_stage="conflict_detection")
+    workflow = create_workflow()
+    state = AgentState(task="test", stage="task_delegation")
+
+    with pytest.raises(TimeoutError):
+        await invoke_workflow(workflow, state=state, run_id="run")
+    await invoke_workflow(workflow, state=state, run_id="run")
+
+    assert calls["task_delegation"] == 2
+    assert await test_cache.client.keys("workflow-checkpoint:*") == []
+
+
+async def test_failed_run_resumes_with_summary(fake_llm, test_cache, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_THRESHOLD", 50)
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_KEEP_ENTRIES", 1)
+    calls = count_calls(monkeypatch, failing_stage="conflict_detection")
+    summary_agent = agent_registry.get_agent("history_summary")
+    summaries = 0
+
+    async def summarize(state, process=summary_agent.process):
+        nonlocal summaries
+        summaries += 1
+        return await process(state)
+
+    monkeypatch.setattr(summary_agent, "process", summarize)
+    workflow = create_workflow()
+    state = AgentState(
+        task="test",
+        stage="task_delegation",
+        conversation_id="conversation",
+        feedback_history=["more detail " * 30, "Mention jobs"],
+    )
+
+    with pytest.raises(TimeoutError):
+        await run_workflow(test_cache.client, workflow=workflow, state=state)
+    result = await run_workflow(test_cache.client, workflow=workflow, state=state)
+
+    assert summaries == 1
+    assert result["feedback_history"] == ["Mention jobs"]
+    assert calls["task_delegation"] == 1
@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from openai import APIConnectionError
+
+from app.agents.deadline import request_deadline, stage_timeout, time_remaining
+from app.agents.registry import agent_registry
+from app.core.config import settings
+from app.exceptions import DeadlineExceededError
+from app.models.agents import AgentState
+
+
+class FlakyChatModel(FakeListChatModel):
+    failures: int = 0
+
+    async def ainvoke(self, *args, **kwargs):
+        if self.failures > 0:
+            self.failures -= 1
+            raise APIConnectionError(request=httpx.Request("POST", "http://test"))
+
+        return await super().ainvoke(*args, **kwargs)
+
+
+def test_no_deadline():
+    assert time_remaining() is None
+    assert stage_timeout() == settings.AGENT_TIMEOUT
+
+
+def test_stage_timeout_capped_by_deadline():
+    with request_deadline(1.0):
+        assert 0 < stage_timeout() <= 1.0
+
+    assert time_remaining() is None
+
+
+def test_nested_deadline_cannot_extend():
+    with request_deadline(1.0), request_deadline(60.0):
+        remaining = time_remaining()
+        assert remaining is not None
+        assert remaining <= 1.0
+
+
+def test_stage_timeout_after_deadline():
+    with request_deadline(0.0), pytest.raises(DeadlineExceededError):
+        stage_timeout()
+
+
+async def test_deadline_inherited_by_tasks():
+    async def get_remaining():
+        return time_remaining()
+
+    with request_deadline(1.0):
+        remaining = await asyncio.create_task(get_remaining())
+
+    assert remaining is not None
+    assert remaining <= 1.0
+
+
+async def test_retries_transient_errors(monkeypatch):
+    agent = agent_registry.get_agent("conflict_detection")
+    monkeypatch.setattr(agent, "llm", FlakyChatModel(responses=["answer"], failures=2))
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.01)
+
+    result = await agent.process(AgentState(task="test", stage="conflict_detection"))
+
+    assert result == {"response": "answer", "error": False}
+
+
+async def test_retries_stop_at_deadline(monkeypatch):
+    agent = agent_registry.get_agent("conflict_detection")
+    monkeypatch.setattr(agent, "llm", FlakyChatModel(responses=["answer"], failures=2))
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 5.0)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_DELAY", 5.0)
+
+    with request_deadline(0.0):
+        result = await agent.process(AgentState(task="test", stage="conflict_detection"))
+
+    assert result["error"] is True
@@ -0,0 +1,41 @@
+import pytest
+
+from app.agents.history import summarize_history
+from app.agents.registry import agent_registry
+from app.core.config import settings
+from app.models.agents import AgentState
+
+
+@pytest.fixture
+def long_history(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_THRESHOLD", 50)
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_KEEP_ENTRIES", 2)
+    return AgentState(
+        task="Should I learn Rust?",
+        stage="task_delegation",
+        feedback_history=[f"Feedback {i}: " + "more detail " * 5 for i in range(6)],
+    )
+
+
+async def test_summarize_history_below_threshold(fake_llm):
+    state = AgentState(
+        task="Should I learn Rust?", stage="task_delegation", feedback_history=["Too short"]
+    )
+
+    assert await summarize_history(state) is state
+
+
+async def test_summarize_history(long_history, fake_llm):
+    state = await summarize_history(long_history)
+
+    assert state.history_summary == "Subtasks:\n1. history_summary response"
+    assert state.feedback_history == long_history.feedback_history[-2:]
+
+
+async def test_summarize_history_error_keeps_history(long_history, monkeypatch):
+    async def fail(state):
+        return {"response": "Request timed out. Please try again.", "error": True}
+
+    monkeypatch.setattr(agent_registry.get_agent("history_summary"), "process", fail)
+
+    assert await summarize_history(long_history) is long_history
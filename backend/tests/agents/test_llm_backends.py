@@ -0,0 +1,105 @@
+import time
+from typing import Literal
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.agents.agents import DLPFCAgent, _process_response
+from app.agents.llm_backends import CassetteChatModel, FakeChatModel, get_cassette
+from app.core.config import settings
+from app.exceptions import CassetteMissError
+from app.models.agents import AgentState
+
+
+def _fake_model(
+    *,
+    latency_distribution: Literal["constant", "uniform", "lognormal"] = "constant",
+    latency_mean: float = 0.05,
+    seed: int | None = None,
+) -> FakeChatModel:
+    return FakeChatModel(
+        latency_distribution=latency_distribution,
+        latency_mean=latency_mean,
+        tokens_per_second=1000,
+        seed=seed,
+    )
+
+
+async def test_fake_model_response_is_parsable():
+    response = await _fake_model().ainvoke([HumanMessage(content="test")])
+
+    result = _process_response(response.content)
+
+    assert result["subtasks"] is not None
+    assert isinstance(response, AIMessage)
+    assert response.usage_metadata is not None
+    assert response.usage_metadata["output_tokens"] > 0
+
+
+async def test_fake_model_latency():
+    start = time.perf_counter()
+    await _fake_model(latency_mean=0.2).ainvoke([HumanMessage(content="test")])
+
+    assert time.perf_counter() - start >= 0.2
+
+
+async def test_fake_model_streams_tokens():
+    chunks = [chunk async for chunk in _fake_model().astream([HumanMessage(content="test")])]
+
+    assert len(chunks) > 10
+    assert "".join(str(chunk.content) for chunk in chunks) == _fake_model().response
+
+
+def test_fake_model_seeded_latency():
+    first = _fake_model(latency_distribution="lognormal", seed=1)
+    second = _fake_model(latency_distribution="lognormal", seed=1)
+
+    assert [first._latency() for _ in range(5)] == [second._latency() for _ in range(5)]
+
+
+def test_fake_model_zero_lognormal_latency():
+    model = _fake_model(latency_distribution="lognormal", latency_mean=0)
+
+    assert model._latency() == 0
+
+
+def test_fake_backend(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKEND", "fake")
+
+    agent = DLPFCAgent()
+
+    assert isinstance(agent.llm, FakeChatModel)
+
+
+async def test_record_then_replay(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    messages = [HumanMessage(content="test")]
+    recorder = CassetteChatModel(
+        model_name="gpt-4o", cassette_path=path, recorder=FakeListChatModel(responses=["answer"])
+    )
+
+    recorded = await recorder.ainvoke(messages)
+    get_cassette.cache_clear()
+    replayed = await CassetteChatModel(model_name="gpt-4o", cassette_path=path).ainvoke(messages)
+
+    assert recorded.content == "answer"
+    assert replayed.content == "answer"
+
+
+async def test_replay_miss(tmp_path):
+    model = CassetteChatModel(model_name="gpt-4o", cassette_path=tmp_path / "cassette.jsonl")
+
+    with pytest.raises(CassetteMissError):
+        await model.ainvoke([HumanMessage(content="test")])
+
+
+async def test_agent_with_fake_backend(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKEND", "fake")
+    monkeypatch.setattr(settings, "FAKE_LLM_LATENCY_DISTRIBUTION", "constant")
+    monkeypatch.setattr(settings, "FAKE_LLM_LATENCY_MEAN", 0.01)
+    monkeypatch.setattr(settings, "FAKE_LLM_TOKENS_PER_SECOND", 1000.0)
+
+    result = await DLPFCAgent().process(AgentState(task="test", stage="task_delegation"))
+
+    assert "subtasks" in result
@@ -0,0 +1,48 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.agents.llm_cache import llm_cache
+from app.agents.registry import agent_registry
+from app.core.config import settings
+from app.models.agents import AgentState
+
+
+class FakeChatOpenAI(FakeListChatModel):
+    model_name: str = "fake-model"
+    temperature: float | None = 0.7
+    max_tokens: int | None = None
+
+
+async def test_cached_stage_reuses_response(monkeypatch):
+    agent = agent_registry.get_agent("emotional_regulation")
+    monkeypatch.setattr(agent, "llm", FakeChatOpenAI(responses=["first", "second"]))
+    monkeypatch.setattr(settings, "LLM_CACHE_STAGES", ["emotional_regulation"])
+    state = AgentState(task="test", stage="emotional_regulation")
+
+    first = await agent.process(state)
+    second = await agent.process(state)
+
+    assert first["response"] == "first"
+    assert second["response"] == "first"
+    assert llm_cache.stats()["emotional_regulation"]["hits"] >= 1
+
+
+async def test_uncached_stage_calls_llm(monkeypatch):
+    agent = agent_registry.get_agent("reward_processing")
+    monkeypatch.setattr(agent, "llm", FakeChatOpenAI(responses=["first", "second"]))
+    monkeypatch.setattr(settings, "LLM_CACHE_STAGES", [])
+    state = AgentState(task="test", stage="reward_processing")
+
+    await agent.process(state)
+    result = await agent.process(state)
+
+    assert result["response"] == "second"
+
+
+async def test_cache_evicts_oldest_entries(monkeypatch, test_cache):
+    monkeypatch.setattr(settings, "LLM_CACHE_MAX_ENTRIES", 2)
+
+    for i in range(3):
+        await llm_cache.set(f"llm-cache:{i}", str(i))
+
+    assert await test_cache.client.get("llm-cache:0") is None
+    assert await test_cache.client.get("llm-cache:2") == b"2"
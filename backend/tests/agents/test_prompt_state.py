@@ -0,0 +1,108 @@
+import pytest
+
+from app.agents.agents import MPFCAgent
+from app.agents.prompt_state import (
+    estimate_by_characters,
+    estimate_with_tiktoken,
+    render_prompt_state,
+)
+from app.models.agents import AgentState
+
+
+def test_render_prompt_state_drops_duplicated_fields():
+    state = AgentState(
+        task="Should I learn Rust?",
+        stage="emotional_regulation",
+        subtasks=["Weigh the time", "Look at jobs"],
+        response="Yes",
+        previous_response="Yes",
+        feedback="Too short",
+        stage_outputs={"task_delegation": "Weigh the time"},
+    )
+
+    variables = render_prompt_state(state, budget=1_000)
+
+    assert variables["state"] == (
+        "Stage: emotional_regulation\nSubtasks: Weigh the time; Look at jobs"
+    )
+    assert variables["task"] == "Should I learn Rust?"
+    assert variables["previous_response"] == "Yes"
+    assert variables["feedback"] == "Too short"
+    assert variables["feedback_history"] == "No feedback history"
+    assert variables["stage_outputs"] == "task_delegation: Weigh the time"
+
+
+def test_render_prompt_state_keeps_newest_history():
+    state = AgentState(
+        task="Should I learn Rust?",
+        stage="task_delegation",
+        feedback_history=[f"feedback {i} " * 10 for i in range(20)],
+    )
+
+    history = render_prompt_state(state, budget=200, estimate=estimate_by_characters)[
+        "feedback_history"
+    ]
+
+    assert history.startswith("(")
+    assert "earlier entries omitted" in history
+    assert history.endswith("feedback 19 ")
+    assert "feedback 0 " not in history
+
+
+def test_render_prompt_state_includes_history_summary():
+    state = AgentState(
+        task="Should I learn Rust?",
+        stage="task_delegation",
+        feedback_history=["Mention the job market"],
+        history_summary="Prefers short answers",
+    )
+
+    history = render_prompt_state(state, budget=1_000)["feedback_history"]
+
+    assert history == (
+        "Summary of earlier feedback: Prefers short answers\n- Mention the job market"
+    )
+
+
+def test_render_prompt_state_truncates_to_budget():
+    state = AgentState(
+        task="Should I learn Rust?",
+        stage="task_delegation",
+        previous_response="word " * 5_000,
+        feedback="more " * 1_000,
+        feedback_history=["history " * 1_000],
+    )
+
+    variables = render_prompt_state(state, budget=500, estimate=estimate_by_characters)
+
+    total = sum(
+        estimate_by_characters(value) for name, value in variables.items() if name != "task"
+    )
+    assert total <= 520
+    assert variables["previous_response"].endswith("[truncated]")
+    assert variables["feedback_history"].endswith("[truncated]")
+    assert len(variables["previous_response"]) > len(variables["feedback"])
+
+
+def test_estimate_with_tiktoken():
+    try:
+        tokens = estimate_with_tiktoken("Should I learn Rust?")
+    except Exception:
+        pytest.skip("The tiktoken encoding couldn't be loaded")
+
+    assert 0 < tokens < 10
+
+
+def test_agent_prompt_uses_rendered_state():
+    state = AgentState(
+        task="Should I learn Rust?",
+        stage="final_evaluation",
+        previous_response="Unique previous response",
+        stage_outputs={"reward_processing": "Worth it"},
+    )
+
+    (message,) = MPFCAgent()._format_prompt(state)
+
+    assert "Current State: Stage: final_evaluation\n" in str(message.content)
+    assert str(message.content).count("Unique previous response") == 1
+    assert "reward_processing: Worth it" in str(message.content)
@@ -0,0 +1,44 @@
+from langchain_openai import ChatOpenAI
+from pydantic import SecretStr
+
+from app.agents.agents import DLPFCAgent
+from app.agents.registry import STAGE_AGENTS, AgentRegistry
+from app.core.config import settings
+
+
+async def test_get_agent_reuses_agent():
+    registry = AgentRegistry()
+    agent = registry.get_agent("task_delegation")
+
+    assert isinstance(agent, DLPFCAgent)
+    assert registry.get_agent("task_delegation") is agent
+
+    await registry.close()
+
+
+async def test_agents_share_http_client():
+    registry = AgentRegistry()
+    await registry.create_agents()
+    clients = set()
+    for stage in STAGE_AGENTS:
+        llm = registry.get_agent(stage).llm
+        assert isinstance(llm, ChatOpenAI)
+        clients.add(id(llm.http_async_client))
+
+    assert len(clients) == 1
+
+    await registry.close()
+
+
+async def test_model_change_creates_new_agent(monkeypatch):
+    registry = AgentRegistry()
+    agent = registry.get_agent("task_delegation")
+    monkeypatch.setattr(settings, "DLPFC_MODEL", SecretStr("gpt-4o-mini"))
+
+    new_agent = registry.get_agent("task_delegation")
+
+    assert new_agent is not agent
+    assert isinstance(new_agent.llm, ChatOpenAI)
+    assert new_agent.llm.model_name == "gpt-4o-mini"
+
+    await registry.close()
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.agents.registry import agent_registry
+from app.agents.scheduler import ModelLimiter, llm_priority, llm_scheduler
+from app.models.agents import AgentState
+
+
+def _limiter(max_concurrency=1, requests_per_minute=6000, tokens_per_minute=100_000):
+    return ModelLimiter(
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+    )
+
+
+async def test_limits_concurrency():
+    limiter = _limiter()
+    await limiter.acquire(tokens=10, priority="interactive")
+    waiting = asyncio.create_task(limiter.acquire(tokens=10, priority="interactive"))
+    await asyncio.sleep(0.01)
+
+    assert not waiting.done()
+    assert limiter.stats.queued == 1
+
+    limiter.release()
+    await asyncio.wait_for(waiting, timeout=1)
+
+    assert limiter.stats.running == 1
+
+
+async def test_interactive_before_batch():
+    limiter = _limiter()
+    await limiter.acquire(tokens=10, priority="interactive")
+    order = []
+
+    async def acquire(priority):
+        await limiter.acquire(tokens=10, priority=priority)
+        order.append(priority)
+        limiter.release()
+
+    batch = asyncio.create_task(acquire("batch"))
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(acquire("interactive"))
+    await asyncio.sleep(0)
+    limiter.release()
+    await asyncio.gather(batch, interactive)
+
+    assert order == ["interactive", "batch"]
+
+
+async def test_waits_for_request_budget():
+    limiter = _limiter(max_concurrency=10, requests_per_minute=600)
+    limiter.requests.available = 0
+
+    await asyncio.wait_for(limiter.acquire(tokens=10, priority="interactive"), timeout=1)
+
+    assert limiter.stats.max_wait_seconds > 0
+
+
+async def test_cancelled_waiter_leaves_queue():
+    limiter = _limiter()
+    await limiter.acquire(tokens=10, priority="interactive")
+    waiting = asyncio.create_task(limiter.acquire(tokens=10, priority="interactive"))
+    await asyncio.sleep(0)
+    waiting.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert limiter.stats.queued == 0
+    limiter.release()
+    assert limiter.stats.running == 0
+
+
+async def test_agent_calls_go_through_scheduler(fake_llm):
+    agent = agent_registry.get_agent("reward_processing")
+    with llm_priority("batch"):
+        await agent.process(AgentState(task="test", stage="reward_processing"))
+
+    stats = llm_scheduler.stats()[agent.model]
+    assert stats["running"] == 0
+    assert stats["wait_count"]["batch"] >= 1
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from app.agents.single_flight import SingleFlight
+from app.models.agents import AgentState
+
+
+def create_run(calls, *, delay=0.1, error=None):
+    async def run():
+        calls.append(None)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return AgentState(task="test", stage="__end__", response="answer").model_dump()
+
+    return run
+
+
+def test_key_normalizes_topic():
+    key = SingleFlight.create_key(AgentState(task="Should I learn Rust?", stage="task_delegation"))
+
+    assert key == SingleFlight.create_key(
+        AgentState(task="should i  learn rust", stage="task_delegation")
+    )
+    assert key != SingleFlight.create_key(
+        AgentState(task="Should I learn Rust?", stage="task_delegation", previous_response="No")
+    )
+
+
+async def test_concurrent_runs_share_result(test_cache):
+    single_flight = SingleFlight()
+    calls: list[None] = []
+
+    results = await asyncio.gather(
+        *(single_flight.run(test_cache.client, key="same", run=create_run(calls)) for _ in range(3))
+    )
+
+    assert len(calls) == 1
+    assert all(result["response"] == "answer" for result in results)
+
+
+async def test_different_keys_run_separately(test_cache):
+    single_flight = SingleFlight()
+    calls: list[None] = []
+
+    await asyncio.gather(
+        single_flight.run(test_cache.client, key="one", run=create_run(calls)),
+        single_flight.run(test_cache.client, key="two", run=create_run(calls)),
+    )
+
+    assert len(calls) == 2
+
+
+async def test_run_continues_while_a_caller_waits(test_cache):
+    single_flight = SingleFlight()
+    calls: list[None] = []
+    first = asyncio.create_task(
+        single_flight.run(test_cache.client, key="same", run=create_run(calls))
+    )
+    second = asyncio.create_task(
+        single_flight.run(test_cache.client, key="same", run=create_run(calls))
+    )
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    result = await second
+
+    assert result["response"] == "answer"
+    assert len(calls) == 1
+
+
+async def test_run_cancelled_with_last_caller(test_cache):
+    single_flight = SingleFlight()
+    calls: list[None] = []
+    caller = asyncio.create_task(
+        single_flight.run(test_cache.client, key="same", run=create_run(calls, delay=10))
+    )
+    await asyncio.sleep(0.01)
+    caller.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+
+    assert not single_flight._flights
+
+
+async def test_runs_shared_across_workers(test_cache):
+    calls: list[None] = []
+
+    results = await asyncio.gather(
+        SingleFlight().run(test_cache.client, key="same", run=create_run(calls)),
+        SingleFlight().run(test_cache.client, key="same", run=create_run(calls)),
+    )
+
+    assert len(calls) == 1
+    assert results[0] == results[1]
+
+
+async def test_failed_run_retried_by_other_worker(test_cache):
+    calls: list[None] = []
+    leader = asyncio.create_task(
+        SingleFlight().run(
+            test_cache.client, key="same", run=create_run(calls, error=ValueError("boom"))
+        )
+    )
+    await asyncio.sleep(0.01)
+    follower = SingleFlight().run(test_cache.client, key="same", run=create_run(calls))
+
+    with pytest.raises(ValueError):
+        await leader
+    result = await follower
+
+    assert result["response"] == "answer"
+    assert len(calls) == 2
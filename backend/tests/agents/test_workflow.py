@@ -0,0 +1,135 @@
+import pytest
+
+from app.agents.checkpoint import invoke_workflow
+from app.agents.registry import agent_registry
+from app.agents.workflow import PARALLEL_STAGES, STAGES, WorkflowCache, create_workflow
+from app.core.config import settings
+from app.models.agents import AgentState
+
+
+def test_workflow_cache_reuses_graph():
+    cache = WorkflowCache()
+    graph = cache.compile()
+
+    assert cache.get() is graph
+
+
+def test_workflow_cache_recompiles_on_settings_change(monkeypatch):
+    cache = WorkflowCache()
+    graph = cache.get()
+    monkeypatch.setattr(settings, "MAX_TOKENS", settings.MAX_TOKENS + 1)
+
+    assert cache.get() is not graph
+
+
+@pytest.mark.parametrize("mode", ("sequential", "parallel"))
+async def test_workflow_runs_all_stages(mode, fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "WORKFLOW_MODE", mode)
+    workflow = create_workflow()
+
+    result = await invoke_workflow(
+        workflow, state=AgentState(task="test", stage="task_delegation"), run_id="test"
+    )
+
+    assert set(result["stage_outputs"]) == set(STAGES)
+    assert result["stage_outputs"]["value_assessment"] == "Subtasks:\n1. value_assessment response"
+
+
+def test_parallel_workflow_fans_out(monkeypatch):
+    monkeypatch.setattr(settings, "WORKFLOW_MODE", "parallel")
+    edges = {(edge.source, edge.target) for edge in create_workflow().get_graph().edges}
+
+    for stage in PARALLEL_STAGES:
+        assert ("task_delegation", stage) in edges
+        assert (stage, "value_assessment") in edges
+
+
+def fail_stage(monkeypatch, stage, *, failures=None):
+    """Make the stage's agent fail, only for the first `failures` calls if given."""
+    agent = agent_registry.get_agent(stage)
+    process = agent.process
+    calls = []
+
+    async def failing_process(state):
+        calls.append(state)
+        if failures is None or len(calls) <= failures:
+            return {"response": "Error processing request: boom", "error": True}
+        return await process(state)
+
+    monkeypatch.setattr(agent, "process", failing_process)
+    return calls
+
+
+async def run_workflow():
+    return await invoke_workflow(
+        create_workflow(), state=AgentState(task="test", stage="task_delegation"), run_id="test"
+    )
+
+
+@pytest.mark.parametrize(
+    "mode, policy, expected",
+    (
+        ("sequential", "continue", set(STAGES)),
+        ("sequential", "fail_fast", {"task_delegation", "emotional_regulation"}),
+        (
+            "sequential",
+            "skip_to_mpfc",
+            {"task_delegation", "emotional_regulation", "value_assessment"},
+        ),
+        ("parallel", "continue", set(STAGES)),
+        ("parallel", "fail_fast", {"task_delegation", *PARALLEL_STAGES}),
+        ("parallel", "skip_to_mpfc", set(STAGES)),
+    ),
+)
+async def test_error_policy(mode, policy, expected, fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "WORKFLOW_MODE", mode)
+    monkeypatch.setattr(settings, "WORKFLOW_ERROR_POLICY", policy)
+    fail_stage(monkeypatch, "emotional_regulation")
+
+    result = await run_workflow()
+
+    assert set(result["stage_outputs"]) == expected
+    assert result["failed_stages"] == ["emotional_regulation"]
+    assert "boom" not in result["stage_outputs"]["emotional_regulation"]
+
+
+@pytest.mark.parametrize("mode", ("sequential", "parallel"))
+async def test_skip_to_mpfc_after_task_delegation_error(mode, fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "WORKFLOW_MODE", mode)
+    monkeypatch.setattr(settings, "WORKFLOW_ERROR_POLICY", "skip_to_mpfc")
+    agent = agent_registry.get_agent("task_delegation")
+
+    async def raise_error(state):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(agent, "process", raise_error)
+
+    result = await run_workflow()
+
+    assert set(result["stage_outputs"]) == {"task_delegation", "value_assessment"}
+    assert result["failed_stages"] == ["task_delegation"]
+
+
+@pytest.mark.parametrize("policy", ("continue", "retry"))
+async def test_parallel_stages_run_after_task_delegation_error(policy, fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "WORKFLOW_MODE", "parallel")
+    monkeypatch.setattr(settings, "WORKFLOW_ERROR_POLICY", policy)
+    fail_stage(monkeypatch, "task_delegation")
+
+    result = await run_workflow()
+
+    assert set(result["stage_outputs"]) == set(STAGES)
+    assert result["failed_stages"] == ["task_delegation"]
+    assert result["stage_outputs"]["value_assessment"] == "Subtasks:\n1. value_assessment response"
+
+
+async def test_retry_policy(fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "WORKFLOW_ERROR_POLICY", "retry")
+    monkeypatch.setattr(settings, "WORKFLOW_STAGE_RETRIES", 1)
+    calls = fail_stage(monkeypatch, "reward_processing", failures=1)
+
+    result = await run_workflow()
+
+    assert len(calls) == 2
+    assert set(result["stage_outputs"]) == set(STAGES)
+    assert result["failed_stages"] is None
@@ -0,0 +1,419 @@
+import asyncio
+
+import orjson
+
+from app.agents.llm_backends import FakeChatModel
+from app.agents.registry import STAGE_AGENTS, agent_registry
+from app.agents.scheduler import llm_scheduler
+from app.agents.workflow import STAGES, workflow_cache
+from app.core.config import settings
+from app.core.conversation_writer import conversation_writer
+from app.main import app
+from app.models.agents import Topic
+from app.services import chat_services
+from app.worker import ChatJobWorker
+
+
+def _parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event.removeprefix("event: "), orjson.loads(data.removeprefix("data: "))))
+    return events
+
+
+async def test_ask_question(test_client, normal_user_token_headers, fake_llm):
+    response = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+
+    assert response.status_code == 200
+    assert response.json()["task"] == "Should I learn Rust?"
+
+
+async def test_ask_question_stream(test_client, normal_user_token_headers, fake_llm):
+    response = await test_client.post("/chat/stream", json={"topic": "Should I learn Rust?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _parse_events(response.text)
+    assert events[0] == ("stage-start", {"stage": "task_delegation"})
+    assert events[1][0] == "token-delta"
+    assert events[-1][0] == "workflow-complete"
+    assert events[-1][1]["task"] == "Should I learn Rust?"
+    completed = [data["stage"] for event, data in events if event == "stage-complete"]
+    assert set(completed) <= set(STAGE_AGENTS)
+    assert completed[0] == "task_delegation"
+
+
+async def test_ask_question_stream_parallel_stage_error(
+    test_client, normal_user_token_headers, fake_llm, monkeypatch
+):
+    monkeypatch.setattr(settings, "WORKFLOW_MODE", "parallel")
+
+    async def fail(state):
+        return {"response": "Error processing request: boom", "error": True}
+
+    monkeypatch.setattr(agent_registry.get_agent("reward_processing"), "process", fail)
+    response = await test_client.post("/chat/stream", json={"topic": "Should I learn Rust?"})
+
+    events = _parse_events(response.text)
+    completed = {
+        data["stage"]: data["error"] for event, data in events if event == "stage-complete"
+    }
+    assert completed == {stage: stage == "reward_processing" for stage in STAGES}
+
+
+async def test_ask_question_stream_caches_state(test_client, normal_user_token_headers, fake_llm):
+    await test_client.post("/chat/stream", json={"topic": "Should I learn Rust?"})
+    response = await test_client.post("/chat", json={"topic": "Another topic"})
+
+    assert response.json()["previousResponse"] is not None
+
+
+async def test_ask_question_summarizes_history(
+    test_client, normal_user_token_headers, fake_llm, test_cache, monkeypatch
+):
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_THRESHOLD", 50)
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_KEEP_ENTRIES", 1)
+    summaries = 0
+    summary_agent = agent_registry.get_agent("history_summary")
+    process = summary_agent.process
+
+    async def count_summaries(state):
+        nonlocal summaries
+        summaries += 1
+        return await process(state)
+
+    monkeypatch.setattr(summary_agent, "process", count_summaries)
+    await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+    user_id = (await test_client.get("/users/me")).json()["id"]
+    topic = Topic(topic="Should I learn Rust?")
+    state = await chat_services.get_agent_state(test_cache.client, user_id=user_id, topic=topic)
+    state.feedback_history = ["Keep it short " * 20, "Mention jobs"]
+    await chat_services.save_agent_state(
+        test_cache.client, user_id=user_id, state=state, previous=state
+    )
+
+    response = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+    await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+
+    assert response.json()["historySummary"] == "Subtasks:\n1. history_summary response"
+    assert response.json()["feedbackHistory"] == ["Mention jobs"]
+    assert summaries == 1
+
+
+async def test_ask_question_resumes_expired_conversation(
+    test_client, normal_user_token_headers, fake_llm, test_cache
+):
+    first = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+    await conversation_writer.flush()
+    async for key in test_cache.client.scan_iter("*-agent-state:*"):
+        await test_cache.client.delete(key)
+
+    response = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+
+    assert response.status_code == 200
+    assert response.json()["conversationId"] == first.json()["conversationId"]
+    assert response.json()["previousResponse"] is not None
+
+
+async def test_ask_question_new_topic_starts_conversation(
+    test_client, normal_user_token_headers, fake_llm, test_cache
+):
+    first = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+    await conversation_writer.flush()
+    async for key in test_cache.client.scan_iter("*-agent-state:*"):
+        await test_cache.client.delete(key)
+
+    response = await test_client.post("/chat", json={"topic": "Should I learn Go?"})
+
+    assert response.status_code == 200
+    assert response.json()["conversationId"] != first.json()["conversationId"]
+    assert response.json()["task"] == "Should I learn Go?"
+
+
+async def test_ask_question_resumes_named_conversation(
+    test_client, normal_user_token_headers, fake_llm, test_cache
+):
+    first = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+    async for key in test_cache.client.scan_iter("*-agent-state:*"):
+        await test_cache.client.delete(key)
+    await test_client.post("/chat", json={"topic": "Should I learn Go?"})
+    await conversation_writer.flush()
+
+    response = await test_client.post(
+        "/chat",
+        json={"topic": "What about jobs?", "conversationId": first.json()["conversationId"]},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["conversationId"] == first.json()["conversationId"]
+
+
+async def test_ask_question_similar_topic(
+    test_client, normal_user_token_headers, fake_llm, test_cache, monkeypatch
+):
+    monkeypatch.setattr(settings, "TOPIC_CACHE_ENABLED", True)
+    await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+    async for key in test_cache.client.scan_iter("*-agent-state:*"):
+        await test_cache.client.delete(key)
+
+    def fail():
+        raise AssertionError("The workflow should not run")
+
+    monkeypatch.setattr(workflow_cache, "get", fail)
+    response = await test_client.post("/chat", json={"topic": "should I learn rust"})
+
+    assert response.status_code == 200
+    assert response.json()["task"] == "should I learn rust"
+
+
+async def test_ask_question_failed_stage_not_indexed(
+    test_client, normal_user_token_headers, fake_llm, test_cache, monkeypatch
+):
+    monkeypatch.setattr(settings, "TOPIC_CACHE_ENABLED", True)
+
+    async def fail(state):
+        return {"response": "Error processing request: boom", "error": True}
+
+    monkeypatch.setattr(agent_registry.get_agent("reward_processing"), "process", fail)
+    response = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+
+    assert response.status_code == 200
+    assert response.json()["failedStages"] == ["reward_processing"]
+    similar = await chat_services.find_similar_answer(
+        test_cache.client, topic=Topic(topic="Should I learn Rust?"), conversation_id=None
+    )
+    assert similar is None
+
+
+async def test_ask_question_client_disconnect(test_client, normal_user_token_headers, monkeypatch):
+    for stage in STAGE_AGENTS:
+        slow_llm = FakeChatModel(latency_distribution="constant", latency_mean=10.0)
+        monkeypatch.setattr(agent_registry.get_agent(stage), "llm", slow_llm)
+
+    requests = [{"type": "http.request", "body": orjson.dumps({"topic": "Should I learn Rust?"})}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        await asyncio.sleep(0.1)
+        return {"type": "http.disconnect"}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    cookie = "; ".join(f"{name}={value}" for name, value in test_client.cookies.items())
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": f"{settings.API_V1_PREFIX}/chat",
+        "raw_path": f"{settings.API_V1_PREFIX}/chat".encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"cookie", cookie.encode())],
+        "client": ("127.0.0.1", 12345),
+        "server": ("127.0.0.1", 80),
+    }
+
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+
+    assert sent[0]["status"] == 499
+    assert all(stats["running"] == 0 for stats in llm_scheduler.stats().values())
+
+
+def count_workflow_runs(monkeypatch, *, delay=0.0):
+    agent = agent_registry.get_agent("task_delegation")
+    process = agent.process
+    calls = []
+
+    async def counted_process(state):
+        calls.append(state)
+        await asyncio.sleep(delay)
+        return await process(state)
+
+    monkeypatch.setattr(agent, "process", counted_process)
+    return calls
+
+
+async def test_ask_question_idempotency_key_replay(
+    test_client, normal_user_token_headers, fake_llm, monkeypatch
+):
+    calls = count_workflow_runs(monkeypatch)
+    headers = {"Idempotency-Key": "retry-1"}
+    first = await test_client.post("/chat", json={"topic": "Should I learn Rust?"}, headers=headers)
+    second = await test_client.post(
+        "/chat", json={"topic": "Should I learn Rust?"}, headers=headers
+    )
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.headers["idempotent-replayed"] == "true"
+    assert second.json() == first.json()
+    assert len(calls) == 1
+
+
+async def test_ask_question_idempotency_key_concurrent(
+    test_client, normal_user_token_headers, fake_llm, monkeypatch
+):
+    calls = count_workflow_runs(monkeypatch, delay=0.2)
+    headers = {"Idempotency-Key": "retry-2"}
+    responses = await asyncio.gather(
+        *(
+            test_client.post("/chat", json={"topic": "Should I learn Rust?"}, headers=headers)
+            for _ in range(3)
+        )
+    )
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert len({response.text for response in responses}) == 1
+    assert len(calls) == 1
+
+
+async def test_ask_question_identical_requests_share_workflow(
+    test_client, normal_user_token_headers, fake_llm, monkeypatch
+):
+    calls = count_workflow_runs(monkeypatch, delay=0.2)
+    responses = await asyncio.gather(
+        test_client.post("/chat", json={"topic": "Should I learn Rust?"}),
+        test_client.post("/chat", json={"topic": "should I learn rust"}),
+    )
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert [response.json()["task"] for response in responses] == [
+        "Should I learn Rust?",
+        "should I learn rust",
+    ]
+    assert len(calls) == 1
+
+
+async def test_ask_question_idempotency_key_different_request(
+    test_client, normal_user_token_headers, fake_llm
+):
+    headers = {"Idempotency-Key": "retry-3"}
+    await test_client.post("/chat", json={"topic": "Should I learn Rust?"}, headers=headers)
+    response = await test_client.post("/chat", json={"topic": "Another topic"}, headers=headers)
+
+    assert response.status_code == 422
+
+
+async def test_ask_question_idempotency_key_released_on_error(
+    test_client, normal_user_token_headers, fake_llm, monkeypatch
+):
+    headers = {"Idempotency-Key": "retry-4"}
+    with monkeypatch.context() as m:
+        m.setattr(settings, "REQUEST_TIMEOUT", 0.0)
+        failed = await test_client.post(
+            "/chat", json={"topic": "Should I learn Rust?"}, headers=headers
+        )
+
+    response = await test_client.post(
+        "/chat", json={"topic": "Should I learn Rust?"}, headers=headers
+    )
+
+    assert failed.status_code == 504
+    assert response.status_code == 200
+    assert "idempotent-replayed" not in response.headers
+
+
+async def test_concurrent_chats_do_not_hold_db_connections(
+    test_client, normal_user_token_headers, test_db, monkeypatch
+):
+    chat_count = 50
+    release = asyncio.Event()
+    all_running = asyncio.Event()
+    running = 0
+
+    class BlockingWorkflow:
+        checkpointer = None
+
+        async def ainvoke(self, state, config=None):
+            nonlocal running
+            running += 1
+            if running == chat_count:
+                all_running.set()
+            await release.wait()
+            return state
+
+    monkeypatch.setattr(workflow_cache, "get", lambda: BlockingWorkflow())
+    chats = [
+        asyncio.create_task(test_client.post("/chat", json={"topic": f"topic {i}"}))
+        for i in range(chat_count)
+    ]
+    await asyncio.wait_for(all_running.wait(), timeout=30)
+
+    health = await asyncio.wait_for(test_client.get("/health"), timeout=5)
+    release.set()
+    responses = await asyncio.gather(*chats)
+
+    assert health.json()["db"] == "healthy"
+    assert all(response.status_code == 200 for response in responses)
+
+
+async def test_ask_question_deadline_exceeded(
+    test_client, normal_user_token_headers, fake_llm, monkeypatch
+):
+    monkeypatch.setattr(settings, "REQUEST_TIMEOUT", 0.0)
+    response = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+
+    assert response.status_code == 504
+
+
+async def test_ask_question_stage_timeout(
+    test_client, normal_user_token_headers, fake_llm, monkeypatch
+):
+    monkeypatch.setattr(settings, "AGENT_TIMEOUT", 0.05)
+    slow_llm = FakeChatModel(latency_distribution="constant", latency_mean=10.0)
+    monkeypatch.setattr(agent_registry.get_agent("task_delegation"), "llm", slow_llm)
+    response = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+
+    assert response.status_code == 504
+    assert response.json()["detail"] == "Timed out getting an answer, please try again"
+
+
+async def test_ask_question_stream_deadline_exceeded(
+    test_client, normal_user_token_headers, fake_llm, monkeypatch
+):
+    monkeypatch.setattr(settings, "REQUEST_TIMEOUT", 0.0)
+    response = await test_client.post("/chat/stream", json={"topic": "Should I learn Rust?"})
+
+    events = _parse_events(response.text)
+    assert events[-1][0] == "error"
+
+
+async def test_create_chat_job(test_client, normal_user_token_headers):
+    response = await test_client.post("/chat/jobs", json={"topic": "Should I learn Rust?"})
+
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+
+    response = await test_client.get(f"/chat/jobs/{job['id']}")
+
+    assert response.status_code == 200
+    assert response.json()["id"] == job["id"]
+
+
+async def test_get_chat_job_not_found(test_client, normal_user_token_headers):
+    response = await test_client.get("/chat/jobs/missing")
+
+    assert response.status_code == 404
+
+
+async def test_stream_chat_job(test_client, normal_user_token_headers, fake_llm, test_cache):
+    worker = ChatJobWorker(name="test-worker")
+    worker_task = asyncio.create_task(worker.run(test_cache.client))
+    job = (await test_client.post("/chat/jobs", json={"topic": "Should I learn Rust?"})).json()
+
+    response = await asyncio.wait_for(test_client.get(f"/chat/jobs/{job['id']}/stream"), 10)
+    worker.stop()
+    await worker_task
+
+    events = _parse_events(response.text)
+    assert events[-1][0] == "job-complete"
+    assert events[-1][1]["status"] == "complete"
+    assert events[-1][1]["result"]["task"] == "Should I learn Rust?"
@@ -0,0 +1,58 @@
+import pytest
+from pydantic import SecretStr
+
+from app.core.config import settings
+from app.core.metrics_sampler import metrics_sampler
+
+METRICS_URL = "http://127.0.0.1/metrics"
+METRICS_HEADERS = {"Authorization": "Bearer metrics-token"}
+
+
+@pytest.fixture
+def metrics_token(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", SecretStr("metrics-token"))
+
+
+async def test_metrics(test_client, metrics_token):
+    await test_client.get("/health")
+    metrics_sampler.sample()
+
+    response = await test_client.get(METRICS_URL, headers=METRICS_HEADERS)
+
+    assert response.status_code == 200
+    assert 'route="/api/v1/health"' in response.text
+    assert "scan_valkey_pool_connections" in response.text
+
+
+async def test_metrics_disabled_without_token(test_client):
+    response = await test_client.get(METRICS_URL, headers=METRICS_HEADERS)
+
+    assert response.status_code == 404
+
+
+async def test_metrics_invalid_token(test_client, metrics_token):
+    response = await test_client.get(METRICS_URL, headers={"Authorization": "Bearer wrong"})
+
+    assert response.status_code == 401
+    response = await test_client.get(METRICS_URL)
+
+    assert response.status_code == 401
+
+
+async def test_chat_stage_metrics(test_client, normal_user_token_headers, fake_llm, metrics_token):
+    response = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+
+    server_timing = response.headers["server-timing"]
+    assert server_timing.startswith("task_delegation;dur=")
+    assert "value_assessment;dur=" in server_timing
+    assert "total;dur=" in server_timing
+
+    response = await test_client.get(METRICS_URL, headers=METRICS_HEADERS)
+
+    assert 'scan_workflow_stage_duration_seconds_count{stage="task_delegation"}' in response.text
+    assert 'scan_llm_queue_wait_seconds_count{priority="interactive",stage="task_delegation"}' in (
+        response.text
+    )
+    assert 'scan_llm_calls{stage="task_delegation",state="running"} 0.0' in response.text
+    assert "scan_llm_cache_lookups_total" in response.text
+    assert settings.DLPFC_MODEL.get_secret_value() not in response.text
@@ -1,9 +1,13 @@
 import pytest
 from httpx import ASGITransport, AsyncClient
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
 
+from app.agents.registry import STAGE_AGENTS, agent_registry
 from app.core.cache import cache
 from app.core.config import settings
+from app.core.conversation_writer import conversation_writer
 from app.core.db import db
+from app.core.user_cache import user_cache
 from app.main import app
 from app.models.users import UserCreate, UserUpdate
 from app.services import user_services
@@ -29,7 +33,7 @@ async def test_db():
         await db.create_pool()
 
     async with db.pool.acquire() as conn:  # type: ignore
-        tables = ", ".join(("users",))
+        tables = ", ".join(("users", "conversations", "conversation_turns"))
         await conn.execute(f"TRUNCATE {tables}")
     await db.close_pool()
 
@@ -43,6 +47,17 @@ async def test_cache():
 
     await cache.client.flushall()  # type: ignore
     await cache.close_client()
+    user_cache.clear()
+    conversation_writer.clear()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    for stage in STAGE_AGENTS:
+        agent = agent_registry.get_agent(stage)
+        monkeypatch.setattr(
+            agent, "llm", FakeListChatModel(responses=[f"Subtasks:\n1. {stage} response"])
+        )
 
 
 @pytest.fixture
@@ -37,3 +37,38 @@ def test_invalid_temperature(temperature):
             OPENAI_API_KEY=SecretStr("some_key"),
             TEMPERATURE=temperature,
         )
+
+
+def test_topic_cache_threshold_from_env(monkeypatch):
+    monkeypatch.setenv("TOPIC_CACHE_THRESHOLD", "0.9")
+
+    settings = Settings(
+        SECRET_KEY=SecretStr("a"),
+        FIRST_SUPERUSER_EMAIL="user@email.com",
+        FIRST_SUPERUSER_PASSWORD=SecretStr("Abc123!@#"),
+        POSTGRES_HOST="some_host",
+        POSTGRES_USER="pg",
+        POSTGRES_PASSWORD=SecretStr("pgpassword"),
+        VALKEY_HOST="valkey",
+        VALKEY_PASSWORD=SecretStr("valkeypassword"),
+        OPENAI_API_KEY=SecretStr("some_key"),
+    )
+
+    assert settings.TOPIC_CACHE_THRESHOLD == 0.9
+
+
+def test_single_flight_lock_outlives_chat_jobs():
+    settings = Settings(
+        SECRET_KEY=SecretStr("a"),
+        FIRST_SUPERUSER_EMAIL="user@email.com",
+        FIRST_SUPERUSER_PASSWORD=SecretStr("Abc123!@#"),
+        POSTGRES_HOST="some_host",
+        POSTGRES_USER="pg",
+        POSTGRES_PASSWORD=SecretStr("pgpassword"),
+        VALKEY_HOST="valkey",
+        VALKEY_PASSWORD=SecretStr("valkeypassword"),
+        OPENAI_API_KEY=SecretStr("some_key"),
+        CHAT_JOB_TIMEOUT=600.5,
+    )
+
+    assert settings.single_flight_lock_ttl == 601 + settings.SINGLE_FLIGHT_LOCK_MARGIN
@@ -0,0 +1,114 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.core.conversation_writer import conversation_writer
+from app.core.db import db
+from app.core.utils import create_db_primary_key
+from app.models.agents import AgentState
+from app.models.conversations import ConversationTurn
+from app.services import conversation_services
+from app.services.user_services import get_user_by_email
+
+
+@pytest.fixture
+async def user_id():
+    async with db.pool.acquire() as connection:  # type: ignore
+        user = await get_user_by_email(connection, email=settings.FIRST_SUPERUSER_EMAIL)
+    assert user is not None
+    return user.id
+
+
+def create_turn(user_id, *, conversation_id="conversation", response="Yes", age=0):
+    return ConversationTurn(
+        id=create_db_primary_key(),
+        conversation_id=conversation_id,
+        user_id=user_id,
+        state=AgentState(
+            task="Should I learn Rust?",
+            stage="task_delegation",
+            conversation_id=conversation_id,
+            response=response,
+            previous_response=response,
+        ),
+        created_at=datetime.now(UTC) - timedelta(seconds=age),
+    )
+
+
+async def test_flush_writes_turns(user_id):
+    conversation_writer.add(create_turn(user_id, response="First", age=2))
+    conversation_writer.add(create_turn(user_id, response="Second", age=1))
+    conversation_writer.add(create_turn(user_id, conversation_id="other", response="Third"))
+
+    await conversation_writer.flush()
+
+    async with db.pool.acquire() as connection:  # type: ignore
+        turns = await connection.fetchval("SELECT count(*) FROM conversation_turns")
+        conversations = await connection.fetchval("SELECT count(*) FROM conversations")
+    assert turns == 3
+    assert conversations == 2
+    latest = await conversation_writer.get_latest(user_id)
+    assert latest is not None
+    assert latest.conversation_id == "other"
+    assert latest.state.previous_response == "Third"
+
+
+async def test_get_latest_includes_unwritten_turns(user_id):
+    conversation_writer.add(create_turn(user_id, response="Not written"))
+
+    latest = await conversation_writer.get_latest(user_id)
+
+    assert latest is not None
+    assert latest.state.response == "Not written"
+
+
+async def test_get_latest_outside_resume_window(user_id, monkeypatch):
+    conversation_writer.add(create_turn(user_id, age=60))
+    await conversation_writer.flush()
+    conversation_writer.add(create_turn(user_id, conversation_id="other", age=60))
+    monkeypatch.setattr(settings, "CONVERSATION_RESUME_WINDOW", 30)
+
+    assert await conversation_writer.get_latest(user_id) is None
+
+
+async def test_flush_keeps_turns_on_error(user_id, monkeypatch):
+    insert_turns = conversation_services.insert_turns
+
+    async def fail(connection, *, turns):
+        raise ConnectionError("Postgres is down")
+
+    monkeypatch.setattr(conversation_services, "insert_turns", fail)
+    conversation_writer.add(create_turn(user_id))
+    await conversation_writer.flush()
+
+    monkeypatch.setattr(conversation_services, "insert_turns", insert_turns)
+    await conversation_writer.flush()
+
+    assert await conversation_writer.get_latest(user_id) is not None
+    async with db.pool.acquire() as connection:  # type: ignore
+        assert await connection.fetchval("SELECT count(*) FROM conversation_turns") == 1
+
+
+async def test_flush_drops_rejected_turns(user_id):
+    dropped = conversation_writer.dropped
+    conversation_writer.add(create_turn("missing-user"))
+
+    await conversation_writer.flush()
+
+    assert conversation_writer.dropped == dropped + 1
+    assert await conversation_writer.get_latest("missing-user") is None
+
+
+async def test_flush_drops_only_rejected_turns(user_id):
+    dropped = conversation_writer.dropped
+    conversation_writer.add(create_turn("missing-user"))
+    conversation_writer.add(create_turn(user_id, response="Bad\x00"))
+    conversation_writer.add(create_turn(user_id, response="Good"))
+
+    await conversation_writer.flush()
+
+    assert conversation_writer.dropped == dropped + 2
+    latest = await conversation_writer.get_latest(user_id)
+    assert latest is not None
+    assert latest.state.response == "Good"
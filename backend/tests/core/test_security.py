@@ -1,4 +1,13 @@
-from app.core.security import get_password_hash, verify_password
+import asyncio
+
+from app.core.config import settings
+from app.core.security import (
+    PasswordHashExecutor,
+    get_password_hash,
+    get_password_hash_async,
+    verify_password,
+    verify_password_async,
+)
 
 
 def test_verify_password_match():
@@ -9,3 +18,23 @@ def test_verify_password_match():
 def test_verify_password_no_match():
     hashed_password = get_password_hash("t")
     assert verify_password("test", hashed_password) is False
+
+
+async def test_verify_password_async_match():
+    hashed_password = await get_password_hash_async("test")
+    assert await verify_password_async("test", hashed_password) is True
+
+
+async def test_verify_password_async_no_match():
+    hashed_password = await get_password_hash_async("t")
+    assert await verify_password_async("test", hashed_password) is False
+
+
+async def test_password_hash_executor_stats(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_HASH_WORKERS", 1)
+    executor = PasswordHashExecutor()
+
+    await asyncio.gather(*(executor.run(get_password_hash, "test") for _ in range(3)))
+    executor.shutdown()
+
+    assert executor.stats() == {"workers": 1, "running": 0, "queued": 0, "completed": 3}
@@ -0,0 +1,56 @@
+import pytest
+
+from app.core.config import settings
+from app.core.topic_index import TopicIndex, normalize_topic, simhash, similarity
+
+
+def test_normalize_topic():
+    assert normalize_topic("  Should I learn   RUST?! ") == "should i learn rust"
+
+
+def test_similarity():
+    signature = simhash("should i learn rust")
+
+    assert similarity(signature, signature) == 1.0
+    assert similarity(signature, simhash("should i learn rust now")) > similarity(
+        signature, simhash("what is the best pizza in chicago")
+    )
+
+
+@pytest.fixture
+async def topic_index(test_cache):
+    index = TopicIndex(prefix="test-topic-cache")
+    yield index
+    await index.clear(test_cache.client)
+
+
+async def test_find_near_duplicate(topic_index, test_cache):
+    await topic_index.add(test_cache.client, topic="Should I learn Rust?", result="answer")
+
+    match = await topic_index.find(test_cache.client, topic="should I learn rust")
+
+    assert match == ("answer", 1.0)
+
+
+async def test_find_below_threshold(topic_index, test_cache, monkeypatch):
+    monkeypatch.setattr(settings, "TOPIC_CACHE_THRESHOLD", 0.99)
+    await topic_index.add(test_cache.client, topic="Should I learn Rust?", result="answer")
+
+    assert await topic_index.find(test_cache.client, topic="Should I learn Rust now?") is None
+
+
+async def test_find_drops_expired_topics(topic_index, test_cache):
+    await topic_index.add(test_cache.client, topic="Should I learn Rust?", result="answer")
+    await test_cache.client.delete(*[k async for k in test_cache.client.scan_iter("*:result:*")])
+
+    assert await topic_index.find(test_cache.client, topic="Should I learn Rust?") is None
+    assert not [key async for key in test_cache.client.scan_iter("test-topic-cache:band:*")]
+
+
+async def test_bands_expire(topic_index, test_cache):
+    await topic_index.add(test_cache.client, topic="Should I learn Rust?", result="answer")
+
+    band_keys = [key async for key in test_cache.client.scan_iter("test-topic-cache:band:*")]
+    assert len(band_keys) == 4
+    for key in band_keys:
+        assert 0 < await test_cache.client.ttl(key) <= settings.TOPIC_CACHE_TTL
@@ -0,0 +1,145 @@
+import orjson
+import pytest
+
+from app.core.config import settings
+from app.core.db import db
+from app.core.tracing import current_traceparent, parse_traceparent, tracer
+from app.services.user_services import get_user_by_email
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture
+async def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(settings, "TRACING_EXPORTER", "file")
+    monkeypatch.setattr(settings, "TRACING_FILE_PATH", path)
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATE", 1.0)
+    tracer.start()
+    yield path
+    await tracer.stop()
+
+
+async def read_spans(path):
+    await tracer.flush()
+    return [orjson.loads(line) for line in path.read_bytes().splitlines()]
+
+
+@pytest.mark.parametrize("flags, sampled", (("01", True), ("00", False), ("03", True)))
+def test_parse_traceparent(flags, sampled):
+    context = parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-{flags}")
+
+    assert context is not None
+    assert context.trace_id == TRACE_ID
+    assert context.span_id == PARENT_ID
+    assert context.sampled is sampled
+
+
+@pytest.mark.parametrize(
+    "traceparent",
+    (
+        None,
+        "",
+        "not-a-traceparent",
+        f"01-{TRACE_ID}-{PARENT_ID}-01",
+        f"00-{'0' * 32}-{PARENT_ID}-01",
+        f"00-{TRACE_ID}-{'0' * 16}-01",
+        f"00-{TRACE_ID[:-1]}-{PARENT_ID}-01",
+    ),
+)
+def test_parse_invalid_traceparent(traceparent):
+    assert parse_traceparent(traceparent) is None
+
+
+async def test_nested_spans(trace_file):
+    with tracer.span("parent") as parent:
+        assert current_traceparent() == parent.context.traceparent()
+        with tracer.span("child", attributes={"key": "value"}):
+            pass
+    assert current_traceparent() is None
+
+    child, parent_span = await read_spans(trace_file)
+
+    assert parent_span["name"] == "parent"
+    assert parent_span["parent_id"] is None
+    assert child["trace_id"] == parent_span["trace_id"]
+    assert child["parent_id"] == parent_span["span_id"]
+    assert child["attributes"] == {"key": "value"}
+
+
+async def test_span_records_error(trace_file):
+    with pytest.raises(ValueError), tracer.span("failing"):
+        raise ValueError("boom")
+
+    (span,) = await read_spans(trace_file)
+
+    assert span["status"] == "error"
+    assert span["attributes"]["error.type"] == "ValueError"
+
+
+async def test_head_sampling(trace_file, monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATE", 0.0)
+    with tracer.span("parent"), tracer.span("child"):
+        pass
+
+    await tracer.flush()
+    assert not trace_file.exists()
+
+
+async def test_sampling_follows_parent(trace_file, monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATE", 0.0)
+    with tracer.span("continued", parent=parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01")):
+        pass
+
+    (span,) = await read_spans(trace_file)
+
+    assert span["trace_id"] == TRACE_ID
+    assert span["parent_id"] == PARENT_ID
+
+
+async def test_db_query_spans(trace_file):
+    with tracer.span("parent"):
+        async with db.pool.acquire() as connection:  # type: ignore
+            await get_user_by_email(connection, email=settings.FIRST_SUPERUSER_EMAIL)
+
+    spans = await read_spans(trace_file)
+    query = next(span for span in spans if span["name"] == "db.query")
+    assert query["attributes"]["db.statement"].startswith("SELECT")
+    assert query["parent_id"] == spans[-1]["span_id"]
+
+
+async def test_request_continues_trace(test_client, normal_user_token_headers, trace_file):
+    response = await test_client.get(
+        "/users/me", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["traceresponse"].startswith(f"00-{TRACE_ID}-")
+
+    spans = await read_spans(trace_file)
+    request = next(span for span in spans if span["name"] == "GET /api/v1/users/me")
+    assert request["parent_id"] == PARENT_ID
+    assert request["attributes"]["http.status_code"] == 200
+    assert all(span["trace_id"] == TRACE_ID for span in spans)
+    assert any(span["name"] == "valkey GET" for span in spans)
+
+
+async def test_chat_spans(test_client, normal_user_token_headers, fake_llm, trace_file):
+    response = await test_client.post("/chat", json={"topic": "Should I learn Rust?"})
+
+    assert response.status_code == 200
+    spans = await read_spans(trace_file)
+    names = {span["name"] for span in spans}
+    assert {"POST /api/v1/chat", "workflow", "stage task_delegation", "llm"} <= names
+    assert len({span["trace_id"] for span in spans}) == 1
+
+
+async def test_chat_stream_spans(test_client, normal_user_token_headers, fake_llm, trace_file):
+    response = await test_client.post("/chat/stream", json={"topic": "Should I learn Rust?"})
+
+    assert b"event: workflow-complete" in response.content
+    spans = await read_spans(trace_file)
+    workflow = next(span for span in spans if span["name"] == "workflow")
+    stage = next(span for span in spans if span["name"] == "stage task_delegation")
+    assert stage["parent_id"] == workflow["span_id"]
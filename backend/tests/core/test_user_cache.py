@@ -0,0 +1,76 @@
+import asyncio
+
+from app.core.user_cache import INVALIDATION_CHANNEL, UserCache
+from app.models.users import AuthenticatedUser
+
+
+async def test_get_from_local_cache(test_user):
+    cache = UserCache()
+    await cache.set(test_user, generation=None)
+
+    assert await cache.get(test_user.id) == AuthenticatedUser(**test_user.model_dump())
+
+
+async def test_get_from_shared_cache(test_user):
+    cache = UserCache()
+    await cache.set(test_user, generation=None)
+    cache.clear()
+
+    assert await cache.get(test_user.id) == AuthenticatedUser(**test_user.model_dump())
+
+
+async def test_invalidate(test_user):
+    cache = UserCache()
+    await cache.set(test_user, generation=None)
+    await cache.invalidate(test_user.id)
+
+    assert await cache.get(test_user.id) is None
+
+
+async def test_invalidation_from_another_worker(test_user, test_cache):
+    cache = UserCache()
+    await cache.start_listener()
+    await cache.set(test_user, generation=None)
+    await test_cache.client.delete(f"user:{test_user.id}")
+
+    await test_cache.client.publish(INVALIDATION_CHANNEL, test_user.id)
+    for _ in range(50):
+        if await cache.get(test_user.id) is None:
+            break
+        await asyncio.sleep(0.01)
+    await cache.stop_listener()
+
+    assert await cache.get(test_user.id) is None
+
+
+async def test_update_user_route_invalidates_cache(test_client, normal_user_token_headers):
+    response = await test_client.get("/users/me")
+    assert response.json()["fullName"] != "New Name"
+
+    await test_client.patch("/users/me", json={"fullName": "New Name"})
+    response = await test_client.get("/users/me")
+
+    assert response.json()["fullName"] == "New Name"
+
+
+async def test_hashed_secrets_not_cached(test_user, test_cache):
+    cache = UserCache()
+    await cache.set(test_user, generation=None)
+
+    cached = await test_cache.client.get(f"user:{test_user.id}")
+
+    assert b"hashed" not in cached
+
+
+async def test_set_after_invalidate_not_cached(test_user):
+    cache = UserCache()
+    generation = await cache.generation(test_user.id)
+    # Invalidated while the user was being loaded
+    await cache.invalidate(test_user.id)
+
+    await cache.set(test_user, generation=generation)
+    cache.clear()
+
+    assert await cache.get(test_user.id) is None
+    await cache.set(test_user, generation=await cache.generation(test_user.id))
+    assert await cache.get(test_user.id) is not None
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.core.utils import cancel_on_disconnect
+from app.exceptions import ClientDisconnectedError
+
+
+def create_request(disconnect_after=None):
+    async def receive():
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    return Request({"type": "http", "method": "POST", "headers": []}, receive)
+
+
+async def test_cancel_on_disconnect_returns_result():
+    async def answer():
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    assert await cancel_on_disconnect(create_request(), answer()) == "answer"
+
+
+async def test_cancel_on_disconnect_cancels_work():
+    cancelled = asyncio.Event()
+
+    async def answer():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(ClientDisconnectedError):
+        await asyncio.wait_for(cancel_on_disconnect(create_request(0.01), answer()), timeout=1)
+
+    assert cancelled.is_set()
+
+
+async def test_cancel_on_disconnect_raises_work_error():
+    async def answer():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await cancel_on_disconnect(create_request(), answer())
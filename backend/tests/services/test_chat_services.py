@@ -0,0 +1,133 @@
+from app.core.config import settings
+from app.models.agents import AgentState, Topic
+from app.services import chat_services
+
+TOPIC = Topic(topic="Should I learn Rust?")
+KEY = "user-agent-state:1"
+
+
+async def test_agent_state_round_trip(test_cache):
+    state = AgentState(
+        task="Should I learn Rust?",
+        stage="final_evaluation",
+        conversation_id="conversation",
+        response="Yes",
+        feedback_history=["Mention jobs"],
+        stage_outputs={"task_delegation": "Weigh the time"},
+    )
+
+    await chat_services.save_agent_state(test_cache.client, user_id="user", state=state)
+    saved = await chat_services.get_agent_state(test_cache.client, user_id="user", topic=TOPIC)
+
+    assert saved.conversation_id == "conversation"
+    assert saved.previous_response == "Yes"
+    assert saved.feedback_history == ["Mention jobs"]
+    assert saved.stage == "task_delegation"
+    assert saved.stage_outputs is None
+    assert await test_cache.client.ttl(KEY) > 0
+
+
+async def test_agent_state_compresses_large_fields(test_cache):
+    response = "Learn Rust. " * 1_000
+    state = AgentState(task="Should I learn Rust?", stage="task_delegation", response=response)
+
+    await chat_services.save_agent_state(test_cache.client, user_id="user", state=state)
+    saved = await chat_services.get_agent_state(test_cache.client, user_id="user", topic=TOPIC)
+
+    field = await test_cache.client.hget(KEY, "response")
+    assert len(field) < settings.AGENT_STATE_COMPRESSION_THRESHOLD
+    assert saved.response == response
+    assert await test_cache.client.hget(KEY, "task") == b'j"Should I learn Rust?"'
+
+
+async def test_agent_state_writes_changed_fields(test_cache):
+    state = AgentState(
+        task="Should I learn Rust?", stage="task_delegation", response="Yes", feedback="Too short"
+    )
+    await chat_services.save_agent_state(test_cache.client, user_id="user", state=state)
+    previous = await chat_services.get_agent_state(test_cache.client, user_id="user", topic=TOPIC)
+    # Only seen again if the unchanged task is rewritten
+    await test_cache.client.hset(KEY, "task", b'j"Untouched"')
+
+    state = previous.model_copy(update={"response": "No", "feedback": None})
+    await chat_services.save_agent_state(
+        test_cache.client, user_id="user", state=state, previous=previous
+    )
+
+    assert await test_cache.client.hget(KEY, "task") == b'j"Untouched"'
+    assert await test_cache.client.hget(KEY, "response") == b'j"No"'
+    assert not await test_cache.client.hexists(KEY, "feedback")
+
+
+async def test_agent_state_rewritten_when_expired(test_cache):
+    state = AgentState(task="Should I learn Rust?", stage="task_delegation", response="Yes")
+    await chat_services.save_agent_state(test_cache.client, user_id="user", state=state)
+    previous = await chat_services.get_agent_state(test_cache.client, user_id="user", topic=TOPIC)
+    await test_cache.client.delete(KEY)
+
+    state = previous.model_copy(update={"response": "No"})
+    await chat_services.save_agent_state(
+        test_cache.client, user_id="user", state=state, previous=previous
+    )
+    saved = await chat_services.get_agent_state(test_cache.client, user_id="user", topic=TOPIC)
+
+    assert saved.task == "Should I learn Rust?"
+    assert saved.conversation_id == previous.conversation_id
+    assert saved.response == "No"
+
+
+async def test_agent_state_full_write_replaces_fields(test_cache):
+    state = AgentState(task="Should I learn Rust?", stage="task_delegation", feedback="Too short")
+    await chat_services.save_agent_state(test_cache.client, user_id="user", state=state)
+    await test_cache.client.hset(KEY, "response", b"?broken")
+
+    state = AgentState(task="Should I learn Rust?", stage="task_delegation", response="Yes")
+    await chat_services.save_agent_state(test_cache.client, user_id="user", state=state)
+    saved = await chat_services.get_agent_state(test_cache.client, user_id="user", topic=TOPIC)
+
+    assert saved.response == "Yes"
+    assert saved.feedback is None
+
+
+async def test_agent_state_concurrent_turns_not_mixed(test_cache):
+    state = AgentState(task="Should I learn Rust?", stage="task_delegation", response="Yes")
+    await chat_services.save_agent_state(test_cache.client, user_id="user", state=state)
+    previous = await chat_services.get_agent_state(test_cache.client, user_id="user", topic=TOPIC)
+
+    first = previous.model_copy(update={"response": "No"})
+    second = previous.model_copy(update={"feedback_history": ["Mention jobs"]})
+    await chat_services.save_agent_state(
+        test_cache.client, user_id="user", state=first, previous=previous
+    )
+    await chat_services.save_agent_state(
+        test_cache.client, user_id="user", state=second, previous=previous
+    )
+    saved = await chat_services.get_agent_state(test_cache.client, user_id="user", topic=TOPIC)
+
+    assert saved.response == "Yes"
+    assert saved.feedback_history == ["Mention jobs"]
+
+
+async def test_answer_from_topic_cache_only_for_new_conversations(test_cache, monkeypatch):
+    monkeypatch.setattr(settings, "TOPIC_CACHE_ENABLED", True)
+    previous = AgentState(task="Should I learn Rust?", stage="task_delegation")
+    answered = previous.model_copy(update={"response": "Yes"})
+    await chat_services.save_answered_state(
+        test_cache.client, user_id="user", state=answered, previous=previous
+    )
+
+    new = AgentState(task="should I learn rust", stage="task_delegation", conversation_id="new")
+    continued = new.model_copy(update={"previous_response": "No"})
+
+    similar = await chat_services.answer_from_topic_cache(
+        test_cache.client, user_id="other", state=new
+    )
+    assert similar is not None
+    assert similar.response == "Yes"
+    assert similar.conversation_id == "new"
+    assert (
+        await chat_services.answer_from_topic_cache(
+            test_cache.client, user_id="other", state=continued
+        )
+        is None
+    )
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from app import worker as worker_module
+from app.models.agents import AgentState
+from app.services import job_services
+from app.worker import ChatJobWorker
+
+
+@pytest.fixture(autouse=True)
+def short_reads(monkeypatch):
+    monkeypatch.setattr(worker_module, "READ_BLOCK_MS", 100)
+
+
+async def _run_until_finished(worker, client, job_id):
+    worker_task = asyncio.create_task(worker.run(client))
+    for _ in range(100):
+        job = await job_services.get_job(client, job_id=job_id)
+        assert job is not None
+        if job.finished:
+            break
+        await asyncio.sleep(0.05)
+
+    worker.stop()
+    await worker_task
+
+    return job
+
+
+async def test_worker_answers_job(test_cache, fake_llm):
+    state = AgentState(task="Should I learn Rust?", stage="task_delegation")
+    job = await job_services.create_job(test_cache.client, user_id="user", state=state)
+
+    job = await _run_until_finished(ChatJobWorker(name="test-worker"), test_cache.client, job.id)
+
+    assert job.status == "complete"
+    assert job.result is not None
+    assert job.result.task == "Should I learn Rust?"
+    assert await test_cache.client.exists("user-agent-state:1")
+    pending = await test_cache.client.xpending(job_services.JOB_STREAM, job_services.JOB_GROUP)
+    assert pending["pending"] == 0
+
+
+async def test_worker_records_failure(test_cache, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise ValueError("boom")
+
+    worker = ChatJobWorker(name="test-worker")
+    monkeypatch.setattr(worker, "_answer", fail)
+    state = AgentState(task="Should I learn Rust?", stage="task_delegation")
+    job = await job_services.create_job(test_cache.client, user_id="user", state=state)
+
+    job = await _run_until_finished(worker, test_cache.client, job.id)
+
+    assert job.status == "failed"
+    assert job.error is not None